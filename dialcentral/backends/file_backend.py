@@ -24,7 +24,25 @@ Filesystem backend for contact support
 from __future__ import with_statement
 
 import os
+import errno
 import csv
+import logging
+
+try:
+	import cPickle
+	pickle = cPickle
+except ImportError:
+	import pickle
+
+try:
+	import hashlib
+	_md5 = hashlib.md5
+except ImportError:
+	import md5
+	_md5 = md5.new
+
+
+_moduleLogger = logging.getLogger(__name__)
 
 
 def try_unicode(s):
@@ -34,6 +52,68 @@ def try_unicode(s):
 		return s
 
 
+class _SlotRecord(object):
+	"""
+	Read-only dict interface over __slots__, so a record costs a fraction of
+	a dict while still looking like the contact details other books return
+	"""
+
+	__slots__ = ()
+
+	def __getitem__(self, key):
+		try:
+			return getattr(self, key)
+		except AttributeError:
+			raise KeyError(key)
+
+	def get(self, key, default = None):
+		return getattr(self, key, default)
+
+	def __contains__(self, key):
+		return hasattr(self, key)
+
+	def keys(self):
+		return list(self.__slots__)
+
+	def iteritems(self):
+		for key in self.__slots__:
+			yield key, getattr(self, key)
+
+	def __getstate__(self):
+		return tuple(getattr(self, key) for key in self.__slots__)
+
+	def __setstate__(self, state):
+		for key, value in zip(self.__slots__, state):
+			setattr(self, key, value)
+
+	def __repr__(self):
+		return "%s(%s)" % (type(self).__name__, dict(self.iteritems()))
+
+
+class CsvNumber(_SlotRecord):
+	"""
+	>>> number = CsvNumber(u"Mobile", "555-1234")
+	>>> number["phoneNumber"], "phoneTypeName" in number
+	('555-1234', False)
+	"""
+
+	__slots__ = ("phoneType", "phoneNumber")
+
+	def __init__(self, phoneType, phoneNumber):
+		self.phoneType = phoneType
+		self.phoneNumber = phoneNumber
+
+
+class CsvContact(_SlotRecord):
+
+	__slots__ = ("contactId", "name", "numbers")
+
+	def __init__(self, contactId, name, numbers):
+		self.contactId = contactId
+		self.name = name
+		self.numbers = numbers
+
+
 class CsvAddressBook(object):
 	"""
 	Currently supported file format
@@ -41,77 +121,189 @@ class CsvAddressBook(object):
 	@li Escapes with quotes
 	@li Comma as delimiter
 	@li Column 0 is name, column 1 is number
+
+	The parsed contacts can be cached in a directory of the application's,
+	keyed by the CSV's path, size, mtime and inode
 	"""
 
-	def __init__(self, name, csvPath):
+	_CACHE_VERSION = 2
+
+	def __init__(self, name, csvPath, cacheDir = None):
+		"""
+		@param cacheDir Where to cache the parsed contacts, None to not cache them
+		"""
 		self._name = name
 		self._csvPath = csvPath
+		self._cacheDir = cacheDir
 		self._contacts = {}
+		self._fileKey = None
 
 	@property
 	def name(self):
 		return self._name
 
+	@property
+	def id(self):
+		return self._csvPath
+
+	@property
+	def path(self):
+		return self._csvPath
+
 	def update_account(self, force = True):
 		if not force or not self._contacts:
 			return
-		self._contacts = dict(
-			self._read_csv(self._csvPath)
-		)
+		self._load_contacts()
+
+	def reload(self):
+		"""
+		Pick up changes to the file, books that were never read stay unread
+		@returns If the contacts changed
+		"""
+		if self._fileKey is None:
+			return False
+		oldContacts = self._contacts
+		self._load_contacts()
+		return oldContacts is not self._contacts
 
 	def get_contacts(self):
 		"""
 		@returns Iterable of (contact id, contact name)
 		"""
 		if not self._contacts:
-			self._contacts = dict(
-				self._read_csv(self._csvPath)
-			)
+			self._load_contacts()
 		return self._contacts
 
+	@property
+	def _cachePath(self):
+		# Don't write into the user's contacts folder
+		path = os.path.abspath(self._csvPath)
+		if isinstance(path, unicode):
+			path = path.encode("UTF-8")
+		pathHash = _md5(path).hexdigest()
+		return os.path.join(self._cacheDir, "%s.cache" % pathHash)
+
+	def _load_contacts(self):
+		fileKey = self._get_file_key()
+		if fileKey is None:
+			self._contacts = {}
+			self._fileKey = None
+			return
+		if fileKey == self._fileKey:
+			return
+
+		contacts = self._load_cache(fileKey)
+		if contacts is None:
+			_moduleLogger.info("Parsing %r" % self._csvPath)
+			contacts = self._read_csv(self._csvPath)
+			self._save_cache(fileKey, contacts)
+		self._contacts = contacts
+		self._fileKey = fileKey
+
+	def _get_file_key(self):
+		try:
+			stat = os.stat(self._csvPath)
+		except OSError, e:
+			if e.errno == errno.ENOENT:
+				return None
+			raise
+		return (os.path.abspath(self._csvPath), stat.st_size, stat.st_mtime, stat.st_ino)
+
+	def _load_cache(self, fileKey):
+		if self._cacheDir is None:
+			return None
+		try:
+			f = open(self._cachePath, "rb")
+		except IOError, e:
+			if e.errno != errno.ENOENT:
+				_moduleLogger.exception("Could not open %r" % self._cachePath)
+			return None
+
+		try:
+			try:
+				version, cachedKey, contacts = pickle.load(f)
+			except Exception:
+				_moduleLogger.exception("Ignoring corrupt cache %r" % self._cachePath)
+				return None
+		finally:
+			f.close()
+
+		if version != self._CACHE_VERSION or cachedKey != fileKey:
+			return None
+		return contacts
+
+	def _save_cache(self, fileKey, contacts):
+		if self._cacheDir is None:
+			return
+		tempPath = "%s.tmp" % self._cachePath
+		try:
+			if not os.path.isdir(self._cacheDir):
+				os.makedirs(self._cacheDir)
+			f = open(tempPath, "wb")
+			try:
+				pickle.dump((self._CACHE_VERSION, fileKey, contacts), f, pickle.HIGHEST_PROTOCOL)
+			finally:
+				f.close()
+			os.rename(tempPath, self._cachePath)
+		except (IOError, OSError):
+			_moduleLogger.exception("Could not write %r" % self._cachePath)
+
 	def _read_csv(self, csvPath):
+		"""
+		Rows become records as they are read, nothing else is kept per row
+		@returns Dictionary of contact id to CsvContact
+		"""
 		try:
 			f = open(csvPath, "rU")
-			csvReader = iter(csv.reader(f))
 		except IOError, e:
-			if e.errno == 2:
-				return
+			if e.errno == errno.ENOENT:
+				return {}
 			raise
 
-		header = csvReader.next()
-		nameColumns, nameFallbacks, phoneColumns = self._guess_columns(header)
+		contacts = {}
+		try:
+			csvReader = iter(csv.reader(f))
+			try:
+				header = csvReader.next()
+			except StopIteration:
+				return contacts
+			nameColumns, nameFallbacks, phoneColumns = self._guess_columns(header)
+			# Share one phone type string per column rather than one per row
+			phoneColumns = [
+				(try_unicode(phoneType), phoneColumn)
+				for (phoneType, phoneColumn) in phoneColumns
+			]
 
-		yieldCount = 0
-		for row in csvReader:
-			contactDetails = []
-			for (phoneType, phoneColumn) in phoneColumns:
-				try:
-					if len(row[phoneColumn]) == 0:
-						continue
-					contactDetails.append({
-						"phoneType": try_unicode(phoneType),
-						"phoneNumber": row[phoneColumn],
-					})
-				except IndexError:
-					pass
-			if 0 < len(contactDetails):
-				nameParts = (row[i].strip() for i in nameColumns)
-				nameParts = (part for part in nameParts if part)
-				fullName = " ".join(nameParts).strip()
-				if not fullName:
-					for fallbackColumn in nameFallbacks:
-						if row[fallbackColumn].strip():
-							fullName = row[fallbackColumn].strip()
-							break
-					else:
-						fullName = "Unknown"
-				fullName = try_unicode(fullName)
-				yield str(yieldCount), {
-					"contactId": "%s-%d" % (self._name, yieldCount),
-					"name": fullName,
-					"numbers": contactDetails,
-				}
-				yieldCount += 1
+			for row in csvReader:
+				contactDetails = []
+				for (phoneType, phoneColumn) in phoneColumns:
+					try:
+						if len(row[phoneColumn]) == 0:
+							continue
+						contactDetails.append(CsvNumber(phoneType, row[phoneColumn]))
+					except IndexError:
+						pass
+				if 0 < len(contactDetails):
+					nameParts = (row[i].strip() for i in nameColumns)
+					nameParts = (part for part in nameParts if part)
+					fullName = " ".join(nameParts).strip()
+					if not fullName:
+						for fallbackColumn in nameFallbacks:
+							if row[fallbackColumn].strip():
+								fullName = row[fallbackColumn].strip()
+								break
+						else:
+							fullName = "Unknown"
+					fullName = try_unicode(fullName)
+					contactCount = len(contacts)
+					contacts[str(contactCount)] = CsvContact(
+						"%s-%d" % (self._name, contactCount),
+						fullName,
+						tuple(contactDetails),
+					)
+		finally:
+			f.close()
+		return contacts
 
 	@classmethod
 	def _guess_columns(cls, row):
@@ -158,11 +350,40 @@ class FilesystemAddressBookFactory(object):
 		"csv": CsvAddressBook,
 	}
 
-	def __init__(self, path):
+	def __init__(self, path, cacheDir = None):
+		"""
+		@param cacheDir Where books cache their parsed contacts
+		"""
 		self._path = path
+		self._cacheDir = cacheDir
+		self._books = {}
+		self._directories = []
+		self._isWatched = False
+
+	def set_watched(self, isWatched):
+		"""
+		@param isWatched When set, something else calls rescan when the
+			directory changes so get_addressbooks doesn't have to walk it
+		"""
+		self._isWatched = isWatched
 
 	def get_addressbooks(self):
+		if not self._isWatched:
+			self.rescan()
+		return [self._books[path] for path in sorted(self._books.iterkeys())]
+
+	def get_directories(self):
+		return self._directories
+
+	def rescan(self):
+		"""
+		Books that are still present are kept, along with their contacts
+		@returns (added paths, removed paths)
+		"""
+		books = {}
+		directories = []
 		for root, dirs, filenames in os.walk(self._path):
+			directories.append(root)
 			for filename in filenames:
 				try:
 					name, ext = filename.rsplit(".", 1)
@@ -173,4 +394,23 @@ class FilesystemAddressBookFactory(object):
 					cls = self.FILETYPE_SUPPORT[ext]
 				except KeyError:
 					continue
-				yield cls(name, os.path.join(root, filename))
+				path = os.path.join(root, filename)
+				book = self._books.get(path)
+				if book is None:
+					book = cls(name, path, self._cacheDir)
+				books[path] = book
+
+		added = [path for path in books if path not in self._books]
+		removed = [path for path in self._books if path not in books]
+		self._books = books
+		self._directories = directories
+		return added, removed
+
+	def reload(self, path):
+		"""
+		@returns The book at path if its contacts changed, otherwise None
+		"""
+		book = self._books.get(path)
+		if book is None or not book.reload():
+			return None
+		return book
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+
+from __future__ import with_statement
+from __future__ import division
+
+import logging
+
+import util.qt_compat as qt_compat
+QtCore = qt_compat.QtCore
+
+import util.misc as misc_utils
+
+
+_moduleLogger = logging.getLogger(__name__)
+
+
+class FilesystemAddressBookWatcher(QtCore.QObject):
+	"""
+	Keeps a FilesystemAddressBookFactory's books and their contacts current.
+
+	QFileSystemWatcher is backed by inotify on Linux.  Any path it can't
+	watch (no inotify, out of watches) is covered by polling instead
+	"""
+
+	addressbooksChanged = qt_compat.Signal()
+	contactsChanged = qt_compat.Signal(str)
+
+	# A single save can fire several events
+	_SETTLE_DELAY = 500
+	_POLL_INTERVAL = 30 * 1000
+
+	def __init__(self, factory):
+		QtCore.QObject.__init__(self)
+		self._factory = factory
+		self._rescanNeeded = False
+		self._dirtyPaths = set()
+
+		self._watcher = QtCore.QFileSystemWatcher()
+		self._watcher.directoryChanged.connect(self._on_directory_changed)
+		self._watcher.fileChanged.connect(self._on_file_changed)
+
+		self._settleTimer = QtCore.QTimer()
+		self._settleTimer.setInterval(self._SETTLE_DELAY)
+		self._settleTimer.setSingleShot(True)
+		self._settleTimer.timeout.connect(self._on_settled)
+
+		self._pollTimer = QtCore.QTimer()
+		self._pollTimer.setInterval(self._POLL_INTERVAL)
+		self._pollTimer.timeout.connect(self._on_poll)
+
+		self._factory.rescan()
+		self._factory.set_watched(True)
+		self._update_watches()
+
+	@property
+	def isPolling(self):
+		return self._pollTimer.isActive()
+
+	def stop(self):
+		self._settleTimer.stop()
+		self._pollTimer.stop()
+		self._remove_paths(self._watched_paths())
+		self._factory.set_watched(False)
+
+	def _watched_paths(self):
+		watched = set(unicode(path) for path in self._watcher.files())
+		watched.update(unicode(path) for path in self._watcher.directories())
+		return watched
+
+	def _remove_paths(self, paths):
+		for path in paths:
+			self._watcher.removePath(path)
+
+	def _update_watches(self):
+		wanted = set(unicode(path) for path in self._factory.get_directories())
+		wanted.update(unicode(book.path) for book in self._factory.get_addressbooks())
+		watched = self._watched_paths()
+
+		self._remove_paths(watched - wanted)
+		for path in wanted - watched:
+			self._watcher.addPath(path)
+
+		unwatched = wanted - self._watched_paths()
+		if unwatched:
+			if not self._pollTimer.isActive():
+				_moduleLogger.info("Polling %d unwatchable paths" % len(unwatched))
+				self._pollTimer.start()
+		else:
+			self._pollTimer.stop()
+
+	def _process_changes(self):
+		if self._rescanNeeded:
+			added, removed = self._factory.rescan()
+			booksChanged = bool(added or removed)
+		else:
+			booksChanged = False
+		self._rescanNeeded = False
+
+		changedBooks = []
+		for path in self._dirtyPaths:
+			book = self._factory.reload(path)
+			if book is not None:
+				changedBooks.append(book)
+		self._dirtyPaths.clear()
+
+		# Editors that save by rename drop our watch on the file
+		self._update_watches()
+
+		if booksChanged:
+			self.addressbooksChanged.emit()
+		for book in changedBooks:
+			self.contactsChanged.emit(book.id)
+
+	@qt_compat.Slot(str)
+	@misc_utils.log_exception(_moduleLogger)
+	def _on_directory_changed(self, path):
+		self._rescanNeeded = True
+		self._settleTimer.start()
+
+	@qt_compat.Slot(str)
+	@misc_utils.log_exception(_moduleLogger)
+	def _on_file_changed(self, path):
+		self._dirtyPaths.add(unicode(path))
+		self._settleTimer.start()
+
+	@qt_compat.Slot()
+	@misc_utils.log_exception(_moduleLogger)
+	def _on_settled(self):
+		self._process_changes()
+
+	@qt_compat.Slot()
+	@misc_utils.log_exception(_moduleLogger)
+	def _on_poll(self):
+		self._rescanNeeded = True
+		self._dirtyPaths.update(book.path for book in self._factory.get_addressbooks())
+		self._process_changes()
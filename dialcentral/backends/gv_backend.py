@@ -29,10 +29,13 @@ from __future__ import with_statement
 
 import itertools
 import logging
+import threading
+import time
 
 from gvoice import gvoice
 
 from dialcentral.util import io as io_utils
+from dialcentral.util import concurrent
 
 
 _moduleLogger = logging.getLogger(__name__)
@@ -49,13 +52,31 @@ class GVDialer(object):
 	HISTORY_PLACED = "Placed"
 	HISTORY_ALL = "All"
 
+	_MAX_PARALLEL_FETCHES = 3
+
+	# Keys into the unread counts for the feeds they summarize
+	_UNREAD_KEYS = {
+		MESSAGE_VOICEMAILS: "voicemail",
+		MESSAGE_TEXTS: "sms",
+	}
+	# Unread counts miss things like messages sent from elsewhere, so don't
+	# trust them forever
+	_MAX_UNREAD_TRUST = 30 * 60
+
 	def __init__(self, cookieFile = None):
 		self._gvoice = gvoice.GVoiceBackend(cookieFile)
+		# Refreshes can run on several workers at once.  The lock only covers
+		# the cached feeds and counters, requests are made without it
+		self._lock = threading.Lock()
 		self._texts = []
 		self._voicemails = []
 		self._received = []
 		self._missed = []
 		self._placed = []
+		self._syncedUnread = {}
+		self._performedFetches = 0
+		self._avoidedFetches = 0
+		self._textsSent = 0
 
 	def is_quick_login_possible(self):
 		"""
@@ -74,11 +95,13 @@ class GVDialer(object):
 		return self._gvoice.login(username, password)
 
 	def logout(self):
-		self._texts = []
-		self._voicemails = []
-		self._received = []
-		self._missed = []
-		self._placed = []
+		with self._lock:
+			self._texts = []
+			self._voicemails = []
+			self._received = []
+			self._missed = []
+			self._placed = []
+			self._syncedUnread = {}
 		return self._gvoice.logout()
 
 	def persist(self):
@@ -105,6 +128,10 @@ class GVDialer(object):
 
 	def send_sms(self, phoneNumbers, message):
 		self._gvoice.send_sms(phoneNumbers, message)
+		# Sending doesn't change the unread count
+		with self._lock:
+			self._syncedUnread.pop(self.MESSAGE_TEXTS, None)
+			self._textsSent += 1
 
 	def search(self, query):
 		"""
@@ -116,14 +143,14 @@ class GVDialer(object):
 	def get_feed(self, feed):
 		return self._gvoice.get_feed(feed)
 
-	def download(self, messageId, targetPath):
+	def download(self, messageId, targetPath, on_progress = None):
 		"""
 		Download a voicemail or recorded call MP3 matching the given ``msg``
 		which can either be a ``Message`` instance, or a SHA1 identifier. 
 		Message hashes can be found in ``self.voicemail().messages`` for example. 
 		Returns location of saved file.
 		"""
-		self._gvoice.download(messageId, targetPath)
+		return self._gvoice.download(messageId, targetPath, on_progress)
 
 	def is_valid_syntax(self, number):
 		"""
@@ -169,21 +196,29 @@ class GVDialer(object):
 		"""
 		@returns Iterable of (personsName, phoneNumber, exact date, relative date, action)
 		"""
-		if historyType in [self.HISTORY_RECEIVED, self.HISTORY_ALL] or not self._received:
-			self._received = list(self._gvoice.get_received_calls())
-			for item in self._received:
-				item["action"] = self.HISTORY_RECEIVED
-		if historyType in [self.HISTORY_MISSED, self.HISTORY_ALL] or not self._missed:
-			self._missed = list(self._gvoice.get_missed_calls())
-			for item in self._missed:
-				item["action"] = self.HISTORY_MISSED
-		if historyType in [self.HISTORY_PLACED, self.HISTORY_ALL] or not self._placed:
-			self._placed = list(self._gvoice.get_placed_calls())
-			for item in self._placed:
-				item["action"] = self.HISTORY_PLACED
-		received = self._received
-		missed = self._missed
-		placed = self._placed
+		fetches = []
+		with self._lock:
+			if historyType in [self.HISTORY_RECEIVED, self.HISTORY_ALL] or not self._received:
+				fetches.append((self.HISTORY_RECEIVED, self._gvoice.get_received_calls))
+			if historyType in [self.HISTORY_MISSED, self.HISTORY_ALL] or not self._missed:
+				fetches.append((self.HISTORY_MISSED, self._gvoice.get_missed_calls))
+			if historyType in [self.HISTORY_PLACED, self.HISTORY_ALL] or not self._placed:
+				fetches.append((self.HISTORY_PLACED, self._gvoice.get_placed_calls))
+		fetched = self._fetch_parallel(fetches)
+		for action, items in fetched.iteritems():
+			for item in items:
+				item["action"] = action
+
+		with self._lock:
+			if self.HISTORY_RECEIVED in fetched:
+				self._received = fetched[self.HISTORY_RECEIVED]
+			if self.HISTORY_MISSED in fetched:
+				self._missed = fetched[self.HISTORY_MISSED]
+			if self.HISTORY_PLACED in fetched:
+				self._placed = fetched[self.HISTORY_PLACED]
+			received = self._received
+			missed = self._missed
+			placed = self._placed
 		for item in received:
 			yield item
 		for item in missed:
@@ -191,18 +226,60 @@ class GVDialer(object):
 		for item in placed:
 			yield item
 
-	def get_messages(self, messageType):
-		messages = list(self._get_messages(messageType))
+	def get_messages(self, messageType, force = True):
+		"""
+		@param force When not set, feeds whose unread count hasn't changed
+			since they were last fetched are served from what we already have.
+			When set, every feed is fetched without probing the unread counts
+		"""
+		messages = list(self._get_messages(messageType, force))
 		messages.sort(key=lambda message: message["time"])
 		return messages
 
-	def _get_messages(self, messageType):
-		if messageType in [self.MESSAGE_VOICEMAILS, self.MESSAGE_ALL] or not self._voicemails:
-			self._voicemails = list(self._gvoice.get_voicemails())
-		if messageType in [self.MESSAGE_TEXTS, self.MESSAGE_ALL] or not self._texts:
-			self._texts = list(self._gvoice.get_texts())
-		voicemails = self._voicemails
-		smss = self._texts
+	def get_fetch_stats(self):
+		"""
+		@returns (message feeds fetched, message feed fetches avoided by the unread probe)
+		"""
+		with self._lock:
+			return self._performedFetches, self._avoidedFetches
+
+	def _get_messages(self, messageType, force):
+		fetches = []
+		with self._lock:
+			if messageType in [self.MESSAGE_VOICEMAILS, self.MESSAGE_ALL] or not self._voicemails:
+				fetches.append((self.MESSAGE_VOICEMAILS, self._gvoice.get_voicemails))
+			if messageType in [self.MESSAGE_TEXTS, self.MESSAGE_ALL] or not self._texts:
+				fetches.append((self.MESSAGE_TEXTS, self._gvoice.get_texts))
+			textsSent = self._textsSent
+		if force:
+			# Everything gets fetched anyway, so the probe would be a wasted round trip
+			unreadCounts = None
+		else:
+			unreadCounts = self._probe_unread_counts()
+			with self._lock:
+				fetches = [
+					(key, getter)
+					for (key, getter) in fetches
+					if self._is_feed_stale(key, unreadCounts)
+				]
+		fetched = self._fetch_parallel(fetches)
+
+		with self._lock:
+			self._performedFetches += len(fetched)
+			if unreadCounts is not None:
+				now = time.time()
+				for key in fetched:
+					if key == self.MESSAGE_TEXTS and textsSent != self._textsSent:
+						# The feed may predate a text sent while it was fetched
+						continue
+					self._syncedUnread[key] = unreadCounts.get(self._UNREAD_KEYS[key]), now
+
+			if self.MESSAGE_VOICEMAILS in fetched:
+				self._voicemails = fetched[self.MESSAGE_VOICEMAILS]
+			if self.MESSAGE_TEXTS in fetched:
+				self._texts = fetched[self.MESSAGE_TEXTS]
+			voicemails = self._voicemails
+			smss = self._texts
 
 		conversations = itertools.chain(voicemails, smss)
 		for conversation in conversations:
@@ -230,6 +307,53 @@ class GVDialer(object):
 			}
 			yield messageDetails
 
+	def _probe_unread_counts(self):
+		"""
+		@returns The unread counts or None if they aren't available
+		"""
+		try:
+			return self._gvoice.get_unread_counts()
+		except Exception:
+			_moduleLogger.exception("Unread probe failed, fetching feeds unconditionally")
+			return None
+
+	def _is_feed_stale(self, key, unreadCounts):
+		"""
+		@note Expects the lock to be held
+		"""
+		if unreadCounts is None:
+			return True
+		cached = self._voicemails if key == self.MESSAGE_VOICEMAILS else self._texts
+		if not cached or key not in self._syncedUnread:
+			return True
+		syncedCount, syncedTime = self._syncedUnread[key]
+		if self._MAX_UNREAD_TRUST < time.time() - syncedTime:
+			return True
+		if unreadCounts.get(self._UNREAD_KEYS[key]) != syncedCount:
+			return True
+		_moduleLogger.debug("Unread count unchanged, skipping %s feed" % key)
+		self._avoidedFetches += 1
+		return False
+
+	def _fetch_parallel(self, fetches):
+		"""
+		Issue independent feed requests at the same time so a refresh costs
+		about one round trip
+		@param fetches Sequence of (key, feed getter)
+		@returns Dictionary mapping each key to the list its getter produced
+		"""
+		results = concurrent.run_parallel(
+			(
+				(lambda getter: list(getter()), (getter, ), {})
+				for (key, getter) in fetches
+			),
+			self._MAX_PARALLEL_FETCHES,
+		)
+		return dict(
+			(key, result)
+			for ((key, getter), result) in zip(fetches, results)
+		)
+
 	def clear_caches(self):
 		pass
 
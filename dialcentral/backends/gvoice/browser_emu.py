@@ -9,7 +9,9 @@ Objects of the MozillaEmulator class can emulate a browser that is capable of:
 	- configurable user agent string
 	- GET and POST
 	- multipart POST (send files)
-	- receive content into file
+	- receive content into file (streamed, resumable)
+	- keep-alive connections, pooled per host
+	- gzip/deflate compressed transfers
 
 I have seen many requests on the python mailing list about how to emulate a browser. I'm using this class for years now, without any problems. This is how you can use it:
 
@@ -25,9 +27,18 @@ Optional steps:
 	- The "encode_multipart_formdata" function can be used alone to create POST data from a list of field values and files
 """
 
+from __future__ import with_statement
+
+import os
+import urllib
 import urllib2
+import httplib
 import cookielib
 import logging
+import threading
+import time
+import StringIO
+import zlib
 
 import socket
 
@@ -45,9 +56,243 @@ def add_proxy(protocol, url, port):
 	urllib2.install_opener(opener)
 
 
+class ConnectionPool(object):
+	"""
+	Keeps idle HTTP(S) connections around for reuse, limiting how many
+	connections may be open to any one host at a time
+	"""
+
+	def __init__(self, maxPerHost = 4, acquireTimeout = 60):
+		"""
+		@param acquireTimeout Seconds to wait for a host's connection to free up
+		"""
+		self._maxPerHost = maxPerHost
+		self._acquireTimeout = acquireTimeout
+		self._lock = threading.Lock()
+		self._released = threading.Condition(self._lock)
+		self._idle = {}
+		self._inUse = {}
+
+	def acquire(self, key, factory, allowIdle = True):
+		"""
+		@param allowIdle When not set, always open a new connection
+		@returns (connection, whether the connection is being reused)
+		@throws urllib2.URLError if no connection freed up in time
+		"""
+		deadline = time.time() + self._acquireTimeout
+		self._lock.acquire()
+		try:
+			while True:
+				idle = self._idle.get(key, [])
+				if idle and allowIdle:
+					self._inUse[key] = self._inUse.get(key, 0) + 1
+					return idle.pop(), True
+				if self._inUse.get(key, 0) < self._maxPerHost:
+					self._inUse[key] = self._inUse.get(key, 0) + 1
+					break
+				remaining = deadline - time.time()
+				if remaining <= 0:
+					raise urllib2.URLError("Timed out waiting for a connection to %s" % (key, ))
+				self._released.wait(remaining)
+		finally:
+			self._lock.release()
+
+		try:
+			return factory(), False
+		except:
+			self.release(key, None, False)
+			raise
+
+	def release(self, key, connection, isReusable):
+		if connection is not None and not isReusable:
+			connection.close()
+		self._lock.acquire()
+		try:
+			self._inUse[key] -= 1
+			if connection is not None and isReusable:
+				self._idle.setdefault(key, []).append(connection)
+			# Waiters for every host share the condition
+			self._released.notify_all()
+		finally:
+			self._lock.release()
+
+	def close_all(self):
+		self._lock.acquire()
+		try:
+			idle = self._idle
+			self._idle = {}
+		finally:
+			self._lock.release()
+		for connections in idle.itervalues():
+			for connection in connections:
+				connection.close()
+
+
+class _PooledResponseFile(object):
+	"""
+	File-like wrapper that hands the connection back to the pool once the
+	response body has been fully consumed (or dropped)
+	"""
+
+	_CHUNK_SIZE = 8 * 1024
+
+	def __init__(self, response, on_done):
+		self._response = response
+		self._on_done = on_done
+		self._buffer = ""
+
+	def read(self, amt = None):
+		if amt is None:
+			data = self._buffer + self._read_raw(None)
+			self._buffer = ""
+			return data
+
+		if not self._buffer:
+			return self._read_raw(amt)
+		data, self._buffer = self._buffer[:amt], self._buffer[amt:]
+		return data
+
+	def readline(self):
+		while "\n" not in self._buffer:
+			chunk = self._read_raw(self._CHUNK_SIZE)
+			if not chunk:
+				break
+			self._buffer += chunk
+		lineEnd = self._buffer.find("\n") + 1
+		if lineEnd == 0:
+			lineEnd = len(self._buffer)
+		line, self._buffer = self._buffer[:lineEnd], self._buffer[lineEnd:]
+		return line
+
+	def readlines(self, sizehint = None):
+		return self.read().splitlines(True)
+
+	def close(self):
+		self._finish()
+
+	def _read_raw(self, amt):
+		if self._response is None:
+			return ""
+		try:
+			if amt is None:
+				data = self._response.read()
+			else:
+				data = self._response.read(amt)
+		except:
+			# Whatever is left of the body can't be trusted, don't pool it
+			self._finish(False)
+			raise
+		if amt is None or not data:
+			self._finish()
+		return data
+
+	def _finish(self, isReusable = True):
+		response, self._response = self._response, None
+		if response is None:
+			return
+		isReusable = isReusable and response.isclosed() and not response.will_close
+		if not isReusable:
+			response.close()
+		self._on_done(isReusable)
+
+
+class _KeepAliveHandlerMixin(object):
+
+	_IDEMPOTENT_METHODS = frozenset(("GET", "HEAD"))
+
+	def _keepalive_open(self, connectionClass, req):
+		host = req.get_host()
+		if not host:
+			raise urllib2.URLError('no host given')
+		tunnelHost = getattr(req, "_tunnel_host", None)
+		key = (connectionClass, host, tunnelHost)
+
+		headers = dict(req.unredirected_hdrs)
+		headers.update(dict(
+			(k, v) for k, v in req.headers.items()
+			if k not in headers
+		))
+		headers["Connection"] = "keep-alive"
+		headers = dict(
+			(name.title(), val) for name, val in headers.items()
+		)
+		if tunnelHost:
+			tunnelHeaders = {}
+			proxyAuthHeader = "Proxy-Authorization"
+			if proxyAuthHeader in headers:
+				tunnelHeaders[proxyAuthHeader] = headers[proxyAuthHeader]
+				del headers[proxyAuthHeader]
+
+		def create_connection():
+			connection = connectionClass(
+				host, timeout = getattr(req, "timeout", socket._GLOBAL_DEFAULT_TIMEOUT)
+			)
+			connection.set_debuglevel(self._debuglevel)
+			if tunnelHost:
+				connection.set_tunnel(tunnelHost, headers = tunnelHeaders)
+			return connection
+
+		# An idle connection may have gone stale, and a request that failed on
+		# one may still have reached the server.  Only requests that are safe
+		# to send twice use them, everything else (sending texts, placing
+		# calls) gets a fresh connection and is never retried
+		allowIdle = req.get_method() in self._IDEMPOTENT_METHODS
+		while True:
+			connection, isReused = self._pool.acquire(key, create_connection, allowIdle)
+			try:
+				connection.request(req.get_method(), req.get_selector(), req.data, headers)
+				response = connection.getresponse()
+			except (socket.error, httplib.HTTPException), e:
+				self._pool.release(key, connection, False)
+				if isReused:
+					# The server most likely timed out the idle connection,
+					# retry once on a new one
+					_moduleLogger.debug("Stale connection to %s, reconnecting" % host)
+					allowIdle = False
+					continue
+				raise urllib2.URLError(e)
+			break
+
+		def on_done(isReusable):
+			self._pool.release(key, connection, isReusable)
+
+		fp = _PooledResponseFile(response, on_done)
+		if not (200 <= response.status < 300):
+			# Error and redirect bodies are small and the handlers that
+			# consume them don't reliably close them, so free up the
+			# connection right away
+			fp = StringIO.StringIO(fp.read())
+		resp = urllib.addinfourl(fp, response.msg, req.get_full_url())
+		resp.code = response.status
+		resp.msg = response.reason
+		return resp
+
+
+class KeepAliveHTTPHandler(_KeepAliveHandlerMixin, urllib2.HTTPHandler):
+
+	def __init__(self, pool, debuglevel = 0):
+		urllib2.HTTPHandler.__init__(self, debuglevel)
+		self._pool = pool
+
+	def http_open(self, req):
+		return self._keepalive_open(httplib.HTTPConnection, req)
+
+
+class KeepAliveHTTPSHandler(_KeepAliveHandlerMixin, urllib2.HTTPSHandler):
+
+	def __init__(self, pool, debuglevel = 0):
+		urllib2.HTTPSHandler.__init__(self, debuglevel)
+		self._pool = pool
+
+	def https_open(self, req):
+		return self._keepalive_open(httplib.HTTPSConnection, req)
+
+
 class MozillaEmulator(object):
 
 	USER_AGENT = 'Mozilla/5.0 (Windows; U; Windows NT 5.1; de; rv:1.9.1.4) Gecko/20091016 Firefox/3.5.4 (.NET CLR 3.5.30729)'
+	_STREAM_CHUNK_SIZE = 16 * 1024
+
 	#USER_AGENT = "Mozilla/5.0 (iPhone; U; CPU iPhone OS 3_0 like Mac OS X; en-us) AppleWebKit/528.18 (KHTML, like Gecko) Version/4.0 Mobile/7A341 Safari/528.16"
 
 	def __init__(self, trycount = 1):
@@ -61,6 +306,11 @@ class MozillaEmulator(object):
 		self._cookies = cookielib.LWPCookieJar()
 		self._loadedFromCookies = False
 		self._storeCookies = False
+		self._pool = ConnectionPool()
+		self._openers = {}
+		self._statsLock = threading.Lock()
+		self._wireBytes = 0
+		self._decodedBytes = 0
 
 	def load_cookies(self, path):
 		assert not self._loadedFromCookies, "Load cookies only once"
@@ -90,6 +340,27 @@ class MozillaEmulator(object):
 		if self._storeCookies:
 			self._cookies.clear()
 
+	def close_connections(self):
+		self._pool.close_all()
+
+	def get_transfer_stats(self):
+		"""
+		@returns (bytes received over the wire, bytes after decompression)
+		"""
+		self._statsLock.acquire()
+		try:
+			return self._wireBytes, self._decodedBytes
+		finally:
+			self._statsLock.release()
+
+	def _record_transfer(self, wireBytes, decodedBytes):
+		self._statsLock.acquire()
+		try:
+			self._wireBytes += wireBytes
+			self._decodedBytes += decodedBytes
+		finally:
+			self._statsLock.release()
+
 	def download(self, url,
 			postdata = None, extraheaders = None, forbidRedirect = False,
 			trycount = None, only_head = False,
@@ -139,6 +410,70 @@ class MozillaEmulator(object):
 			# Retry :-)
 			_moduleLogger.debug("MozillaEmulator: urllib2.URLError, retrying %d" % cnt)
 
+	def download_to_file(self, url, targetPath,
+			extraheaders = None, trycount = None, resume = True, on_progress = None,
+		):
+		"""Stream an URL straight to disk in constant memory.
+
+		@param targetPath: File to write to.  If resume is set and the file
+			already has content, only the remainder is requested (HTTP Range)
+		@param on_progress: Called with (bytes in file, total bytes or None)
+			after every chunk
+
+		@return: The size of the completed file
+		"""
+		headers = {}
+		if extraheaders is not None:
+			headers.update(extraheaders)
+		# Compressed ranges can't be appended to a partial file
+		headers["Accept-Encoding"] = "identity"
+
+		offset = 0
+		if resume and os.path.exists(targetPath):
+			offset = os.path.getsize(targetPath)
+		if offset:
+			headers["Range"] = "bytes=%d-" % offset
+
+		try:
+			response = self.download(url, None, headers, False, trycount, only_head = True)
+		except urllib2.HTTPError, e:
+			if e.code == 416 and offset:
+				_moduleLogger.debug("%s was already fully downloaded" % url)
+				return offset
+			raise
+
+		try:
+			if response.code == 206:
+				mode = "ab"
+			else:
+				if offset:
+					_moduleLogger.debug("Server ignored range request, restarting %s" % url)
+				offset = 0
+				mode = "wb"
+			contentLength = response.info().get("Content-Length")
+			total = offset + int(contentLength) if contentLength is not None else None
+
+			written = offset
+			with open(targetPath, mode) as f:
+				while True:
+					chunk = response.read(self._STREAM_CHUNK_SIZE)
+					if not chunk:
+						break
+					f.write(chunk)
+					written += len(chunk)
+					self._record_transfer(len(chunk), len(chunk))
+					if on_progress is not None:
+						on_progress(written, total)
+		finally:
+			response.close()
+
+		if total is not None:
+			assert written == total, "The packet header promised %s of data but only was able to read %s of data" % (
+				total,
+				written,
+			)
+		return written
+
 	def _build_opener(self, url, postdata = None, extraheaders = None, forbidRedirect = False):
 		if extraheaders is None:
 			extraheaders = {}
@@ -147,21 +482,35 @@ class MozillaEmulator(object):
 			'Accept': 'text/xml,application/xml,application/xhtml+xml,text/html;q=0.9,text/plain;q=0.8,image/png',
 			'Accept-Language': 'en,en-us;q=0.5',
 			'Accept-Charset': 'ISO-8859-1,utf-8;q=0.7,*;q=0.7',
+			'Accept-Encoding': 'gzip, deflate',
 			'User-Agent': self.USER_AGENT,
 		}
 		for key, value in extraheaders.iteritems():
 			txheaders[key] = value
 		req = urllib2.Request(url, postdata, txheaders)
 		self._cookies.add_cookie_header(req)
+		u = self._get_opener(forbidRedirect)
+		if not postdata is None:
+			req.add_data(postdata)
+		return (req, u)
+
+	def _get_opener(self, forbidRedirect):
+		"""
+		Openers are reused so their handlers can share the connection pool
+		"""
+		openerKey = (bool(forbidRedirect), bool(self.debug))
+		try:
+			return self._openers[openerKey]
+		except KeyError:
+			pass
+
 		if forbidRedirect:
 			redirector = HTTPNoRedirector()
-			#_moduleLogger.info("Redirection disabled")
 		else:
 			redirector = urllib2.HTTPRedirectHandler()
-			#_moduleLogger.info("Redirection enabled")
 
-		http_handler = urllib2.HTTPHandler(debuglevel=self.debug)
-		https_handler = urllib2.HTTPSHandler(debuglevel=self.debug)
+		http_handler = KeepAliveHTTPHandler(self._pool, debuglevel=self.debug)
+		https_handler = KeepAliveHTTPSHandler(self._pool, debuglevel=self.debug)
 
 		u = urllib2.build_opener(
 			http_handler,
@@ -169,14 +518,17 @@ class MozillaEmulator(object):
 			urllib2.HTTPCookieProcessor(self._cookies),
 			redirector
 		)
-		if not postdata is None:
-			req.add_data(postdata)
-		return (req, u)
+		self._openers[openerKey] = u
+		return u
 
 	def _read(self, openerdirector, trycount):
 		chunks = []
 
-		chunk = openerdirector.read()
+		try:
+			chunk = openerdirector.read()
+		except:
+			openerdirector.close()
+			raise
 		chunks.append(chunk)
 		#while chunk and cnt < trycount:
 		#	time.sleep(1)
@@ -186,13 +538,46 @@ class MozillaEmulator(object):
 
 		data = "".join(chunks)
 
+		# Content-Length describes the encoded body, so check before decoding
 		if "Content-Length" in openerdirector.info():
 			assert len(data) == int(openerdirector.info()["Content-Length"]), "The packet header promised %s of data but only was able to read %s of data" % (
 				openerdirector.info()["Content-Length"],
 				len(data),
 			)
 
+		encoding = openerdirector.info().get("Content-Encoding", "identity")
+		decoded = decode_content(data, encoding)
+		self._record_transfer(len(data), len(decoded))
+		if len(data) != len(decoded):
+			_moduleLogger.debug("Decoded %s: %d bytes -> %d bytes" % (encoding, len(data), len(decoded)))
+
+		return decoded
+
+
+def decode_content(data, encoding):
+	"""
+	Undo a Content-Encoding
+
+	>>> decode_content("abc", "identity")
+	'abc'
+	>>> decode_content(zlib.compress("abc"), "deflate")
+	'abc'
+	>>> decode_content(zlib.compress("abc")[2:-4], "deflate")
+	'abc'
+	"""
+	encoding = encoding.strip().lower()
+	if encoding in ("gzip", "x-gzip"):
+		return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+	elif encoding == "deflate":
+		try:
+			return zlib.decompress(data)
+		except zlib.error:
+			# Some servers send a raw deflate stream without the zlib header
+			return zlib.decompress(data, -zlib.MAX_WBITS)
+	elif encoding in ("", "identity"):
 		return data
+	else:
+		raise urllib2.URLError("Unsupported Content-Encoding %r" % encoding)
 
 
 class HTTPNoRedirector(urllib2.HTTPRedirectHandler):
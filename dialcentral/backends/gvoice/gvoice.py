@@ -216,17 +216,26 @@ class GVoiceBackend(object):
 		self._galxRe = re.compile(r"""<input.*?name="GALX".*?value="(.*?)".*?/>""", re.MULTILINE | re.DOTALL)
 
 		self._seperateVoicemailsRegex = re.compile(r"""^\s*<div id="(\w+)"\s* class=".*?gc-message.*?">""", re.MULTILINE | re.DOTALL)
-		self._exactVoicemailTimeRegex = re.compile(r"""<span class="gc-message-time">(.*?)</span>""", re.MULTILINE)
-		self._relativeVoicemailTimeRegex = re.compile(r"""<span class="gc-message-relative">(.*?)</span>""", re.MULTILINE)
-		self._voicemailNameRegex = re.compile(r"""<a class=.*?gc-message-name-link.*?>(.*?)</a>""", re.MULTILINE | re.DOTALL)
-		self._voicemailNumberRegex = re.compile(r"""<input type="hidden" class="gc-text gc-quickcall-ac" value="(.*?)"/>""", re.MULTILINE)
-		self._prettyVoicemailNumberRegex = re.compile(r"""<span class="gc-message-type">(.*?)</span>""", re.MULTILINE)
-		self._voicemailLocationRegex = re.compile(r"""<span class="gc-message-location">.*?<a.*?>(.*?)</a></span>""", re.MULTILINE)
-		self._messagesContactIDRegex = re.compile(r"""<a class=".*?gc-message-name-link.*?">.*?</a>\s*?<span .*?>(.*?)</span>""", re.MULTILINE)
-		self._voicemailMessageRegex = re.compile(r"""(<span id="\d+-\d+" class="gc-word-(.*?)">(.*?)</span>|<a .*? class="gc-message-mni">(.*?)</a>)""", re.MULTILINE)
-		self._smsFromRegex = re.compile(r"""<span class="gc-message-sms-from">(.*?)</span>""", re.MULTILINE | re.DOTALL)
-		self._smsTimeRegex = re.compile(r"""<span class="gc-message-sms-time">(.*?)</span>""", re.MULTILINE | re.DOTALL)
-		self._smsTextRegex = re.compile(r"""<span class="gc-message-sms-text">(.*?)</span>""", re.MULTILINE | re.DOTALL)
+		# All of the per-message fields are pulled out of a message block in
+		# a single scan rather than searching the block once per field.  Each
+		# field is only peeked at, never consumed, so a field can't hide the
+		# ones inside or after it, just like separate searches
+		self._messageTokenRegex = re.compile(
+			r"""(?="""
+			r"""<span class="gc-message-time">(?P<time>[^\n]*?)</span>"""
+			r"""|<span class="gc-message-relative">(?P<relTime>[^\n]*?)</span>"""
+			r"""|<span class="gc-message-location">[^\n]*?<a[^\n]*?>(?P<location>[^\n]*?)</a></span>"""
+			r"""|<a class="[^"]*gc-message-name-link[^"]*"[^>]*>(?P<name>.*?)</a>(?:\s*?<span [^\n]*?>(?P<contactId>[^\n]*?)</span>)?"""
+			r"""|<input type="hidden" class="gc-text gc-quickcall-ac" value="(?P<number>[^\n]*?)"/>"""
+			r"""|<span class="gc-message-type">(?P<prettyNumber>[^\n]*?)</span>"""
+			r"""|<span id="\d+-\d+" class="gc-word-(?P<wordAccuracy>[^\n]*?)">(?P<word>[^\n]*?)</span>"""
+			r"""|<a [^>\n]*? class="gc-message-mni">(?P<mni>[^\n]*?)</a>"""
+			r"""|<span class="gc-message-sms-from">(?P<smsFrom>.*?)</span>"""
+			r"""|<span class="gc-message-sms-time">(?P<smsTime>.*?)</span>"""
+			r"""|<span class="gc-message-sms-text">(?P<smsText>.*?)</span>"""
+			r""")""",
+			re.DOTALL,
+		)
 
 	def is_quick_login_possible(self):
 		"""
@@ -300,8 +309,15 @@ class GVoiceBackend(object):
 	def persist(self):
 		self._browser.save_cookies()
 
+	def get_transfer_stats(self):
+		"""
+		@returns (bytes received over the wire, bytes after decompression)
+		"""
+		return self._browser.get_transfer_stats()
+
 	def shutdown(self):
 		self._browser.save_cookies()
+		self._browser.close_connections()
 		self._token = None
 		self._lastAuthed = 0.0
 
@@ -404,8 +420,7 @@ class GVoiceBackend(object):
 			self._XML_SEARCH_URL,
 			{"q": query},
 		)
-		json, html = extract_payload(page)
-		return json
+		return self._grab_json(page)
 
 	def get_feed(self, feed):
 		"""
@@ -415,25 +430,29 @@ class GVoiceBackend(object):
 		feedUrl = getattr(self, actualFeed)
 
 		page = self._get_page(feedUrl)
-		json, html = extract_payload(page)
-
-		return json
+		return self._grab_json(page)
 
 	def recording_url(self, messageId):
 		url = self._downloadVoicemailURL+messageId
 		return url
 
-	def download(self, messageId, targetPath):
+	def download(self, messageId, targetPath, on_progress = None):
 		"""
 		Download a voicemail or recorded call MP3 matching the given ``msg``
 		which can either be a ``Message`` instance, or a SHA1 identifier. 
 		Message hashes can be found in ``self.voicemail().messages`` for example. 
+		The recording is streamed to disk, resuming any partial targetPath.
+		@param on_progress Called with (bytes downloaded, total bytes or None)
 		@returns location of saved file.
 		@blocks
 		"""
-		page = self._get_page(self.recording_url(messageId))
-		with open(targetPath, 'wb') as fo:
-			fo.write(page)
+		url = self.recording_url(messageId)
+		try:
+			self._browser.download_to_file(url, targetPath, on_progress = on_progress)
+		except urllib2.URLError, e:
+			_moduleLogger.error("Translating error: %s" % str(e))
+			raise NetworkError("%s is not accesible" % url)
+		return targetPath
 
 	def is_valid_syntax(self, number):
 		"""
@@ -504,7 +523,7 @@ class GVoiceBackend(object):
 		"""
 		@blocks
 		"""
-		voicemailPage = self._get_page(self._XML_VOICEMAIL_URL)
+		voicemailPage = XmlEnvelope.wrap(self._get_page(self._XML_VOICEMAIL_URL))
 		voicemailHtml = self._grab_html(voicemailPage)
 		voicemailJson = self._grab_json(voicemailPage)
 		if voicemailJson is None:
@@ -517,7 +536,7 @@ class GVoiceBackend(object):
 		"""
 		@blocks
 		"""
-		smsPage = self._get_page(self._XML_SMS_URL)
+		smsPage = XmlEnvelope.wrap(self._get_page(self._XML_SMS_URL))
 		smsHtml = self._grab_html(smsPage)
 		smsJson = self._grab_json(smsPage)
 		if smsJson is None:
@@ -554,17 +573,16 @@ class GVoiceBackend(object):
 		markPage = self._get_page(self._archiveMessageURL, postData)
 
 	def _grab_json(self, flatXml):
-		xmlTree = ElementTree.fromstring(flatXml)
-		jsonElement = xmlTree.getchildren()[0]
-		flatJson = jsonElement.text
-		jsonTree = parse_json(flatJson)
-		return jsonTree
+		"""
+		@param flatXml Either the raw page or an already parsed XmlEnvelope
+		"""
+		return XmlEnvelope.wrap(flatXml).json
 
 	def _grab_html(self, flatXml):
-		xmlTree = ElementTree.fromstring(flatXml)
-		htmlElement = xmlTree.getchildren()[1]
-		flatHtml = htmlElement.text
-		return flatHtml
+		"""
+		@param flatXml Either the raw page or an already parsed XmlEnvelope
+		"""
+		return XmlEnvelope.wrap(flatXml).html
 
 	def _grab_account_info(self, page):
 		accountData = parse_json(page)
@@ -587,40 +605,74 @@ class GVoiceBackend(object):
 		for recentCallData in allRecentData:
 			yield recentCallData
 
+	def _scan_message(self, messageHtml):
+		"""
+		Walk a single gc-message block once, collecting every field of interest
+
+		For the single-valued fields, the first occurrence wins
+		"""
+		fields = {
+			"time": "",
+			"relTime": "",
+			"location": "",
+			"name": "",
+			"contactId": "",
+			"number": "",
+			"prettyNumber": "",
+		}
+		seenFields = set()
+		words = []
+		smsFroms = []
+		smsTimes = []
+		smsTexts = []
+		for token in self._messageTokenRegex.finditer(messageHtml):
+			kind = token.lastgroup
+			if kind == "contactId":
+				# contactId is only ever matched as a suffix of the name
+				kind = "name"
+			if kind == "word":
+				words.append(self._interpret_voicemail_word(token.group("wordAccuracy"), token.group("word"), None))
+			elif kind == "mni":
+				words.append(self._interpret_voicemail_word(None, None, token.group("mni")))
+			elif kind == "smsFrom":
+				smsFroms.append(token.group("smsFrom").strip())
+			elif kind == "smsTime":
+				smsTimes.append(token.group("smsTime").strip())
+			elif kind == "smsText":
+				smsTexts.append(token.group("smsText").strip())
+			elif kind == "name":
+				if "name" not in seenFields:
+					seenFields.add("name")
+					fields["name"] = token.group("name").strip()
+				contactId = token.group("contactId")
+				if contactId is not None and "contactId" not in seenFields:
+					seenFields.add("contactId")
+					fields["contactId"] = contactId.strip()
+			elif kind not in seenFields:
+				seenFields.add(kind)
+				fields[kind] = token.group(kind).strip()
+
+		fields["words"] = words
+		fields["smsParts"] = zip(smsFroms, smsTexts, smsTimes)
+		return fields
+
 	def _parse_history(self, historyHtml):
 		splitVoicemail = self._seperateVoicemailsRegex.split(historyHtml)
 		for messageId, messageHtml in itergroup(splitVoicemail[1:], 2):
-			exactTimeGroup = self._exactVoicemailTimeRegex.search(messageHtml)
-			exactTime = exactTimeGroup.group(1).strip() if exactTimeGroup else ""
-			exactTime = google_strptime(exactTime)
-			relativeTimeGroup = self._relativeVoicemailTimeRegex.search(messageHtml)
-			relativeTime = relativeTimeGroup.group(1).strip() if relativeTimeGroup else ""
-			locationGroup = self._voicemailLocationRegex.search(messageHtml)
-			location = locationGroup.group(1).strip() if locationGroup else ""
-
-			nameGroup = self._voicemailNameRegex.search(messageHtml)
-			name = nameGroup.group(1).strip() if nameGroup else ""
-			numberGroup = self._voicemailNumberRegex.search(messageHtml)
-			number = numberGroup.group(1).strip() if numberGroup else ""
-			prettyNumberGroup = self._prettyVoicemailNumberRegex.search(messageHtml)
-			prettyNumber = prettyNumberGroup.group(1).strip() if prettyNumberGroup else ""
-			contactIdGroup = self._messagesContactIDRegex.search(messageHtml)
-			contactId = contactIdGroup.group(1).strip() if contactIdGroup else ""
-
+			fields = self._scan_message(messageHtml)
 			yield {
 				"id": messageId.strip(),
-				"contactId": contactId,
-				"name": unescape(name),
-				"time": exactTime,
-				"relTime": relativeTime,
-				"prettyNumber": prettyNumber,
-				"number": number,
-				"location": unescape(location),
+				"contactId": fields["contactId"],
+				"name": unescape(fields["name"]),
+				"time": google_strptime(fields["time"]),
+				"relTime": fields["relTime"],
+				"prettyNumber": fields["prettyNumber"],
+				"number": fields["number"],
+				"location": unescape(fields["location"]),
 			}
 
 	@staticmethod
-	def _interpret_voicemail_regex(group):
-		quality, content, number = group.group(2), group.group(3), group.group(4)
+	def _interpret_voicemail_word(quality, content, number):
 		text = MessageText()
 		if quality is not None and content is not None:
 			text.accuracy = quality
@@ -634,34 +686,21 @@ class GVoiceBackend(object):
 	def _parse_voicemail(self, voicemailHtml):
 		splitVoicemail = self._seperateVoicemailsRegex.split(voicemailHtml)
 		for messageId, messageHtml in itergroup(splitVoicemail[1:], 2):
+			fields = self._scan_message(messageHtml)
+
 			conv = Conversation()
 			conv.type = Conversation.TYPE_VOICEMAIL
 			conv.id = messageId.strip()
+			conv.time = google_strptime(fields["time"])
+			conv.relTime = fields["relTime"]
+			conv.location = unescape(fields["location"])
+			conv.name = unescape(fields["name"])
+			conv.number = fields["number"]
+			conv.prettyNumber = fields["prettyNumber"]
+			conv.contactId = fields["contactId"]
 
-			exactTimeGroup = self._exactVoicemailTimeRegex.search(messageHtml)
-			exactTimeText = exactTimeGroup.group(1).strip() if exactTimeGroup else ""
-			conv.time = google_strptime(exactTimeText)
-			relativeTimeGroup = self._relativeVoicemailTimeRegex.search(messageHtml)
-			conv.relTime = relativeTimeGroup.group(1).strip() if relativeTimeGroup else ""
-			locationGroup = self._voicemailLocationRegex.search(messageHtml)
-			conv.location = unescape(locationGroup.group(1).strip() if locationGroup else "")
-
-			nameGroup = self._voicemailNameRegex.search(messageHtml)
-			conv.name = unescape(nameGroup.group(1).strip() if nameGroup else "")
-			numberGroup = self._voicemailNumberRegex.search(messageHtml)
-			conv.number = numberGroup.group(1).strip() if numberGroup else ""
-			prettyNumberGroup = self._prettyVoicemailNumberRegex.search(messageHtml)
-			conv.prettyNumber = prettyNumberGroup.group(1).strip() if prettyNumberGroup else ""
-			contactIdGroup = self._messagesContactIDRegex.search(messageHtml)
-			conv.contactId = contactIdGroup.group(1).strip() if contactIdGroup else ""
-
-			messageGroups = self._voicemailMessageRegex.finditer(messageHtml)
-			messageParts = [
-				self._interpret_voicemail_regex(group)
-				for group in messageGroups
-			] if messageGroups else ((MessageText.ACCURACY_LOW, "No Transcription"), )
 			message = Message()
-			message.body = messageParts
+			message.body = fields["words"]
 			message.whoFrom = conv.name
 			try:
 				message.when = conv.time.strftime("%I:%M %p")
@@ -688,36 +727,23 @@ class GVoiceBackend(object):
 	def _parse_sms(self, smsHtml):
 		splitSms = self._seperateVoicemailsRegex.split(smsHtml)
 		for messageId, messageHtml in itergroup(splitSms[1:], 2):
+			fields = self._scan_message(messageHtml)
+
 			conv = Conversation()
 			conv.type = Conversation.TYPE_SMS
 			conv.id = messageId.strip()
-
-			exactTimeGroup = self._exactVoicemailTimeRegex.search(messageHtml)
-			exactTimeText = exactTimeGroup.group(1).strip() if exactTimeGroup else ""
-			conv.time = google_strptime(exactTimeText)
-			relativeTimeGroup = self._relativeVoicemailTimeRegex.search(messageHtml)
-			conv.relTime = relativeTimeGroup.group(1).strip() if relativeTimeGroup else ""
+			conv.time = google_strptime(fields["time"])
+			conv.relTime = fields["relTime"]
 			conv.location = ""
+			conv.name = unescape(fields["name"])
+			conv.number = fields["number"]
+			conv.prettyNumber = fields["prettyNumber"]
+			conv.contactId = fields["contactId"]
 
-			nameGroup = self._voicemailNameRegex.search(messageHtml)
-			conv.name = unescape(nameGroup.group(1).strip() if nameGroup else "")
-			numberGroup = self._voicemailNumberRegex.search(messageHtml)
-			conv.number = numberGroup.group(1).strip() if numberGroup else ""
-			prettyNumberGroup = self._prettyVoicemailNumberRegex.search(messageHtml)
-			conv.prettyNumber = prettyNumberGroup.group(1).strip() if prettyNumberGroup else ""
-			contactIdGroup = self._messagesContactIDRegex.search(messageHtml)
-			conv.contactId = contactIdGroup.group(1).strip() if contactIdGroup else ""
-
-			fromGroups = self._smsFromRegex.finditer(messageHtml)
-			fromParts = (group.group(1).strip() for group in fromGroups)
-			textGroups = self._smsTextRegex.finditer(messageHtml)
-			textParts = (group.group(1).strip() for group in textGroups)
-			timeGroups = self._smsTimeRegex.finditer(messageHtml)
-			timeParts = (group.group(1).strip() for group in timeGroups)
-
-			messageParts = itertools.izip(fromParts, textParts, timeParts)
-			messages = [self._interpret_sms_message_parts(*parts) for parts in messageParts]
-			conv.messages = messages
+			conv.messages = [
+				self._interpret_sms_message_parts(*parts)
+				for parts in fields["smsParts"]
+			]
 
 			yield conv
 
@@ -875,17 +901,50 @@ else:
 	parse_json = _actual_parse_json
 
 
-def extract_payload(flatXml):
-	xmlTree = ElementTree.fromstring(flatXml)
+class XmlEnvelope(object):
+	"""
+	The XML feeds wrap a JSON payload and an HTML payload in a single
+	document.  Parse the document once and only decode the pieces that get
+	asked for.
+
+	>>> envelope = XmlEnvelope('<response><json><![CDATA[{"a": 1}]]></json><html><![CDATA[<div/>]]></html></response>')
+	>>> envelope.json
+	{u'a': 1}
+	>>> envelope.html
+	'<div/>'
+	>>> XmlEnvelope.wrap(envelope) is envelope
+	True
+	"""
+
+	_JSON_INDEX = 0
+	_HTML_INDEX = 1
 
-	jsonElement = xmlTree.getchildren()[0]
-	flatJson = jsonElement.text
-	jsonTree = parse_json(flatJson)
+	def __init__(self, flatXml):
+		self._elements = ElementTree.fromstring(flatXml).getchildren()
+		self._json = None
+		self._isJsonParsed = False
 
-	htmlElement = xmlTree.getchildren()[1]
-	flatHtml = htmlElement.text
+	@classmethod
+	def wrap(cls, flatXml):
+		if isinstance(flatXml, cls):
+			return flatXml
+		return cls(flatXml)
 
-	return jsonTree, flatHtml
+	@property
+	def json(self):
+		if not self._isJsonParsed:
+			self._json = parse_json(self._elements[self._JSON_INDEX].text)
+			self._isJsonParsed = True
+		return self._json
+
+	@property
+	def html(self):
+		return self._elements[self._HTML_INDEX].text
+
+
+def extract_payload(flatXml):
+	envelope = XmlEnvelope.wrap(flatXml)
+	return envelope.json, envelope.html
 
 
 def guess_phone_type(number):
@@ -1044,7 +1103,7 @@ def grab_voicemails(username, password):
 	voicemails = list(backend.get_voicemails())
 	for voicemail in voicemails:
 		print voicemail.id
-		backend.download(voicemail.id, ".")
+		backend.download(voicemail.id, "%s.mp3" % voicemail.id)
 
 
 def main():
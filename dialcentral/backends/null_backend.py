@@ -26,6 +26,10 @@ class NullAddressBook(object):
 	def name(self):
 		return "None"
 
+	@property
+	def id(self):
+		return "None"
+
 	def update_account(self, force = True):
 		pass
 
@@ -33,6 +33,10 @@ class QtContactsAddressBook(object):
 	def name(self):
 		return self._name
 
+	@property
+	def id(self):
+		return self._uri
+
 	@property
 	def error(self):
 		return self._manager.error()
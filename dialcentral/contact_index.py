@@ -0,0 +1,493 @@
+import bisect
+import logging
+import string
+
+from util import misc as misc_utils
+
+
+_moduleLogger = logging.getLogger(__name__)
+
+
+class NumberIndex(object):
+	"""
+	Maps canonical phone numbers to the contacts that have them, merged across
+	address books.  A source is only re-read the first time a lookup needs it
+	after it was invalidated, and only that source's entries are replaced
+
+	>>> index = NumberIndex()
+	>>> index.set_source("book", lambda: {
+	...     "1": {"name": "Bob", "numbers": [{"phoneNumber": "555-1234"}, {"phoneNumber": "(345) 678-9000"}]},
+	... })
+	>>> index.set_source("other", lambda: {
+	...     "a": {"name": "Robert", "numbers": [{"phoneNumber": "+13456789000"}]},
+	... })
+	>>> index.lookup("+13456789000")
+	[('book', '1', 1), ('other', 'a', 0)]
+	>>> index.lookup("3456789000", "other")
+	[('other', 'a', 0)]
+	>>> index.lookup("5551234")
+	[('book', '1', 0)]
+	>>> index.lookup("911")
+	[]
+	>>> [
+	...     (contact["name"], contact["sources"], len(contact["numbers"]))
+	...     for contact in index.get_merged_contacts().itervalues()
+	... ]
+	[('Bob', [('book', '1'), ('other', 'a')], 2)]
+
+	Sharing a home line doesn't make people the same person
+
+	>>> index.set_source("family", lambda: {
+	...     "1": {"name": "Ann", "numbers": [{"phoneNumber": "555-9999"}]},
+	...     "2": {"name": "Ted", "numbers": [{"phoneNumber": "555-9999"}]},
+	... })
+	>>> index.set_source("friends", lambda: {
+	...     "x": {"name": "Ann Smith", "numbers": [{"phoneNumber": "555-9999"}]},
+	... })
+	>>> sorted(contact["name"] for contact in index.get_merged_contacts().itervalues())
+	['Ann', 'Ann Smith', 'Bob', 'Ted']
+	"""
+
+	def __init__(self):
+		self._sources = {}
+		self._sourceOrder = []
+		self._sourceContacts = {}
+		self._sourceNumbers = {}
+		self._staleSources = set()
+		self._index = {}
+		self._memberNumbers = {}
+		self._memberGroups = {}
+		self._mergedContacts = {}
+		self._dirtyMembers = set()
+		self._dirtyNumbers = set()
+
+	def set_source(self, sourceName, get_contacts):
+		"""
+		Sources added first take precedence when naming merged contacts
+		@param sourceName Stable identifier for the source, display names
+			aren't unique
+		@param get_contacts Returns a dictionary of contact id to contact details
+		"""
+		if self._sources.get(sourceName) == get_contacts:
+			self.invalidate(sourceName)
+			return
+		self.remove_source(sourceName)
+		self._sources[sourceName] = get_contacts
+		self._sourceOrder.append(sourceName)
+		self._staleSources.add(sourceName)
+
+	def remove_source(self, sourceName):
+		if sourceName not in self._sources:
+			return
+		self._remove_entries(sourceName)
+		del self._sources[sourceName]
+		self._sourceOrder.remove(sourceName)
+		self._sourceContacts.pop(sourceName, None)
+		self._staleSources.discard(sourceName)
+
+	def invalidate(self, sourceName):
+		if sourceName in self._sources:
+			self._staleSources.add(sourceName)
+
+	def lookup(self, number, sourceName = None):
+		"""
+		@param sourceName Restrict the matches to one source
+		@returns List of (source name, contact id, index into the contact's numbers)
+		"""
+		self._refresh()
+		matches = []
+		for key in misc_utils.similar_number_keys(misc_utils.make_ugly(number)):
+			for match in self._index.get(key, ()):
+				if sourceName is None or match[0] == sourceName:
+					matches.append(match)
+		return matches
+
+	def get_contact(self, sourceName, contactId):
+		"""
+		@returns The details of a contact returned by lookup
+		"""
+		return self._sourceContacts[sourceName][contactId]
+
+	def lookup_name(self, number):
+		"""
+		@returns The name of the first contact with number, otherwise None
+		"""
+		for sourceName, contactId, position in self.lookup(number):
+			name = self.get_contact(sourceName, contactId)["name"]
+			if name and name != "Unknown":
+				return name
+		return None
+
+	def get_merged_contacts(self):
+		"""
+		Contacts from every source, where contacts in different sources that
+		share a number are treated as the same person.  A number several
+		contacts of one source share doesn't link anyone, and no merged
+		contact takes two contacts from the same source.  The same dictionary
+		is returned until a source changes, and a change only redoes the
+		merging for the contacts it can reach through shared numbers
+		@returns Dictionary of contact id to contact details, the details list
+			the (source name, contact id) of each contact merged into it
+		"""
+		self._refresh()
+		if self._dirtyMembers or self._dirtyNumbers:
+			self._mergedContacts = self._merge()
+		return self._mergedContacts
+
+	def _refresh(self):
+		for sourceName in list(self._staleSources):
+			self._staleSources.discard(sourceName)
+			try:
+				contacts = self._sources[sourceName]()
+			except Exception:
+				_moduleLogger.exception("Could not index %r" % sourceName)
+				contacts = {}
+			if contacts is self._sourceContacts.get(sourceName):
+				continue
+			self._remove_entries(sourceName)
+			self._add_entries(sourceName, contacts)
+
+	def _add_entries(self, sourceName, contacts):
+		numbers = []
+		for contactId, contactDetails in contacts.iteritems():
+			phoneNumbers = (number["phoneNumber"] for number in contactDetails["numbers"])
+			uglyNumbers = misc_utils.make_ugly_numbers(phoneNumbers)
+			for position, uglyNumber in enumerate(uglyNumbers):
+				self._index.setdefault(uglyNumber, []).append((sourceName, contactId, position))
+				numbers.append(uglyNumber)
+			member = sourceName, contactId
+			self._memberNumbers[member] = frozenset(uglyNumbers)
+			self._dirtyMembers.add(member)
+		self._sourceContacts[sourceName] = contacts
+		self._sourceNumbers[sourceName] = numbers
+		self._dirtyNumbers.update(numbers)
+
+	def _remove_entries(self, sourceName):
+		for contactId in self._sourceContacts.get(sourceName, ()):
+			member = sourceName, contactId
+			self._memberNumbers.pop(member, None)
+			self._dirtyMembers.add(member)
+		for uglyNumber in set(self._sourceNumbers.pop(sourceName, ())):
+			self._dirtyNumbers.add(uglyNumber)
+			matches = [
+				match
+				for match in self._index[uglyNumber]
+				if match[0] != sourceName
+			]
+			if matches:
+				self._index[uglyNumber] = matches
+			else:
+				del self._index[uglyNumber]
+		self._sourceContacts.pop(sourceName, None)
+
+	def _merge(self):
+		"""
+		Contacts can only end up together when a chain of shared numbers
+		connects them, so only what a change can reach through shared numbers
+		is merged again
+		@returns The new merged contacts, the old dictionary is left alone
+		"""
+		mergedContacts = dict(self._mergedContacts)
+		affected = set()
+		pending = list(self._dirtyMembers)
+		for uglyNumber in self._dirtyNumbers:
+			pending.extend(
+				(sourceName, contactId)
+				for (sourceName, contactId, position) in self._index.get(uglyNumber, ())
+			)
+		self._dirtyMembers = set()
+		self._dirtyNumbers = set()
+		while pending:
+			member = pending.pop()
+			if member in affected:
+				continue
+			affected.add(member)
+			mergedId = self._memberGroups.pop(member, None)
+			if mergedId is not None:
+				# The rest of its old group has to be regrouped as well
+				oldGroup = mergedContacts.pop(mergedId, None)
+				if oldGroup is not None:
+					pending.extend(oldGroup["sources"])
+			for uglyNumber in self._memberNumbers.get(member, ()):
+				pending.extend(
+					(sourceName, contactId)
+					for (sourceName, contactId, position) in self._index[uglyNumber]
+				)
+
+		sourceRanks = dict(
+			(sourceName, rank)
+			for (rank, sourceName) in enumerate(self._sourceOrder)
+		)
+
+		def member_key(member):
+			return sourceRanks[member[0]], member[1]
+
+		# Removed contacts only needed their old groups broken up
+		members = sorted(
+			(member for member in affected if member in self._memberNumbers),
+			key=member_key,
+		)
+		parents = dict((member, member) for member in members)
+		groupSources = dict((member, frozenset((member[0], ))) for member in members)
+
+		def find(member):
+			root = member
+			while parents[root] != root:
+				root = parents[root]
+			while parents[member] != root:
+				parents[member], member = root, parents[member]
+			return root
+
+		numbers = set()
+		for member in members:
+			numbers.update(self._memberNumbers[member])
+		for uglyNumber in sorted(numbers):
+			contactsBySource = {}
+			for sourceName, contactId, position in self._index[uglyNumber]:
+				contactsBySource.setdefault(sourceName, set()).add(contactId)
+			if len(contactsBySource) < 2:
+				continue
+			if any(1 < len(contactIds) for contactIds in contactsBySource.itervalues()):
+				# A shared line (home, switchboard) doesn't identify a person
+				continue
+
+			sharing = sorted(
+				((sourceName, contactIds.pop()) for (sourceName, contactIds) in contactsBySource.iteritems()),
+				key=member_key,
+			)
+			first = find(sharing[0])
+			for member in sharing[1:]:
+				other = find(member)
+				if other == first or groupSources[first] & groupSources[other]:
+					# Never put two contacts from the same book together
+					continue
+				if member_key(other) < member_key(first):
+					first, other = other, first
+				parents[other] = first
+				groupSources[first] = groupSources[first] | groupSources.pop(other)
+
+		groups = {}
+		for member in members:
+			groups.setdefault(find(member), []).append(member)
+
+		for group in groups.itervalues():
+			group.sort(key=member_key)
+			name = ""
+			numbers = []
+			seenNumbers = set()
+			for sourceName, contactId in group:
+				contactDetails = self._sourceContacts[sourceName][contactId]
+				if not name or name == "Unknown":
+					name = contactDetails["name"]
+				for number in contactDetails["numbers"]:
+					uglyNumber = misc_utils.make_ugly(number["phoneNumber"])
+					if uglyNumber in seenNumbers:
+						continue
+					seenNumbers.add(uglyNumber)
+					numbers.append(dict(number.iteritems()))
+			mergedId = "%s-%s" % group[0]
+			mergedContacts[mergedId] = {
+				"contactId": mergedId,
+				"name": name,
+				"numbers": numbers,
+				"sources": group,
+			}
+			for member in group:
+				self._memberGroups[member] = mergedId
+		return mergedContacts
+
+
+class MergedAddressBook(object):
+	"""
+	Presents the deduplicated contacts of a NumberIndex as one address book
+	"""
+
+	def __init__(self, name, numberIndex):
+		self._name = name
+		self._numberIndex = numberIndex
+
+	@property
+	def name(self):
+		return self._name
+
+	def update_account(self, force = True):
+		pass
+
+	def get_contacts(self):
+		return self._numberIndex.get_merged_contacts()
+
+
+_T9_DIGITS = dict(
+	(letter, digit)
+	for (digit, letters) in (
+		("2", "abc"),
+		("3", "def"),
+		("4", "ghi"),
+		("5", "jkl"),
+		("6", "mno"),
+		("7", "pqrs"),
+		("8", "tuv"),
+		("9", "wxyz"),
+	)
+	for letter in letters
+)
+
+
+def _normalize_name(name):
+	if isinstance(name, str):
+		name = name.decode("UTF-8", "replace")
+	return name.strip().lower()
+
+
+def _to_digits(text):
+	return "".join(c for c in text if c in string.digits)
+
+
+def _to_t9(word):
+	"""
+	>>> _to_t9(u"bob")
+	'262'
+	"""
+	return "".join(_T9_DIGITS.get(c, "") for c in word)
+
+
+class _PrefixArray(object):
+	"""
+	Sorted keys with the (row, position) each one came from
+	"""
+
+	def __init__(self, entries):
+		entries = sorted(entries)
+		self._keys = [entry[0] for entry in entries]
+		self._refs = [entry[1:] for entry in entries]
+
+	def walk(self, prefix, seen, matches, limit):
+		start = bisect.bisect_left(self._keys, prefix)
+		for i in xrange(start, len(self._keys)):
+			if limit <= len(matches):
+				break
+			if not self._keys[i].startswith(prefix):
+				break
+			row, position = self._refs[i]
+			if row in seen:
+				continue
+			seen.add(row)
+			matches.append((row, position))
+
+
+class ContactSearchIndex(object):
+	"""
+	Search-as-you-type over contact names and numbers.  Each kind of key is
+	a sorted array, so a keystroke costs a bisect plus a walk over the
+	matches returned.  Earlier kinds rank higher: full names, then later
+	words of a name, then numbers
+
+	>>> index = ContactSearchIndex()
+	>>> index.update({
+	...     "1": {"name": "Bob Smith", "numbers": [{"phoneNumber": "(345) 678-9000"}]},
+	...     "2": {"name": "Ann Bobbins", "numbers": [{"phoneNumber": "555-1234"}]},
+	... })
+	True
+	>>> [contact["name"] for contact in index.contacts]
+	['Ann Bobbins', 'Bob Smith']
+	>>> [contact["name"] for contact in index.search("bob")]
+	['Bob Smith', 'Ann Bobbins']
+	>>> [contact["name"] for contact in index.search("345")]
+	['Bob Smith']
+	>>> [(contact["name"], position) for (contact, position) in index.search_digits("262")]
+	[('Bob Smith', None), ('Ann Bobbins', None)]
+	>>> [(contact["name"], position) for (contact, position) in index.search_digits("1345")]
+	[('Bob Smith', 0)]
+	"""
+
+	def __init__(self):
+		self._source = None
+		self._contacts = []
+		self._fullNames = _PrefixArray(())
+		self._words = _PrefixArray(())
+		self._numbers = _PrefixArray(())
+		self._t9 = _PrefixArray(())
+
+	@property
+	def contacts(self):
+		"""
+		@returns All contacts sorted by name
+		"""
+		return self._contacts
+
+	def update(self, contacts, force = False):
+		"""
+		@param contacts Dictionary of contact id to details, the index is only
+			rebuilt when this is a different dictionary
+		@returns If the index was rebuilt
+		"""
+		if contacts is self._source and not force:
+			return False
+		self._source = contacts
+
+		keyedContacts = [
+			(_normalize_name(contactDetails["name"]), contactDetails)
+			for contactDetails in contacts.itervalues()
+		]
+		keyedContacts.sort(key=lambda keyed: keyed[0])
+		self._contacts = [contactDetails for (name, contactDetails) in keyedContacts]
+
+		fullNames = []
+		words = []
+		numbers = []
+		t9 = []
+		for row, (name, contactDetails) in enumerate(keyedContacts):
+			fullNames.append((name, row, None))
+			nameWords = name.split()
+			for word in nameWords[1:]:
+				words.append((word, row, None))
+			for word in nameWords:
+				t9.append((_to_t9(word), row, None))
+			for position, number in enumerate(contactDetails["numbers"]):
+				digits = _to_digits(misc_utils.make_ugly(number["phoneNumber"]))
+				numbers.append((digits, row, position))
+				if digits.startswith("1"):
+					numbers.append((digits[1:], row, position))
+		self._fullNames = _PrefixArray(fullNames)
+		self._words = _PrefixArray(words)
+		self._numbers = _PrefixArray(numbers)
+		self._t9 = _PrefixArray(t9)
+		return True
+
+	def search(self, text, limit = 50):
+		"""
+		@returns Up to limit contacts, best matches first
+		"""
+		text = _normalize_name(text)
+		if not text:
+			return []
+		if text.strip(string.digits + "+-() ."):
+			arrays = (self._fullNames, self._words)
+			prefix = text
+		else:
+			arrays = (self._numbers, )
+			prefix = _to_digits(text)
+		return [
+			self._contacts[row]
+			for (row, position) in self._search(arrays, prefix, limit)
+		]
+
+	def search_digits(self, digits, limit = 50):
+		"""
+		Match keypad input against numbers and the keypad spelling of names
+		@returns Up to limit (contact, index of the matching number or None)
+		"""
+		digits = _to_digits(digits)
+		if not digits:
+			return []
+		return [
+			(self._contacts[row], position)
+			for (row, position) in self._search((self._numbers, self._t9), digits, limit)
+		]
+
+	def _search(self, arrays, prefix, limit):
+		seen = set()
+		matches = []
+		for array in arrays:
+			array.walk(prefix, seen, matches, limit)
+		return matches
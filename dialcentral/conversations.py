@@ -0,0 +1,139 @@
+import logging
+
+
+_moduleLogger = logging.getLogger(__name__)
+
+
+def alert_fingerprint(conversation):
+	"""
+	Identifies what a conversation has received, outbound messages and
+	timestamps don't count
+	@returns None when nothing was received
+
+	>>> alert_fingerprint({"id": "a", "messageParts": [("Me:", "hi", "1pm")]}) is None
+	True
+	>>> bob = alert_fingerprint({"id": "a", "messageParts": [("Bob:", "hi", "1pm")]})
+	>>> bob == alert_fingerprint({"id": "a", "messageParts": [("Bob:", "hi", "2pm"), ("Me:", "yo", "2pm")]})
+	True
+	>>> bob == alert_fingerprint({"id": "a", "messageParts": [("Bob:", "hi", "1pm"), ("Bob:", "?", "2pm")]})
+	False
+	"""
+	received = tuple(
+		(part[0], part[1])
+		for part in conversation["messageParts"]
+		if part[0] != "Me:"
+	)
+	if not received:
+		return None
+	return hash((conversation["id"], received))
+
+
+class Delta(object):
+	"""
+	Ids of the conversations touched by a merge
+
+	>>> bool(Delta())
+	False
+	>>> bool(Delta(removed = ["a"]))
+	True
+	"""
+
+	def __init__(self, added = (), changed = (), removed = ()):
+		self.added = frozenset(added)
+		self.changed = frozenset(changed)
+		self.removed = frozenset(removed)
+
+	@property
+	def touched(self):
+		"""
+		@returns Ids that were added or changed
+		"""
+		return self.added | self.changed
+
+	def __nonzero__(self):
+		return bool(self.added or self.changed or self.removed)
+
+	def __repr__(self):
+		return "<%s added=%d changed=%d removed=%d>" % (
+			type(self).__name__,
+			len(self.added),
+			len(self.changed),
+			len(self.removed),
+		)
+
+
+class ConversationStore(object):
+	"""
+	Conversations keyed by id.  Merging a feed updates the existing dicts in
+	place and reports which ids were added, changed or removed
+
+	>>> store = ConversationStore()
+	>>> delta = store.merge([{"id": "a", "text": "hi"}, {"id": "b", "text": "yo"}])
+	>>> sorted(delta.added), sorted(delta.changed), sorted(delta.removed)
+	(['a', 'b'], [], [])
+	>>> a = store.get("a")
+	>>> delta = store.merge([{"id": "a", "text": "hey"}, {"id": "c", "text": "sup"}])
+	>>> sorted(delta.added), sorted(delta.changed), sorted(delta.removed)
+	(['c'], ['a'], ['b'])
+	>>> a["text"]
+	'hey'
+	>>> bool(store.merge([{"id": "a", "text": "hey"}], isComplete = False))
+	False
+	>>> len(store)
+	2
+	"""
+
+	def __init__(self):
+		self._conversations = {}
+
+	def merge(self, conversations, isComplete = True):
+		"""
+		@param isComplete When set, conversations missing from the feed are removed
+		@returns Delta
+		"""
+		added = []
+		changed = []
+		seen = set()
+		for conversation in conversations:
+			conversationId = conversation["id"]
+			seen.add(conversationId)
+			existing = self._conversations.get(conversationId)
+			if existing is None:
+				self._conversations[conversationId] = conversation
+				added.append(conversationId)
+			elif existing != conversation:
+				existing.clear()
+				existing.update(conversation)
+				changed.append(conversationId)
+
+		if isComplete:
+			removed = [
+				conversationId
+				for conversationId in self._conversations
+				if conversationId not in seen
+			]
+			for conversationId in removed:
+				del self._conversations[conversationId]
+		else:
+			removed = []
+		return Delta(added, changed, removed)
+
+	def clear(self):
+		"""
+		@returns Delta
+		"""
+		removed = self._conversations.keys()
+		self._conversations.clear()
+		return Delta(removed = removed)
+
+	def get(self, conversationId, default = None):
+		return self._conversations.get(conversationId, default)
+
+	def values(self):
+		return self._conversations.values()
+
+	def __contains__(self, conversationId):
+		return conversationId in self._conversations
+
+	def __len__(self):
+		return len(self._conversations)
@@ -108,6 +108,10 @@ class Dialcentral(qwrappers.ApplicationWrapper):
 	def fsContactsPath(self):
 		return linux_utils.get_resource_path("data", constants.__app_name__, "contacts")
 
+	@property
+	def fsContactsCachePath(self):
+		return linux_utils.get_resource_path("cache", constants.__app_name__, "contacts")
+
 	@property
 	def streamHandler(self):
 		if self._streamHandler is None:
@@ -196,6 +200,10 @@ class DelayedWidget(object):
 		if self._child is not None:
 			self._child.refresh(force)
 
+	def cancel_refresh(self):
+		if self._child is not None:
+			self._child.cancel_refresh()
+
 	def get_settings(self):
 		if self._child is not None:
 			return self._child.get_settings()
@@ -684,7 +692,7 @@ class MainWindow(qwrappers.WindowWrapper):
 					(True, False): self._session.MESSAGE_TEXTS,
 					(False, True): self._session.MESSAGE_VOICEMAILS,
 				}[(self._app.notifyOnSms, self._app.notifyOnVoicemail)]
-				self._session.update_messages(messageType, force=True)
+				self._session.poll_messages(messageType)
 
 	@qt_compat.Slot()
 	@misc_utils.log_exception(_moduleLogger)
@@ -715,6 +723,9 @@ class MainWindow(qwrappers.WindowWrapper):
 	@misc_utils.log_exception(_moduleLogger)
 	def _on_tab_changed(self, index):
 		with qui_utils.notify_error(self._errorLog):
+			if self._currentTab != index:
+				# Only what the tab being left asked for, background polls keep going
+				self._tabsContents[self._currentTab].cancel_refresh()
 			self._currentTab = index
 			self._initialize_tab(index)
 			if self._app.alarmHandler.alarmType == self._app.alarmHandler.ALARM_APPLICATION:
@@ -555,8 +555,8 @@ class ContactList(object):
 		else:
 			defaultIndex = _index_number(numbers, selectedNumber)
 
-		for number, description in numbers:
-			prettyNumber = misc_utils.make_pretty(number)
+		prettyNumbers = misc_utils.make_pretty_numbers(number for (number, description) in numbers)
+		for prettyNumber, (number, description) in zip(prettyNumbers, numbers):
 			if description:
 				label = "%s - %s" % (prettyNumber, description)
 			else:
@@ -599,6 +599,7 @@ class VoicemailPlayer(object):
 		self._errorLog = errorLog
 		self._token = None
 		self._session.voicemailAvailable.connect(self._on_voicemail_downloaded)
+		self._session.voicemailProgress.connect(self._on_voicemail_progress)
 		self._session.draft.recipientsChanged.connect(self._on_recipients_changed)
 
 		self._playButton = QtGui.QPushButton("Play")
@@ -615,8 +616,11 @@ class VoicemailPlayer(object):
 
 		self._downloadButton = QtGui.QPushButton("Download Voicemail")
 		self._downloadButton.clicked.connect(self._on_voicemail_download)
+		self._downloadProgress = QtGui.QProgressBar()
+		self._downloadProgress.hide()
 		self._downloadLayout = QtGui.QHBoxLayout()
 		self._downloadLayout.addWidget(self._downloadButton)
+		self._downloadLayout.addWidget(self._downloadProgress)
 		self._downloadWidget = QtGui.QWidget()
 		self._downloadWidget.setLayout(self._downloadLayout)
 
@@ -646,6 +650,7 @@ class VoicemailPlayer(object):
 
 	def destroy(self):
 		self._session.voicemailAvailable.disconnect(self._on_voicemail_downloaded)
+		self._session.voicemailProgress.disconnect(self._on_voicemail_progress)
 		self._session.draft.recipientsChanged.disconnect(self._on_recipients_changed)
 		self._invalidate_token()
 
@@ -660,6 +665,7 @@ class VoicemailPlayer(object):
 		if self._visibleWidget is self._downloadWidget:
 			return
 		self._hide()
+		self._downloadProgress.hide()
 		self._layout.addWidget(self._downloadWidget)
 		self._visibleWidget = self._downloadWidget
 		self._visibleWidget.show()
@@ -786,7 +792,9 @@ class VoicemailPlayer(object):
 			(cid, ) = self._session.draft.get_contacts()
 			messageId = self._session.draft.get_message_id(cid)
 			self._session.download_voicemail(messageId)
-			self._hide()
+			# Busy until the size is known
+			self._downloadProgress.setRange(0, 0)
+			self._downloadProgress.show()
 
 	@qt_compat.Slot()
 	@misc_utils.log_exception(_moduleLogger)
@@ -794,6 +802,22 @@ class VoicemailPlayer(object):
 		with qui_utils.notify_error(self._app.errorLog):
 			self._update_state()
 
+	@qt_compat.Slot(str, int, int)
+	@misc_utils.log_exception(_moduleLogger)
+	def _on_voicemail_progress(self, messageId, downloaded, total):
+		with qui_utils.notify_error(self._app.errorLog):
+			if self._visibleWidget is not self._downloadWidget:
+				return
+			(cid, ) = self._session.draft.get_contacts()
+			if str(messageId) != self._session.draft.get_message_id(cid):
+				return
+			if total < 0:
+				self._downloadProgress.setRange(0, 0)
+			else:
+				self._downloadProgress.setRange(0, total)
+				self._downloadProgress.setValue(downloaded)
+			self._downloadProgress.show()
+
 	@qt_compat.Slot(str, str)
 	@misc_utils.log_exception(_moduleLogger)
 	def _on_voicemail_downloaded(self, messageId, filepath):
@@ -1019,8 +1043,8 @@ class SMSEntryWindow(qwrappers.WindowWrapper):
 		else:
 			defaultIndex = _index_number(numbers, selectedNumber)
 
-		for number, description in numbers:
-			prettyNumber = misc_utils.make_pretty(number)
+		prettyNumbers = misc_utils.make_pretty_numbers(number for (number, description) in numbers)
+		for prettyNumber, (number, description) in zip(prettyNumbers, numbers):
 			if description:
 				label = "%s - %s" % (prettyNumber, description)
 			else:
@@ -1152,18 +1176,20 @@ class SMSEntryWindow(qwrappers.WindowWrapper):
 
 
 def _index_number(numbers, default):
-	uglyDefault = misc_utils.make_ugly(default)
-	uglyContactNumbers = list(
-		misc_utils.make_ugly(contactNumber)
-		for (contactNumber, _) in numbers
+	uglyContactNumbers = misc_utils.make_ugly_numbers(
+		contactNumber for (contactNumber, _) in numbers
 	)
+	positions = {}
+	for position, uglyNumber in enumerate(uglyContactNumbers):
+		positions.setdefault(uglyNumber, position)
 	defaultMatches = [
-		misc_utils.similar_ugly_numbers(uglyDefault, contactNumber)
-		for contactNumber in uglyContactNumbers
+		positions[key]
+		for key in misc_utils.similar_number_keys(misc_utils.make_ugly(default))
+		if key in positions
 	]
-	try:
-		defaultIndex = defaultMatches.index(True)
-	except ValueError:
+	if defaultMatches:
+		defaultIndex = min(defaultMatches)
+	else:
 		defaultIndex = -1
 		_moduleLogger.warn(
 			"Could not find contact number %s among %r" % (
@@ -1185,7 +1211,13 @@ def _get_contact_numbers(session, contactId, number, description):
 			(contactPhoneNumber["phoneNumber"], contactPhoneNumber.get("phoneType", "Unknown"))
 			for contactPhoneNumber in contactPhoneNumbers
 		]
-		defaultIndex = _index_number(contactPhoneNumbers, number)
+		matches = session.get_number_index().lookup(number, session.NUMBER_INDEX_SOURCE)
+		positions = [
+			position
+			for (sourceName, matchedId, position) in matches
+			if matchedId == contactId
+		]
+		defaultIndex = min(positions) if positions else -1
 
 	if not contactPhoneNumbers or defaultIndex == -1:
 		contactPhoneNumbers += [(number, description)]
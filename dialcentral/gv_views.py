@@ -3,7 +3,6 @@
 from __future__ import with_statement
 from __future__ import division
 
-import datetime
 import string
 import itertools
 import logging
@@ -14,11 +13,15 @@ QtGui = qt_compat.import_module("QtGui")
 
 from util import qtpie
 from util import qui_utils
+from util import qore_utils
 from util import misc as misc_utils
 
 import backends.null_backend as null_backend
 import backends.file_backend as file_backend
+import backends.file_watcher as file_watcher
 import backends.qt_backend as qt_backend
+import contact_index
+import time_categories
 
 
 _moduleLogger = logging.getLogger(__name__)
@@ -29,6 +32,9 @@ _SENTINEL_ICON = QtGui.QIcon()
 
 class Dialpad(object):
 
+	_MIN_MATCH_DIGITS = 2
+	_MAX_MATCHES = 5
+
 	def __init__(self, app, session, errorLog):
 		self._app = app
 		self._session = session
@@ -37,6 +43,11 @@ class Dialpad(object):
 		self._plus = QtGui.QPushButton("+")
 		self._plus.clicked.connect(lambda: self._on_keypress("+"))
 		self._entry = QtGui.QLineEdit()
+		self._entry.textChanged[str].connect(self._on_entry_changed)
+
+		self._matchList = QtGui.QListWidget()
+		self._matchList.itemActivated.connect(self._on_match_activated)
+		self._matchList.hide()
 
 		backAction = QtGui.QAction(None)
 		backAction.setText("Back")
@@ -108,6 +119,7 @@ class Dialpad(object):
 
 		self._layout = QtGui.QVBoxLayout()
 		self._layout.addLayout(self._entryLayout, 0)
+		self._layout.addWidget(self._matchList, 0)
 		self._layout.addLayout(self._padLayout, 1000000)
 		self._widget = QtGui.QWidget()
 		self._widget.setLayout(self._layout)
@@ -136,6 +148,9 @@ class Dialpad(object):
 	def refresh(self, force = True):
 		pass
 
+	def cancel_refresh(self):
+		pass
+
 	def _generate_key_button(self, center, letters):
 		button = QtGui.QPushButton("%s\n%s" % (center, letters))
 		button.setSizePolicy(QtGui.QSizePolicy(
@@ -146,6 +161,41 @@ class Dialpad(object):
 		button.clicked.connect(lambda: self._on_keypress(center))
 		return button
 
+	def _update_matches(self, text):
+		self._matchList.clear()
+		digits = misc_utils.make_ugly(text)
+		if len(digits) < self._MIN_MATCH_DIGITS:
+			self._matchList.hide()
+			return
+
+		matches = self._session.get_search_index().search_digits(digits, self._MAX_MATCHES)
+		for contactDetails, position in matches:
+			numbers = contactDetails["numbers"]
+			if not numbers:
+				continue
+			if position is None:
+				position = 0
+			number = numbers[position]["phoneNumber"]
+			item = QtGui.QListWidgetItem(
+				"%s - %s" % (contactDetails["name"], misc_utils.make_pretty(number))
+			)
+			item.setData(QtCore.Qt.UserRole, number)
+			self._matchList.addItem(item)
+		self._matchList.setVisible(0 < self._matchList.count())
+
+	@qt_compat.Slot(str)
+	@misc_utils.log_exception(_moduleLogger)
+	def _on_entry_changed(self, text):
+		with qui_utils.notify_error(self._errorLog):
+			self._update_matches(unicode(text))
+
+	@qt_compat.Slot(QtGui.QListWidgetItem)
+	@misc_utils.log_exception(_moduleLogger)
+	def _on_match_activated(self, item):
+		with qui_utils.notify_error(self._errorLog):
+			number = misc_utils.make_ugly(str(item.data(QtCore.Qt.UserRole)))
+			self._entry.setText(number)
+
 	@misc_utils.log_exception(_moduleLogger)
 	def _on_keypress(self, key):
 		with qui_utils.notify_error(self._errorLog):
@@ -192,73 +242,6 @@ class Dialpad(object):
 			self._session.draft.call()
 
 
-class TimeCategories(object):
-
-	_NOW_SECTION = 0
-	_TODAY_SECTION = 1
-	_WEEK_SECTION = 2
-	_MONTH_SECTION = 3
-	_REST_SECTION = 4
-	_MAX_SECTIONS = 5
-
-	_NO_ELAPSED = datetime.timedelta(hours=1)
-	_WEEK_ELAPSED = datetime.timedelta(weeks=1)
-	_MONTH_ELAPSED = datetime.timedelta(days=30)
-
-	def __init__(self, parentItem):
-		self._timeItems = [
-			QtGui.QStandardItem(description)
-			for (i, description) in zip(
-				xrange(self._MAX_SECTIONS),
-				["Now", "Today", "Week", "Month", "Past"],
-			)
-		]
-		for item in self._timeItems:
-			item.setEditable(False)
-			item.setCheckable(False)
-			row = (item, )
-			parentItem.appendRow(row)
-
-		self._today = datetime.datetime(1900, 1, 1)
-
-		self.prepare_for_update(self._today)
-
-	def prepare_for_update(self, newToday):
-		self._today = newToday
-		for item in self._timeItems:
-			item.removeRows(0, item.rowCount())
-		try:
-			hour = self._today.strftime("%X")
-			day = self._today.strftime("%x")
-		except ValueError:
-			_moduleLogger.exception("Can't format times")
-			hour = "Now"
-			day = "Today"
-		self._timeItems[self._NOW_SECTION].setText(hour)
-		self._timeItems[self._TODAY_SECTION].setText(day)
-
-	def add_row(self, rowDate, row):
-		elapsedTime = self._today - rowDate
-		todayTuple = self._today.timetuple()
-		rowTuple = rowDate.timetuple()
-		if elapsedTime < self._NO_ELAPSED:
-			section = self._NOW_SECTION
-		elif todayTuple[0:3] == rowTuple[0:3]:
-			section = self._TODAY_SECTION
-		elif elapsedTime < self._WEEK_ELAPSED:
-			section = self._WEEK_SECTION
-		elif elapsedTime < self._MONTH_ELAPSED:
-			section = self._MONTH_SECTION
-		else:
-			section = self._REST_SECTION
-		self._timeItems[section].appendRow(row)
-
-	def get_item(self, timeIndex, rowIndex, column):
-		timeItem = self._timeItems[timeIndex]
-		item = timeItem.child(rowIndex, column)
-		return item
-
-
 class History(object):
 
 	DETAILS_IDX = 0
@@ -280,6 +263,7 @@ class History(object):
 		self._session = session
 		self._session.historyUpdated.connect(self._on_history_updated)
 		self._errorLog = errorLog
+		self._refreshes = []
 
 		self._typeSelection = QtGui.QComboBox()
 		self._typeSelection.addItems(self.HISTORY_ITEM_TYPES)
@@ -305,9 +289,15 @@ class History(object):
 		self._managerLayout.addWidget(self._typeSelection, 1000)
 		self._managerLayout.addWidget(self._refreshButton, 0)
 
-		self._itemStore = QtGui.QStandardItemModel()
-		self._itemStore.setHorizontalHeaderLabels(self.HISTORY_COLUMNS)
-		self._categoryManager = TimeCategories(self._itemStore)
+		self._detailsFont = QtGui.QFont()
+		self._detailsFont.setPointSize(max(self._detailsFont.pointSize() - 6, 5))
+		self._nameFont = QtGui.QFont()
+		self._nameFont.setPointSize(self._nameFont.pointSize() + 4)
+
+		self._itemStore = qore_utils.SectionedItemModel(self.MAX_IDX, self._get_cell_data)
+		self._categoryManager = time_categories.TimeCategories(self._itemStore)
+		self._categoryManager.set_filter(self._selectedFilter, self._is_event_visible)
+		self._numberEvents = {}
 
 		self._itemView = QtGui.QTreeView()
 		self._itemView.setModel(self._itemStore)
@@ -366,62 +356,78 @@ class History(object):
 		self._itemView.setFocus(QtCore.Qt.OtherFocusReason)
 
 		if self._selectedFilter == self.HISTORY_RECEIVED:
-			self._session.update_history(self._session.HISTORY_RECEIVED, force)
+			le = self._session.update_history(self._session.HISTORY_RECEIVED, force)
 		elif self._selectedFilter == self.HISTORY_MISSED:
-			self._session.update_history(self._session.HISTORY_MISSED, force)
+			le = self._session.update_history(self._session.HISTORY_MISSED, force)
 		elif self._selectedFilter == self.HISTORY_PLACED:
-			self._session.update_history(self._session.HISTORY_PLACED, force)
+			le = self._session.update_history(self._session.HISTORY_PLACED, force)
 		elif self._selectedFilter == self.HISTORY_ALL:
-			self._session.update_history(self._session.HISTORY_ALL, force)
+			le = self._session.update_history(self._session.HISTORY_ALL, force)
 		else:
 			assert False, "How did we get here?"
+		self._track_refresh(le)
 
 		if self._app.notifyOnMissed and self._app.alarmHandler.alarmType != self._app.alarmHandler.ALARM_NONE:
 			self._app.ledHandler.off()
 
-	def _populate_items(self):
-		self._categoryManager.prepare_for_update(self._session.get_when_history_updated())
+	def cancel_refresh(self):
+		refreshes, self._refreshes = self._refreshes, []
+		for le in refreshes:
+			self._session.cancel_refresh(le)
 
+	def _track_refresh(self, le):
+		self._refreshes = [pending for pending in self._refreshes if not pending.isDone]
+		if le is not None:
+			self._refreshes.append(le)
+
+	def _populate_items(self):
 		history = self._session.get_history()
 		history.sort(key=lambda item: item["time"], reverse=True)
+		self._numberEvents = {}
 		for event in history:
-			if self._selectedFilter not in [self.HISTORY_ITEM_TYPES[-1], event["action"]]:
-				continue
-
-			relTime = event["relTime"]
-			action = event["action"]
-			number = event["number"]
-			prettyNumber = misc_utils.make_pretty(number)
-			if prettyNumber.startswith("+1 "):
-				prettyNumber = prettyNumber[len("+1 "):]
-			name = event["name"]
-			if not name or name == number:
-				name = event["location"]
-			if not name:
-				name = "Unknown"
-
-			detailsItem = QtGui.QStandardItem(self._actionIcon[action], "%s\n%s" % (prettyNumber, relTime))
-			detailsFont = detailsItem.font()
-			detailsFont.setPointSize(max(detailsFont.pointSize() - 6, 5))
-			detailsItem.setFont(detailsFont)
-			nameItem = QtGui.QStandardItem(name)
-			nameFont = nameItem.font()
-			nameFont.setPointSize(nameFont.pointSize() + 4)
-			nameItem.setFont(nameFont)
-			row = detailsItem, nameItem
-			for item in row:
-				item.setEditable(False)
-				item.setCheckable(False)
-			row[self.DETAILS_IDX].setData(event)
-			self._categoryManager.add_row(event["time"], row)
+			self._numberEvents.setdefault(str(event["number"]), []).append(event)
+		self._categoryManager.update(self._session.get_when_history_updated(), history)
 		self._itemView.expandAll()
 
+	def _is_event_visible(self, event):
+		return self._selectedFilter in [self.HISTORY_ITEM_TYPES[-1], event["action"]]
+
+	def _get_cell_data(self, event, column, role):
+		if column == self.DETAILS_IDX:
+			if role == QtCore.Qt.DisplayRole:
+				prettyNumber = misc_utils.make_pretty(event["number"])
+				if prettyNumber.startswith("+1 "):
+					prettyNumber = prettyNumber[len("+1 "):]
+				return "%s\n%s" % (prettyNumber, event["relTime"])
+			elif role == QtCore.Qt.DecorationRole:
+				return self._actionIcon[event["action"]]
+			elif role == QtCore.Qt.FontRole:
+				return self._detailsFont
+		elif column == self.FROM_IDX:
+			if role == QtCore.Qt.DisplayRole:
+				return self._format_name(event)
+			elif role == QtCore.Qt.FontRole:
+				return self._nameFont
+		return None
+
+	def _format_name(self, event):
+		number = event["number"]
+		name = event["name"]
+		if (not name or name == number) and number:
+			name = self._session.get_number_index().lookup_name(number)
+		if not name or name == number:
+			name = event["location"]
+		if not name:
+			name = "Unknown"
+		return name
+
 	@qt_compat.Slot(str)
 	@misc_utils.log_exception(_moduleLogger)
 	def _on_filter_changed(self, newItem):
 		with qui_utils.notify_error(self._errorLog):
 			self._selectedFilter = str(newItem)
-			self._populate_items()
+			self._categoryManager.set_filter(self._selectedFilter, self._is_event_visible)
+			self._itemView.expandAll()
 
 	@qt_compat.Slot()
 	@misc_utils.log_exception(_moduleLogger)
@@ -439,34 +445,21 @@ class History(object):
 	@misc_utils.log_exception(_moduleLogger)
 	def _on_row_activated(self, index):
 		with qui_utils.notify_error(self._errorLog):
-			timeIndex = index.parent()
-			if not timeIndex.isValid():
+			contactDetails = self._itemStore.get_item(index)
+			if contactDetails is None:
 				return
-			timeRow = timeIndex.row()
-			row = index.row()
-			detailsItem = self._categoryManager.get_item(timeRow, row, self.DETAILS_IDX)
-			fromItem = self._categoryManager.get_item(timeRow, row, self.FROM_IDX)
-			contactDetails = detailsItem.data()
 
-			title = unicode(fromItem.text())
+			title = unicode(self._format_name(contactDetails))
 			number = str(contactDetails["number"])
 			contactId = number # ids don't seem too unique so using numbers
 
+			prettyNumber = misc_utils.make_pretty(number)
 			descriptionRows = []
-			for t in xrange(self._itemStore.rowCount()):
-				randomTimeItem = self._itemStore.item(t, 0)
-				for i in xrange(randomTimeItem.rowCount()):
-					iItem = randomTimeItem.child(i, 0)
-					iContactDetails = iItem.data()
-					iNumber = str(iContactDetails["number"])
-					if number != iNumber:
-						continue
-					relTime = misc_utils.abbrev_relative_date(iContactDetails["relTime"])
-					action = str(iContactDetails["action"])
-					number = str(iContactDetails["number"])
-					prettyNumber = misc_utils.make_pretty(number)
-					rowItems = relTime, action, prettyNumber
-					descriptionRows.append("<tr><td>%s</td></tr>" % "</td><td>".join(rowItems))
+			for iContactDetails in self._numberEvents.get(number, ()):
+				relTime = misc_utils.abbrev_relative_date(iContactDetails["relTime"])
+				action = str(iContactDetails["action"])
+				rowItems = relTime, action, prettyNumber
+				descriptionRows.append("<tr><td>%s</td></tr>" % "</td><td>".join(rowItems))
 			description = "<table>%s</table>" % "".join(descriptionRows)
 			numbersWithDescriptions = [(str(contactDetails["number"]), "")]
 			self._session.draft.add_contact(contactId, None, title, description, numbersWithDescriptions)
@@ -494,6 +487,7 @@ class Messages(object):
 		self._session = session
 		self._session.messagesUpdated.connect(self._on_messages_updated)
 		self._errorLog = errorLog
+		self._refreshes = []
 
 		self._typeSelection = QtGui.QComboBox()
 		self._typeSelection.addItems(self.MESSAGE_TYPES)
@@ -529,9 +523,11 @@ class Messages(object):
 		self._selectionLayout.addWidget(self._statusSelection, 1000)
 		self._selectionLayout.addWidget(self._refreshButton, 0)
 
-		self._itemStore = QtGui.QStandardItemModel()
-		self._itemStore.setHorizontalHeaderLabels(["Messages"])
-		self._categoryManager = TimeCategories(self._itemStore)
+		self._renderKeys = {}
+		self._formattedMessages = {}
+		self._itemStore = qore_utils.SectionedItemModel(1, self._get_cell_data)
+		self._categoryManager = time_categories.TimeCategories(self._itemStore)
+		self._apply_filter()
 
 		self._htmlDelegate = qui_utils.QHtmlDelegate()
 		self._itemView = QtGui.QTreeView()
@@ -593,95 +589,166 @@ class Messages(object):
 		self._itemView.setFocus(QtCore.Qt.OtherFocusReason)
 
 		if self._selectedTypeFilter == self.NO_MESSAGES:
-			pass
+			le = None
 		elif self._selectedTypeFilter == self.TEXT_MESSAGES:
-			self._session.update_messages(self._session.MESSAGE_TEXTS, force)
+			le = self._session.update_messages(self._session.MESSAGE_TEXTS, force)
 		elif self._selectedTypeFilter == self.VOICEMAIL_MESSAGES:
-			self._session.update_messages(self._session.MESSAGE_VOICEMAILS, force)
+			le = self._session.update_messages(self._session.MESSAGE_VOICEMAILS, force)
 		elif self._selectedTypeFilter == self.ALL_TYPES:
-			self._session.update_messages(self._session.MESSAGE_ALL, force)
+			le = self._session.update_messages(self._session.MESSAGE_ALL, force)
 		else:
 			assert False, "How did we get here?"
+		self._track_refresh(le)
 
 		if (self._app.notifyOnSms or self._app.notifyOnVoicemail) and self._app.alarmHandler.alarmType != self._app.alarmHandler.ALARM_NONE:
 			self._app.ledHandler.off()
 
-	def _populate_items(self):
-		self._categoryManager.prepare_for_update(self._session.get_when_messages_updated())
-
+	def cancel_refresh(self):
+		refreshes, self._refreshes = self._refreshes, []
+		for le in refreshes:
+			self._session.cancel_refresh(le)
+
+	def _track_refresh(self, le):
+		self._refreshes = [pending for pending in self._refreshes if not pending.isDone]
+		if le is not None:
+			self._refreshes.append(le)
+
+	def _populate_items(self, isChanged = True):
+		"""
+		@param isChanged When not set, the conversations are the same as last
+			time and only the time sections are brought up to date
+		"""
 		rawMessages = self._session.get_messages()
 		rawMessages.sort(key=lambda item: item["time"], reverse=True)
-		for item in rawMessages:
-			isUnarchived = not item["isArchived"]
-			isUnread = not item["isRead"]
-			visibleStatus = {
-				self.UNREAD_STATUS: isUnarchived and isUnread,
-				self.UNARCHIVED_STATUS: isUnarchived,
-				self.ALL_STATUS: True,
-			}[self._selectedStatusFilter]
-			visibleType = self._selectedTypeFilter in [item["type"], self.ALL_TYPES]
-			if not (visibleType and visibleStatus):
-				continue
+		if isChanged:
+			self._renderKeys = dict(
+				(item["id"], self._calculate_render_key(item))
+				for item in rawMessages
+			)
+			# Conversations that changed or went away won't be asked for again
+			liveKeys = set(self._renderKeys.itervalues())
+			for renderKey in self._formattedMessages.keys():
+				if renderKey not in liveKeys:
+					del self._formattedMessages[renderKey]
+		# Even unchanged conversations can move sections as time passes
+		self._categoryManager.update(
+			self._session.get_when_messages_updated(),
+			rawMessages,
+			self._session.get_messages_delta().changed,
+		)
+		self._itemView.expandAll()
 
-			relTime = misc_utils.abbrev_relative_date(item["relTime"])
-			number = item["number"]
-			prettyNumber = misc_utils.make_pretty(number)
-			name = item["name"]
-			if not name or name == number:
-				name = item["location"]
-			if not name:
-				name = "Unknown"
+	def _apply_filter(self):
+		self._categoryManager.set_filter(
+			(self._selectedTypeFilter, self._selectedStatusFilter),
+			self._is_message_visible,
+		)
 
-			messageParts = list(item["messageParts"])
-			if len(messageParts) == 0:
-				messages = ("No Transcription", )
-			elif len(messageParts) == 1:
-				if messageParts[0][1]:
-					messages = (messageParts[0][1], )
-				else:
-					messages = ("No Transcription", )
-			else:
-				messages = [
-					"<b>%s</b>: %s" % (messagePart[0], messagePart[1])
-					for messagePart in messageParts
-				]
-
-			firstMessage = "<b>%s<br/>%s</b> <i>(%s)</i>" % (name, prettyNumber, relTime)
-
-			expandedMessages = [firstMessage]
-			expandedMessages.extend(messages)
-			if self._MIN_MESSAGES_SHOWN < len(messages):
-				secondMessage = "<i>%d Messages Hidden...</i>" % (len(messages) - self._MIN_MESSAGES_SHOWN, )
-				collapsedMessages = [firstMessage, secondMessage]
-				collapsedMessages.extend(messages[-(self._MIN_MESSAGES_SHOWN+0):])
+	def _is_message_visible(self, item):
+		isUnarchived = not item["isArchived"]
+		isUnread = not item["isRead"]
+		visibleStatus = {
+			self.UNREAD_STATUS: isUnarchived and isUnread,
+			self.UNARCHIVED_STATUS: isUnarchived,
+			self.ALL_STATUS: True,
+		}[self._selectedStatusFilter]
+		visibleType = self._selectedTypeFilter in [item["type"], self.ALL_TYPES]
+		return visibleType and visibleStatus
+
+	def _get_cell_data(self, item, column, role):
+		if role == QtCore.Qt.DisplayRole:
+			collapsedMessages, expandedMessages = self._format_messages(item)
+			return collapsedMessages
+		elif role == qui_utils.QHtmlDelegate.CACHE_KEY_ROLE:
+			return self._get_render_key(item)
+		return None
+
+	@staticmethod
+	def _calculate_render_key(item):
+		"""
+		@returns (conversation id, fingerprint of everything that is rendered)
+		"""
+		fingerprint = hash((
+			item["name"],
+			item["number"],
+			item["location"],
+			item["relTime"],
+			tuple(tuple(part) for part in item["messageParts"]),
+		))
+		return item["id"], fingerprint
+
+	def _get_render_key(self, item):
+		try:
+			return self._renderKeys[item["id"]]
+		except KeyError:
+			return self._calculate_render_key(item)
+
+	def _format_messages(self, item):
+		"""
+		@returns (collapsed html, expanded html)
+		"""
+		renderKey = self._get_render_key(item)
+		try:
+			return self._formattedMessages[renderKey]
+		except KeyError:
+			pass
+
+		relTime = misc_utils.abbrev_relative_date(item["relTime"])
+		number = item["number"]
+		prettyNumber = misc_utils.make_pretty(number)
+		name = item["name"]
+		if not name or name == number:
+			name = item["location"]
+		if not name:
+			name = "Unknown"
+
+		messageParts = list(item["messageParts"])
+		if len(messageParts) == 0:
+			messages = ("No Transcription", )
+		elif len(messageParts) == 1:
+			if messageParts[0][1]:
+				messages = (messageParts[0][1], )
 			else:
-				collapsedMessages = expandedMessages
-
-			item = dict(item.iteritems())
-			item["collapsedMessages"] = "<br/>\n".join(collapsedMessages)
-			item["expandedMessages"] = "<br/>\n".join(expandedMessages)
-
-			messageItem = QtGui.QStandardItem(item["collapsedMessages"])
-			messageItem.setData(item)
-			messageItem.setEditable(False)
-			messageItem.setCheckable(False)
-			row = (messageItem, )
-			self._categoryManager.add_row(item["time"], row)
-		self._itemView.expandAll()
+				messages = ("No Transcription", )
+		else:
+			messages = [
+				"<b>%s</b>: %s" % (messagePart[0], messagePart[1])
+				for messagePart in messageParts
+			]
+
+		firstMessage = "<b>%s<br/>%s</b> <i>(%s)</i>" % (name, prettyNumber, relTime)
+
+		expandedMessages = [firstMessage]
+		expandedMessages.extend(messages)
+		if self._MIN_MESSAGES_SHOWN < len(messages):
+			secondMessage = "<i>%d Messages Hidden...</i>" % (len(messages) - self._MIN_MESSAGES_SHOWN, )
+			collapsedMessages = [firstMessage, secondMessage]
+			collapsedMessages.extend(messages[-(self._MIN_MESSAGES_SHOWN+0):])
+		else:
+			collapsedMessages = expandedMessages
+
+		formatted = (
+			"<br/>\n".join(collapsedMessages),
+			"<br/>\n".join(expandedMessages),
+		)
+		self._formattedMessages[renderKey] = formatted
+		return formatted
 
 	@qt_compat.Slot(str)
 	@misc_utils.log_exception(_moduleLogger)
 	def _on_type_filter_changed(self, newItem):
 		with qui_utils.notify_error(self._errorLog):
 			self._selectedTypeFilter = str(newItem)
-			self._populate_items()
+			self._apply_filter()
+			self._itemView.expandAll()
 
 	@qt_compat.Slot(str)
 	@misc_utils.log_exception(_moduleLogger)
 	def _on_status_filter_changed(self, newItem):
 		with qui_utils.notify_error(self._errorLog):
 			self._selectedStatusFilter = str(newItem)
-			self._populate_items()
+			self._apply_filter()
+			self._itemView.expandAll()
 
 	@qt_compat.Slot()
 	@misc_utils.log_exception(_moduleLogger)
@@ -693,19 +760,18 @@ class Messages(object):
 	@misc_utils.log_exception(_moduleLogger)
 	def _on_messages_updated(self):
 		with qui_utils.notify_error(self._errorLog):
-			self._populate_items()
+			isChanged = bool(self._session.get_messages_delta())
+			if not isChanged:
+				_moduleLogger.debug("Messages unchanged, only updating the time sections")
+			self._populate_items(isChanged)
 
 	@qt_compat.Slot(QtCore.QModelIndex)
 	@misc_utils.log_exception(_moduleLogger)
 	def _on_row_activated(self, index):
 		with qui_utils.notify_error(self._errorLog):
-			timeIndex = index.parent()
-			if not timeIndex.isValid():
+			contactDetails = self._itemStore.get_item(index)
+			if contactDetails is None:
 				return
-			timeRow = timeIndex.row()
-			row = index.row()
-			item = self._categoryManager.get_item(timeRow, row, 0)
-			contactDetails = item.data()
 
 			name = unicode(contactDetails["name"])
 			number = str(contactDetails["number"])
@@ -720,7 +786,8 @@ class Messages(object):
 				messageId = None
 			contactId = number
 			title = name
-			description = unicode(contactDetails["expandedMessages"])
+			collapsedMessages, expandedMessages = self._format_messages(contactDetails)
+			description = unicode(expandedMessages)
 			numbersWithDescriptions = [(number, "")]
 			self._session.draft.add_contact(contactId, messageId, title, description, numbersWithDescriptions)
 
@@ -734,16 +801,30 @@ class Contacts(object):
 
 	# @todo Provide some sort of letter jump
 
+	MERGED_ADDRESSBOOK = "All Contacts"
+
 	def __init__(self, app, session, errorLog):
 		self._app = app
 		self._session = session
 		self._session.accountUpdated.connect(self._on_contacts_updated)
 		self._errorLog = errorLog
+		self._refreshes = []
+		fsAddressBookFactory = file_backend.FilesystemAddressBookFactory(
+			app.fsContactsPath, app.fsContactsCachePath
+		)
+		self._fsWatcher = file_watcher.FilesystemAddressBookWatcher(fsAddressBookFactory)
+		self._fsWatcher.addressbooksChanged.connect(self._on_addressbooks_changed)
+		self._fsWatcher.contactsChanged.connect(self._on_addressbook_contacts_changed)
 		self._addressBookFactories = [
 			null_backend.NullAddressBookFactory(),
-			file_backend.FilesystemAddressBookFactory(app.fsContactsPath),
+			fsAddressBookFactory,
 			qt_backend.QtContactsAddressBookFactory(),
 		]
+		self._mergedBook = contact_index.MergedAddressBook(
+			self.MERGED_ADDRESSBOOK, self._session.get_number_index()
+		)
+		# Only the book being viewed, the session's index is for the dialpad
+		self._searchIndex = contact_index.ContactSearchIndex()
 		self._addressBooks = []
 
 		self._listSelection = QtGui.QComboBox()
@@ -768,9 +849,14 @@ class Contacts(object):
 		self._managerLayout.addWidget(self._listSelection, 1000)
 		self._managerLayout.addWidget(self._refreshButton, 0)
 
-		self._itemStore = QtGui.QStandardItemModel()
-		self._itemStore.setHorizontalHeaderLabels(["Contacts"])
-		self._alphaItem = {}
+		self._searchEntry = QtGui.QLineEdit()
+		self._searchEntry.textChanged[str].connect(self._on_search_changed)
+		self._searchText = u""
+		self._alphaSections = ()
+
+		self._nameFont = QtGui.QFont()
+		self._nameFont.setPointSize(max(self._nameFont.pointSize() + 4, 5))
+		self._itemStore = qore_utils.SectionedItemModel(1, self._get_cell_data)
 
 		self._itemView = QtGui.QTreeView()
 		self._itemView.setModel(self._itemStore)
@@ -785,6 +871,7 @@ class Contacts(object):
 
 		self._layout = QtGui.QVBoxLayout()
 		self._layout.addLayout(self._managerLayout)
+		self._layout.addWidget(self._searchEntry)
 		self._layout.addWidget(self._itemView)
 		self._widget = QtGui.QWidget()
 		self._widget.setLayout(self._layout)
@@ -823,22 +910,59 @@ class Contacts(object):
 
 	def refresh(self, force=True):
 		self._itemView.setFocus(QtCore.Qt.OtherFocusReason)
-		self._backend.update_account(force)
+		# Only the session refreshes asynchronously
+		self._track_refresh(self._backend.update_account(force))
+
+	def cancel_refresh(self):
+		refreshes, self._refreshes = self._refreshes, []
+		for le in refreshes:
+			self._session.cancel_refresh(le)
+
+	def _track_refresh(self, le):
+		self._refreshes = [pending for pending in self._refreshes if not pending.isDone]
+		if le is not None:
+			self._refreshes.append(le)
 
 	@property
 	def _backend(self):
 		return self._addressBooks[self._listSelection.currentIndex()]["book"]
 
+	@property
+	def _backendId(self):
+		return self._addressBooks[self._listSelection.currentIndex()]["id"]
+
 	def update_addressbooks(self):
+		numberIndex = self._session.get_number_index()
+		oldSources = set(
+			book["id"]
+			for book in self._addressBooks
+			if book["book"] is not self._session and book["book"] is not self._mergedBook
+		)
+
+		# Names are only for display, two files can share one
 		self._addressBooks = [
-			{"book": book, "name": book.name}
+			{"book": book, "name": book.name, "id": book.id}
 			for factory in self._addressBookFactories
 			for book in factory.get_addressbooks()
 		]
+		# Books that are still around keep their indexed numbers
+		for book in self._addressBooks:
+			numberIndex.set_source(book["id"], book["book"].get_contacts)
+			oldSources.discard(book["id"])
+		for sourceId in oldSources:
+			numberIndex.remove_source(sourceId)
 		self._addressBooks.append(
 			{
 				"book": self._session,
-				"name": "Google Voice",
+				"name": self._session.NUMBER_INDEX_SOURCE,
+				"id": self._session.NUMBER_INDEX_SOURCE,
+			}
+		)
+		self._addressBooks.append(
+			{
+				"book": self._mergedBook,
+				"name": self._mergedBook.name,
+				"id": None,
 			}
 		)
 
@@ -854,43 +978,45 @@ class Contacts(object):
 		except ValueError:
 			# Switch over to None for the user
 			newIndex = 0
-			self._itemStore.clear()
+			self._itemStore.set_sections(())
 			_moduleLogger.info("Addressbook %r doesn't exist anymore, switching to None" % currentItem)
 		self._listSelection.addItems(bookNames)
 		self._listSelection.setCurrentIndex(newIndex)
 
 	def _populate_items(self):
-		self._itemStore.clear()
-		self._alphaItem = dict(
-			(letter, QtGui.QStandardItem(letter))
-			for letter in self._prefixes()
-		)
-		for letter in self._prefixes():
-			item = self._alphaItem[letter]
-			item.setEditable(False)
-			item.setCheckable(False)
-			row = (item, )
-			self._itemStore.appendRow(row)
-
-		for item in self._get_contacts():
+		if self._update_search_index():
+			prefixes = list(self._prefixes())
+			alphaRows = dict((letter, []) for letter in prefixes)
+			for item in self._searchIndex.contacts:
+				name = item["name"]
+				if not name:
+					name = "Unknown"
+				rowKey = name[0].upper()
+				rowKey = rowKey if rowKey in alphaRows else "#"
+				alphaRows[rowKey].append(item)
+			self._alphaSections = [
+				(letter, alphaRows[letter])
+				for letter in prefixes
+			]
+		self._show_items()
+
+	def _show_items(self):
+		if self._searchText:
+			matches = self._searchIndex.search(self._searchText)
+			self._itemStore.set_sections((("Matches", matches), ))
+		else:
+			self._itemStore.set_sections(self._alphaSections)
+		self._itemView.expandAll()
+
+	def _get_cell_data(self, item, column, role):
+		if role == QtCore.Qt.DisplayRole:
 			name = item["name"]
 			if not name:
 				name = "Unknown"
-			numbers = item["numbers"]
-
-			nameItem = QtGui.QStandardItem(name)
-			nameItem.setEditable(False)
-			nameItem.setCheckable(False)
-			nameItem.setData(item)
-			nameItemFont = nameItem.font()
-			nameItemFont.setPointSize(max(nameItemFont.pointSize() + 4, 5))
-			nameItem.setFont(nameItemFont)
-
-			row = (nameItem, )
-			rowKey = name[0].upper()
-			rowKey = rowKey if rowKey in self._alphaItem else "#"
-			self._alphaItem[rowKey].appendRow(row)
-		self._itemView.expandAll()
+			return name
+		elif role == QtCore.Qt.FontRole:
+			return self._nameFont
+		return None
 
 	def _prefixes(self):
 		return itertools.chain(string.ascii_uppercase, ("#", ))
@@ -902,10 +1028,13 @@ class Contacts(object):
 		self._itemView.scrollTo(currentIndex)
 		self._itemView.setItemSelected(self._itemView.topLevelItem(i), True)
 
-	def _get_contacts(self):
-		contacts = list(self._backend.get_contacts().itervalues())
-		contacts.sort(key=lambda contact: contact["name"].lower())
-		return contacts
+	def _update_search_index(self):
+		"""
+		@returns If the active address book changed since it was last indexed
+		"""
+		if self._backend is not self._session and self._backendId is not None:
+			self._session.get_number_index().invalidate(self._backendId)
+		return self._searchIndex.update(self._backend.get_contacts())
 
 	@qt_compat.Slot(str)
 	@misc_utils.log_exception(_moduleLogger)
@@ -915,6 +1044,13 @@ class Contacts(object):
 			self.refresh(force=False)
 			self._populate_items()
 
+	@qt_compat.Slot(str)
+	@misc_utils.log_exception(_moduleLogger)
+	def _on_search_changed(self, text):
+		with qui_utils.notify_error(self._errorLog):
+			self._searchText = unicode(text)
+			self._show_items()
+
 	@qt_compat.Slot()
 	@misc_utils.log_exception(_moduleLogger)
 	def _on_refresh_clicked(self, arg = None):
@@ -927,19 +1063,28 @@ class Contacts(object):
 		with qui_utils.notify_error(self._errorLog):
 			self._populate_items()
 
+	@qt_compat.Slot()
+	@misc_utils.log_exception(_moduleLogger)
+	def _on_addressbooks_changed(self):
+		with qui_utils.notify_error(self._errorLog):
+			self.update_addressbooks()
+
+	@qt_compat.Slot(str)
+	@misc_utils.log_exception(_moduleLogger)
+	def _on_addressbook_contacts_changed(self, bookId):
+		with qui_utils.notify_error(self._errorLog):
+			bookId = str(bookId)
+			self._session.get_number_index().invalidate(bookId)
+			if bookId == self._backendId or self._backend is self._mergedBook:
+				self._populate_items()
+
 	@qt_compat.Slot(QtCore.QModelIndex)
 	@misc_utils.log_exception(_moduleLogger)
 	def _on_row_activated(self, index):
 		with qui_utils.notify_error(self._errorLog):
-			letterIndex = index.parent()
-			if not letterIndex.isValid():
+			contactDetails = self._itemStore.get_item(index)
+			if contactDetails is None:
 				return
-			letterRow = letterIndex.row()
-			letter = list(self._prefixes())[letterRow]
-			letterItem = self._alphaItem[letter]
-			rowIndex = index.row()
-			item = letterItem.child(rowIndex, 0)
-			contactDetails = item.data()
 
 			name = unicode(contactDetails["name"])
 			if not name:
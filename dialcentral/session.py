@@ -21,6 +21,9 @@ from util import concurrent
 from util import misc as misc_utils
 
 import constants
+import contact_index
+import conversations
+import session_store
 
 
 _moduleLogger = logging.getLogger(__name__)
@@ -70,7 +73,7 @@ class Draft(QtCore.QObject):
 		assert 0 < len(self._contacts), "No contacts selected"
 		assert 0 < len(self._message), "No message to send"
 		numbers = [misc_utils.make_ugly(contact.selectedNumber) for contact in self._contacts.itervalues()]
-		le = self._asyncQueue.add_async(self._send)
+		le = self._asyncQueue.add_async(self._send, concurrent.PRIORITY_HIGH)
 		le.start(numbers, self._message)
 
 	def call(self):
@@ -78,11 +81,11 @@ class Draft(QtCore.QObject):
 		assert len(self._message) == 0, "Cannot send message with call"
 		(contact, ) = self._contacts.itervalues()
 		number = misc_utils.make_ugly(contact.selectedNumber)
-		le = self._asyncQueue.add_async(self._call)
+		le = self._asyncQueue.add_async(self._call, concurrent.PRIORITY_HIGH)
 		le.start(number)
 
 	def cancel(self):
-		le = self._asyncQueue.add_async(self._cancel)
+		le = self._asyncQueue.add_async(self._cancel, concurrent.PRIORITY_HIGH)
 		le.start()
 
 	def _get_message(self):
@@ -220,6 +223,7 @@ class Session(QtCore.QObject):
 	historyUpdated = qt_compat.Signal()
 	dndStateChange = qt_compat.Signal(bool)
 	voicemailAvailable = qt_compat.Signal(str, str)
+	voicemailProgress = qt_compat.Signal(str, int, int)
 
 	error = qt_compat.Signal(str)
 
@@ -236,21 +240,35 @@ class Session(QtCore.QObject):
 	HISTORY_PLACED = "Placed"
 	HISTORY_ALL = "All"
 
+	NUMBER_INDEX_SOURCE = "Google Voice"
+
 	_OLDEST_COMPATIBLE_FORMAT_VERSION = misc_utils.parse_version("1.3.0")
 
 	_LOGGEDOUT_TIME = -1
 	_LOGGINGIN_TIME = 0
 
+	# Interactive operations (sending, calling, refreshes) get their own
+	# workers so they never queue up behind bulk transfers
+	_INTERACTIVE_WORKERS = 2
+	_BULK_WORKERS = 1
+
+	# Newest items loaded from the cache before the UI gets its first update
+	_CACHE_FIRST_PAGE = 50
+
 	def __init__(self, errorLog, cachePath):
 		QtCore.QObject.__init__(self)
 		self._errorLog = errorLog
-		self._pool = qore_utils.FutureThread()
+		self._pool = qore_utils.FutureThread(self._INTERACTIVE_WORKERS)
 		self._asyncQueue = concurrent.AsyncTaskQueue(self._pool)
+		self._bulkPool = qore_utils.FutureThread(self._BULK_WORKERS)
+		self._bulkQueue = concurrent.AsyncTaskQueue(self._bulkPool)
 		self._backend = []
 		self._loggedInTime = self._LOGGEDOUT_TIME
 		self._loginOps = []
+		self._pendingRefreshes = {}
 		self._cachePath = cachePath
 		self._voicemailCachePath = None
+		self._voicemailDownloads = set()
 		self._username = None
 		self._password = None
 		self._draft = Draft(self._asyncQueue, self._backend, self._errorLog)
@@ -258,11 +276,24 @@ class Session(QtCore.QObject):
 		self._delayedRelogin.setInterval(0)
 		self._delayedRelogin.setSingleShot(True)
 		self._delayedRelogin.timeout.connect(self._on_delayed_relogin)
+		self._store = None
+		self._cacheBackfill = QtCore.QTimer()
+		self._cacheBackfill.setInterval(0)
+		self._cacheBackfill.setSingleShot(True)
+		self._cacheBackfill.timeout.connect(self._on_cache_backfill)
+		self._backfillMessages = False
+		self._backfillHistory = False
 
 		self._contacts = {}
+		self._numberIndex = contact_index.NumberIndex()
+		self._numberIndex.set_source(self.NUMBER_INDEX_SOURCE, self.get_contacts)
+		self._searchIndex = contact_index.ContactSearchIndex()
 		self._accountUpdateTime = datetime.datetime(1971, 1, 1)
 		self._messages = []
-		self._cleanMessages = []
+		self._conversations = conversations.ConversationStore()
+		self._messagesDelta = conversations.Delta()
+		self._unsavedMessageIds = set()
+		self._alertFingerprints = {}
 		self._messageUpdateTime = datetime.datetime(1971, 1, 1)
 		self._history = []
 		self._historyUpdateTime = datetime.datetime(1971, 1, 1)
@@ -294,13 +325,18 @@ class Session(QtCore.QObject):
 			self._backend[0:0] = [gv_backend.GVDialer(cookiePath)]
 
 		self._pool.start()
-		le = self._asyncQueue.add_async(self._login)
+		self._bulkPool.start()
+		le = self._asyncQueue.add_async(self._login, concurrent.PRIORITY_HIGH)
 		le.start(username, password)
 
 	def logout(self):
 		assert self.state != self.LOGGEDOUT_STATE, "Can only logout if logged in (currently %s" % self.state
 		_moduleLogger.info("Logging out")
 		self._pool.stop()
+		self._bulkPool.stop()
+		self._cancel_pending_refreshes()
+		# Stopped downloads never get back to the main thread to clean up
+		self._voicemailDownloads.clear()
 		self._loggedInTime = self._LOGGEDOUT_TIME
 		self._backend[0].persist()
 		self._save_to_cache()
@@ -319,6 +355,10 @@ class Session(QtCore.QObject):
 		assert self.state != self.LOGGEDOUT_STATE, "Can only logout if logged in (currently %s" % self.state
 		_moduleLogger.info("Logging out and clearing the account")
 		self._pool.stop()
+		self._bulkPool.stop()
+		self._cancel_pending_refreshes()
+		# Stopped downloads never get back to the main thread to clean up
+		self._voicemailDownloads.clear()
 		self._loggedInTime = self._LOGGEDOUT_TIME
 		self.clear()
 		self.stateChange.emit(self.LOGGEDOUT_STATE)
@@ -326,9 +366,22 @@ class Session(QtCore.QObject):
 
 	def update_account(self, force = True):
 		if not force and self._contacts:
-			return
-		le = self._asyncQueue.add_async(self._update_account), (), {}
-		self._perform_op_while_loggedin(le)
+			return None
+		return self._coalesce_refresh(self._update_account, ())
+
+	def cancel_refresh(self, le):
+		"""
+		Abandon a refresh returned by one of the update_* calls.  It keeps
+		running while anyone else that asked for it is still waiting on it.
+		"""
+		for key, pending in self._pendingRefreshes.items():
+			if pending[0] is not le:
+				continue
+			pending[1] -= 1
+			if pending[1] <= 0:
+				del self._pendingRefreshes[key]
+				le.cancel()
+			break
 
 	def refresh_connection(self):
 		le = self._asyncQueue.add_async(self._refresh_authentication)
@@ -337,26 +390,52 @@ class Session(QtCore.QObject):
 	def get_contacts(self):
 		return self._contacts
 
+	def get_number_index(self):
+		"""
+		@returns contact_index.NumberIndex shared by every address book
+		"""
+		return self._numberIndex
+
+	def get_search_index(self):
+		"""
+		@returns contact_index.ContactSearchIndex over the merged contacts of
+			every address book in the number index
+		"""
+		# The merged contacts are the same dictionary until a source changes
+		self._searchIndex.update(self._numberIndex.get_merged_contacts())
+		return self._searchIndex
+
 	def get_when_contacts_updated(self):
 		return self._accountUpdateTime
 
 	def update_messages(self, messageType, force = True):
 		if not force and self._messages:
-			return
-		le = self._asyncQueue.add_async(self._update_messages), (messageType, ), {}
-		self._perform_op_while_loggedin(le)
+			return None
+		return self._coalesce_refresh(self._update_messages, (messageType, force))
+
+	def poll_messages(self, messageType):
+		"""
+		Background check for new messages, feeds are only fetched when their
+		unread count says something changed
+		"""
+		self._coalesce_refresh(self._update_messages, (messageType, False))
 
 	def get_messages(self):
 		return self._messages
 
+	def get_messages_delta(self):
+		"""
+		@returns What the last change to the messages touched
+		"""
+		return self._messagesDelta
+
 	def get_when_messages_updated(self):
 		return self._messageUpdateTime
 
 	def update_history(self, historyType, force = True):
 		if not force and self._history:
-			return
-		le = self._asyncQueue.add_async(self._update_history), (historyType, ), {}
-		self._perform_op_while_loggedin(le)
+			return None
+		return self._coalesce_refresh(self._update_history, (historyType, ))
 
 	def get_history(self):
 		return self._history
@@ -365,11 +444,10 @@ class Session(QtCore.QObject):
 		return self._historyUpdateTime
 
 	def update_dnd(self):
-		le = self._asyncQueue.add_async(self._update_dnd), (), {}
-		self._perform_op_while_loggedin(le)
+		self._coalesce_refresh(self._update_dnd, ())
 
 	def set_dnd(self, dnd):
-		le = self._asyncQueue.add_async(self._set_dnd)
+		le = self._asyncQueue.add_async(self._set_dnd, concurrent.PRIORITY_HIGH)
 		le.start(dnd)
 
 	def is_available(self, messageId):
@@ -383,7 +461,7 @@ class Session(QtCore.QObject):
 		return actualPath
 
 	def download_voicemail(self, messageId):
-		le = self._asyncQueue.add_async(self._download_voicemail)
+		le = self._bulkQueue.add_async(self._download_voicemail)
 		le.start(messageId)
 
 	def _set_dnd(self, dnd):
@@ -412,6 +490,14 @@ class Session(QtCore.QObject):
 			return ""
 		return self._backend[0].get_account_number()
 
+	def get_fetch_stats(self):
+		"""
+		@returns (message feeds fetched, message feed fetches avoided)
+		"""
+		if self.state != self.LOGGEDIN_STATE:
+			return 0, 0
+		return self._backend[0].get_fetch_stats()
+
 	def get_callback_numbers(self):
 		if self.state != self.LOGGEDIN_STATE:
 			return {}
@@ -421,7 +507,7 @@ class Session(QtCore.QObject):
 		return self._callback
 
 	def set_callback_number(self, callback):
-		le = self._asyncQueue.add_async(self._set_callback_number)
+		le = self._asyncQueue.add_async(self._set_callback_number, concurrent.PRIORITY_HIGH)
 		le.start(callback)
 
 	def _set_callback_number(self, callback):
@@ -496,13 +582,14 @@ class Session(QtCore.QObject):
 					finalState = None # Mark it as already set
 					self._process_account_data(accountData)
 
-					if needOps:
-						loginOps = self._loginOps[:]
-					else:
-						loginOps = []
+					loginOps = self._loginOps[:]
 					del self._loginOps[:]
 					for asyncOp, args, kwds in loginOps:
-						asyncOp.start(*args, **kwds)
+						if needOps:
+							asyncOp.start(*args, **kwds)
+						else:
+							# Mark it done so it no longer absorbs refreshes
+							asyncOp.cancel()
 				else:
 					self._loggedInTime = self._LOGGEDOUT_TIME
 					self.error.emit("Error logging in")
@@ -560,11 +647,13 @@ class Session(QtCore.QObject):
 		oldDnd = self._dnd
 		oldCallback = self._callback
 
-		self._messages = []
-		self._cleanMessages = []
+		self._set_messages_delta(self._conversations.clear())
+		self._alertFingerprints = {}
 		self._history = []
 		self._dnd = False
 		self._callback = ""
+		self._backfillMessages = False
+		self._backfillHistory = False
 
 		loadedFromCache = self._load_from_cache()
 		if loadedFromCache:
@@ -582,96 +671,166 @@ class Session(QtCore.QObject):
 
 		return loadedFromCache
 
-	def _load_from_cache(self):
+	def _get_store(self):
 		if self._cachePath is None:
-			return False
-		cachePath = os.path.join(self._cachePath, "%s.cache" % self._username)
+			return None
+		cachePath = os.path.join(self._cachePath, "%s.cache.db" % self._username)
+		if self._store is not None and self._store.path != cachePath:
+			self._store.close()
+			self._store = None
+		if self._store is None:
+			self._store = session_store.SessionStore(cachePath)
+		self._store.open()
+		return self._store
 
+	def _load_from_cache(self):
 		try:
-			with open(cachePath, "rb") as f:
-				dumpedData = pickle.load(f)
-		except (pickle.PickleError, IOError, EOFError, ValueError, ImportError):
-			_moduleLogger.exception("Pickle fun loading")
+			store = self._get_store()
+			if store is None:
+				return False
+			self._import_pickled_cache(store)
+
+			version = store.get_setting("version")
+			build = store.get_setting("build")
+			if version is None:
+				return False
+
+			if misc_utils.compare_versions(
+				self._OLDEST_COMPATIBLE_FORMAT_VERSION,
+				misc_utils.parse_version(version),
+			) <= 0:
+				messages = store.load(store.MESSAGES, self._CACHE_FIRST_PAGE)
+				history = store.load(store.HISTORY, self._CACHE_FIRST_PAGE)
+				messageUpdateTime = store.get_setting("messageUpdateTime", self._messageUpdateTime)
+				historyUpdateTime = store.get_setting("historyUpdateTime", self._historyUpdateTime)
+				dnd = store.get_setting("dnd", False)
+				callback = store.get_setting("callback", "")
+			else:
+				_moduleLogger.debug(
+					"Skipping cache due to version mismatch (%s-%s)" % (
+						version, build
+					)
+				)
+				return False
+		except session_store.StoreError:
+			_moduleLogger.exception("Store fun loading")
 			return False
 		except:
 			_moduleLogger.exception("Weirdness loading")
 			return False
 
+		_moduleLogger.info("Loaded cache")
+		self._set_messages_delta(self._conversations.merge(messages))
+		self._messageUpdateTime = messageUpdateTime
+		self._history = history
+		self._historyUpdateTime = historyUpdateTime
+		self._dnd = dnd
+		self._callback = callback
+
+		self._backfillMessages = len(messages) < store.count(store.MESSAGES)
+		self._backfillHistory = len(history) < store.count(store.HISTORY)
+		if self._backfillMessages or self._backfillHistory:
+			self._cacheBackfill.start()
+		self._alert_on_messages(self._messagesDelta, isQuiet = True)
+		return True
+
+	def _import_pickled_cache(self, store):
+		"""
+		Moves the single pickle older versions cached into the store, once
+		"""
+		picklePath = os.path.join(self._cachePath, "%s.cache" % self._username)
+		if not os.path.exists(picklePath):
+			return
+
 		try:
-			version, build = dumpedData[0:2]
-		except ValueError:
-			_moduleLogger.exception("Upgrade/downgrade fun")
-			return False
+			if store.get_setting("version") is None:
+				with open(picklePath, "rb") as f:
+					(
+						version, build,
+						messages, messageUpdateTime,
+						history, historyUpdateTime,
+						dnd, callback
+					) = pickle.load(f)
+				settings = {
+					"version": version,
+					"build": build,
+					"messageUpdateTime": messageUpdateTime,
+					"historyUpdateTime": historyUpdateTime,
+					"dnd": dnd,
+					"callback": callback,
+				}
+				store.save(settings, messages, history)
+				_moduleLogger.info("Imported %s" % picklePath)
+		except session_store.StoreError:
+			_moduleLogger.exception("Store fun importing")
+			return
 		except:
-			_moduleLogger.exception("Weirdlings")
-			return False
+			_moduleLogger.exception("Weirdness importing %s" % picklePath)
 
-		if misc_utils.compare_versions(
-			self._OLDEST_COMPATIBLE_FORMAT_VERSION,
-			misc_utils.parse_version(version),
-		) <= 0:
-			try:
-				(
-					version, build,
-					messages, messageUpdateTime,
-					history, historyUpdateTime,
-					dnd, callback
-				) = dumpedData
-			except ValueError:
-				_moduleLogger.exception("Upgrade/downgrade fun")
-				return False
-			except:
-				_moduleLogger.exception("Weirdlings")
-				return False
-
-			_moduleLogger.info("Loaded cache")
-			self._messages = messages
-			self._alert_on_messages(self._messages)
-			self._messageUpdateTime = messageUpdateTime
-			self._history = history
-			self._historyUpdateTime = historyUpdateTime
-			self._dnd = dnd
-			self._callback = callback
-			return True
-		else:
-			_moduleLogger.debug(
-				"Skipping cache due to version mismatch (%s-%s)" % (
-					version, build
-				)
-			)
-			return False
+		# A broken or stale pickle will never be read either
+		try:
+			os.remove(picklePath)
+		except OSError:
+			_moduleLogger.exception("Removing %s" % picklePath)
 
 	def _save_to_cache(self):
 		_moduleLogger.info("Saving cache")
-		if self._cachePath is None:
-			return
-		cachePath = os.path.join(self._cachePath, "%s.cache" % self._username)
-
 		try:
-			dataToDump = (
-				constants.__version__, constants.__build__,
-				self._messages, self._messageUpdateTime,
-				self._history, self._historyUpdateTime,
-				self._dnd, self._callback
+			store = self._get_store()
+			if store is None:
+				return
+			if self._backfillMessages or self._backfillHistory:
+				# Don't drop the rows that were never paged in
+				self._on_cache_backfill()
+
+			settings = {
+				"version": constants.__version__,
+				"build": constants.__build__,
+				"messageUpdateTime": self._messageUpdateTime,
+				"historyUpdateTime": self._historyUpdateTime,
+				"dnd": self._dnd,
+				"callback": self._callback,
+			}
+			written, deleted = store.save(
+				settings, self._messages, self._history, self._unsavedMessageIds
 			)
-			with open(cachePath, "wb") as f:
-				pickle.dump(dataToDump, f, pickle.HIGHEST_PROTOCOL)
-			_moduleLogger.info("Cache saved")
-		except (pickle.PickleError, IOError):
+			self._unsavedMessageIds.clear()
+			_moduleLogger.info("Cache saved (%d written, %d deleted)" % (written, deleted))
+		except session_store.StoreError:
 			_moduleLogger.exception("While saving")
 
+	@misc_utils.log_exception(_moduleLogger)
+	def _on_cache_backfill(self):
+		self._cacheBackfill.stop()
+		store = self._get_store()
+		if self._backfillMessages:
+			self._backfillMessages = False
+			self._set_messages_delta(self._conversations.merge(
+				store.load(store.MESSAGES, offset = len(self._messages)),
+				isComplete = False,
+			))
+			self.messagesUpdated.emit()
+			self._alert_on_messages(self._messagesDelta, isQuiet = True)
+		if self._backfillHistory:
+			self._backfillHistory = False
+			self._history.extend(store.load(store.HISTORY, offset = len(self._history)))
+			self.historyUpdated.emit()
+
 	def _clear_cache(self):
 		updateMessages = len(self._messages) != 0
 		updateHistory = len(self._history) != 0
 		oldDnd = self._dnd
 		oldCallback = self._callback
 
-		self._messages = []
+		self._set_messages_delta(self._conversations.clear())
+		self._alertFingerprints = {}
 		self._messageUpdateTime = datetime.datetime(1971, 1, 1)
 		self._history = []
 		self._historyUpdateTime = datetime.datetime(1971, 1, 1)
 		self._dnd = False
 		self._callback = ""
+		self._backfillMessages = False
+		self._backfillHistory = False
 
 		if updateMessages:
 			self.messagesUpdated.emit()
@@ -689,22 +848,24 @@ class Session(QtCore.QObject):
 		import shutil
 		shutil.rmtree(self._voicemailCachePath, True)
 
-	def _update_messages(self, messageType):
+	def _update_messages(self, messageType, force):
 		try:
 			assert self.state == self.LOGGEDIN_STATE, "Messages requires being logged in (currently %s" % self.state
 			with qui_utils.notify_busy(self._errorLog, "Updating %s Messages" % messageType):
-				self._messages = yield (
+				messages = yield (
 					self._backend[0].get_messages,
-					(messageType, ),
+					(messageType, force),
 					{},
 				)
 		except Exception, e:
 			_moduleLogger.exception("Reporting error to user")
 			self.error.emit(str(e))
 			return
+		self._backfillMessages = False
+		self._set_messages_delta(self._conversations.merge(messages))
 		self._messageUpdateTime = datetime.datetime.now()
 		self.messagesUpdated.emit()
-		self._alert_on_messages(self._messages)
+		self._alert_on_messages(self._messagesDelta)
 
 	def _update_history(self, historyType):
 		try:
@@ -719,6 +880,7 @@ class Session(QtCore.QObject):
 			_moduleLogger.exception("Reporting error to user")
 			self.error.emit(str(e))
 			return
+		self._backfillHistory = False
 		self._historyUpdateTime = datetime.datetime.now()
 		self.historyUpdated.emit()
 
@@ -741,21 +903,34 @@ class Session(QtCore.QObject):
 
 	def _download_voicemail(self, messageId):
 		actualPath = os.path.join(self._voicemailCachePath, "%s.mp3" % messageId)
-		targetPath = "%s.%s.part" % (actualPath, time.time())
+		# A stable name lets an interrupted download pick up where it left off
+		targetPath = "%s.part" % (actualPath, )
 		if os.path.exists(actualPath):
 			self.voicemailAvailable.emit(messageId, actualPath)
 			return
-		with qui_utils.notify_busy(self._errorLog, "Downloading Voicemail"):
-			try:
-				yield (
-					self._backend[0].download,
-					(messageId, targetPath),
-					{},
-				)
-			except Exception, e:
-				_moduleLogger.exception("Passing to user")
-				self.error.emit(str(e))
-				return
+		if messageId in self._voicemailDownloads:
+			_moduleLogger.info("Already downloading %s" % messageId)
+			return
+
+		def on_progress(downloaded, total):
+			# Called from the worker thread, signals are queued to the main thread
+			self.voicemailProgress.emit(messageId, downloaded, total if total is not None else -1)
+
+		self._voicemailDownloads.add(messageId)
+		try:
+			with qui_utils.notify_busy(self._errorLog, "Downloading Voicemail"):
+				try:
+					yield (
+						self._backend[0].download,
+						(messageId, targetPath, on_progress),
+						{},
+					)
+				except Exception, e:
+					_moduleLogger.exception("Passing to user")
+					self.error.emit(str(e))
+					return
+		finally:
+			self._voicemailDownloads.discard(messageId)
 
 		if os.path.exists(actualPath):
 			try:
@@ -768,6 +943,32 @@ class Session(QtCore.QObject):
 			os.rename(targetPath, actualPath)
 			self.voicemailAvailable.emit(messageId, actualPath)
 
+	def _coalesce_refresh(self, op, args):
+		"""
+		Later callers share an identical refresh that is still pending, as its
+		results are delivered through signals
+		@returns The pending task
+		"""
+		key = op.__name__, args
+		pending = self._pendingRefreshes.get(key)
+		if pending is not None and not pending[0].isDone:
+			_moduleLogger.info("Coalescing %s%r with pending refresh" % key)
+			pending[1] += 1
+			return pending[0]
+		le = self._asyncQueue.add_async(op, concurrent.PRIORITY_LOW)
+		# The task and how many callers are waiting on it
+		self._pendingRefreshes[key] = [le, 1]
+		self._perform_op_while_loggedin((le, args, {}))
+		return le
+
+	def _cancel_pending_refreshes(self):
+		"""
+		Stopping the pool drops their queued steps, so they'd never finish
+		"""
+		pending, self._pendingRefreshes = self._pendingRefreshes, {}
+		for le, requests in pending.itervalues():
+			le.cancel()
+
 	def _perform_op_while_loggedin(self, op):
 		if self.state == self.LOGGEDIN_STATE:
 			op, args, kwds = op
@@ -789,42 +990,43 @@ class Session(QtCore.QObject):
 			# A zero contact id is the catch all for unknown contacts
 			if contactId != "0"
 		)
+		self._numberIndex.invalidate(self.NUMBER_INDEX_SOURCE)
 
 		self._accountUpdateTime = datetime.datetime.now()
 		self.accountUpdated.emit()
 
-	def _alert_on_messages(self, messages):
-		cleanNewMessages = list(self._clean_messages(messages))
-		cleanNewMessages.sort(key=lambda m: m["contactId"])
-		if self._cleanMessages:
-			if self._cleanMessages != cleanNewMessages:
-				self.newMessages.emit()
-		self._cleanMessages = cleanNewMessages
-
-	def _clean_messages(self, messages):
-		for message in messages:
-			cleaned = dict(
-				kv
-				for kv in message.iteritems()
-				if kv[0] not in
-				[
-					"relTime",
-					"time",
-					"isArchived",
-					"isRead",
-					"isSpam",
-					"isTrash",
-				]
-			)
-
-			# Don't let outbound messages cause alerts, especially if the package has only outbound
-			cleaned["messageParts"] = [
-				tuple(part[0:-1]) for part in cleaned["messageParts"] if part[0] != "Me:"
-			]
-			if not cleaned["messageParts"]:
-				continue
+	def _set_messages_delta(self, delta):
+		self._messages = self._conversations.values()
+		self._messagesDelta = delta
+		# Conversations are updated in place, so the store can't see these changes
+		self._unsavedMessageIds.update(delta.changed)
+
+	def _alert_on_messages(self, delta, isQuiet = False):
+		"""
+		Only the conversations in the delta are fingerprinted, so this stays
+		cheap no matter how many conversations there are
+		@param isQuiet Record what was seen without alerting, like for cached messages
+		"""
+		# Nothing to compare against on the first update
+		isQuiet = isQuiet or not self._alertFingerprints
+		for conversationId in delta.removed:
+			self._alertFingerprints.pop(conversationId, None)
+
+		touched = {}
+		for conversationId in delta.touched:
+			fingerprint = conversations.alert_fingerprint(self._conversations.get(conversationId))
+			if fingerprint is None:
+				self._alertFingerprints.pop(conversationId, None)
+			else:
+				touched[conversationId] = fingerprint
+		unseen = set(touched.itervalues()) - set(
+			self._alertFingerprints.get(conversationId)
+			for conversationId in touched
+		)
+		self._alertFingerprints.update(touched)
 
-			yield cleaned
+		if unseen and not isQuiet:
+			self.newMessages.emit()
 
 	@misc_utils.log_exception(_moduleLogger)
 	def _on_delayed_relogin(self):
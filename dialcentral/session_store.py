@@ -0,0 +1,220 @@
+from __future__ import with_statement
+
+import logging
+
+try:
+	import hashlib
+	_md5 = hashlib.md5
+except ImportError:
+	import md5
+	_md5 = md5.new
+
+try:
+	import cPickle
+	pickle = cPickle
+except ImportError:
+	import pickle
+
+try:
+	import sqlite3
+except ImportError:
+	from pysqlite2 import dbapi2 as sqlite3
+
+
+_moduleLogger = logging.getLogger(__name__)
+
+
+StoreError = sqlite3.Error
+
+
+class SessionStore(object):
+	"""
+	On-disk cache of an account's messages, history and settings.
+
+	Rows are keyed by conversation/call id.  The rows last loaded or saved
+	are remembered, so saving only pickles the rows that were added or
+	changed and loading can page in the newest items first
+	"""
+
+	MESSAGES = "messages"
+	HISTORY = "history"
+	_TABLES = (MESSAGES, HISTORY)
+
+	def __init__(self, path):
+		self._path = path
+		self._connection = None
+		self._fingerprints = dict((table, {}) for table in self._TABLES)
+		self._savedRows = dict((table, {}) for table in self._TABLES)
+
+	@property
+	def path(self):
+		return self._path
+
+	def open(self):
+		if self._connection is not None:
+			return
+		connection = sqlite3.connect(self._path)
+		try:
+			connection.text_factory = str
+			connection.execute(
+				"CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value BLOB)"
+			)
+			for table in self._TABLES:
+				connection.execute(
+					"CREATE TABLE IF NOT EXISTS %s (id TEXT PRIMARY KEY, time TEXT, fingerprint TEXT, data BLOB)" % table
+				)
+				connection.execute(
+					"CREATE INDEX IF NOT EXISTS %s_time ON %s (time)" % (table, table)
+				)
+			connection.commit()
+
+			for table in self._TABLES:
+				self._fingerprints[table] = dict(
+					connection.execute("SELECT id, fingerprint FROM %s" % table)
+				)
+		except:
+			connection.close()
+			raise
+		self._connection = connection
+
+	def close(self):
+		if self._connection is None:
+			return
+		self._connection.close()
+		self._connection = None
+		for table in self._TABLES:
+			self._fingerprints[table] = {}
+			self._savedRows[table] = {}
+
+	def get_setting(self, key, default = None):
+		row = self._connection.execute(
+			"SELECT value FROM settings WHERE key = ?", (key, )
+		).fetchone()
+		if row is None:
+			return default
+		return pickle.loads(str(row[0]))
+
+	def load(self, table, limit = None, offset = 0):
+		"""
+		@returns Rows, newest first
+		"""
+		assert table in self._TABLES, "Unknown table %r" % table
+		if limit is None:
+			limit = -1
+		rows = self._connection.execute(
+			"SELECT data FROM %s ORDER BY time DESC, id LIMIT ? OFFSET ?" % table,
+			(limit, offset),
+		)
+		rows = [pickle.loads(str(data)) for (data, ) in rows]
+		savedRows = self._savedRows[table]
+		for row in rows:
+			savedRows[row_key(table, row)] = row
+		return rows
+
+	def count(self, table):
+		assert table in self._TABLES, "Unknown table %r" % table
+		return len(self._fingerprints[table])
+
+	def save(self, settings, messages, history, changedIds = ()):
+		"""
+		Replace the stored contents, only writing rows that were added or changed
+		@param changedIds Keys of rows updated in place since they were last
+			loaded or saved
+		@returns (rows written, rows deleted)
+		"""
+		written = 0
+		deleted = 0
+		fingerprints = {}
+		savedRows = {}
+		with self._transaction():
+			self._connection.executemany(
+				"INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+				(
+					(key, sqlite3.Binary(pickle.dumps(value, pickle.HIGHEST_PROTOCOL)))
+					for (key, value) in settings.iteritems()
+				),
+			)
+			for table, rows in ((self.MESSAGES, messages), (self.HISTORY, history)):
+				tableWritten, tableDeleted, fingerprints[table], savedRows[table] = self._save_rows(
+					table, rows, changedIds
+				)
+				written += tableWritten
+				deleted += tableDeleted
+		# Only trust what was saved once it is committed
+		self._fingerprints.update(fingerprints)
+		self._savedRows.update(savedRows)
+		return written, deleted
+
+	def _save_rows(self, table, rows, changedIds):
+		oldFingerprints = self._fingerprints[table]
+		oldRows = self._savedRows[table]
+		newFingerprints = {}
+		newRows = {}
+		changes = []
+		for row in rows:
+			rowId = row_key(table, row)
+			newRows[rowId] = row
+			oldRow = oldRows.get(rowId)
+			if (
+				rowId in oldFingerprints and
+				rowId not in changedIds and
+				oldRow is not None and
+				(oldRow is row or oldRow == row)
+			):
+				newFingerprints[rowId] = oldFingerprints[rowId]
+				continue
+
+			data = pickle.dumps(row, pickle.HIGHEST_PROTOCOL)
+			fingerprint = _md5(data).hexdigest()
+			newFingerprints[rowId] = fingerprint
+			if oldFingerprints.get(rowId) != fingerprint:
+				changes.append((rowId, row["time"].isoformat(), fingerprint, sqlite3.Binary(data)))
+		removed = [
+			(rowId, )
+			for rowId in oldFingerprints
+			if rowId not in newFingerprints
+		]
+
+		self._connection.executemany(
+			"INSERT OR REPLACE INTO %s (id, time, fingerprint, data) VALUES (?, ?, ?, ?)" % table,
+			changes,
+		)
+		self._connection.executemany(
+			"DELETE FROM %s WHERE id = ?" % table,
+			removed,
+		)
+		return len(changes), len(removed), newFingerprints, newRows
+
+	def _transaction(self):
+		return _Transaction(self._connection)
+
+
+class _Transaction(object):
+
+	def __init__(self, connection):
+		self._connection = connection
+
+	def __enter__(self):
+		return self._connection
+
+	def __exit__(self, excType, excValue, tb):
+		if excType is None:
+			self._connection.commit()
+		else:
+			self._connection.rollback()
+		return False
+
+
+def row_key(table, row):
+	"""
+	Call ids aren't unique across the received/missed/placed feeds
+
+	>>> row_key(SessionStore.MESSAGES, {"id": "abc"})
+	'abc'
+	>>> row_key(SessionStore.HISTORY, {"id": "abc", "action": "Missed"})
+	'Missed-abc'
+	"""
+	if table == SessionStore.HISTORY:
+		return "%s-%s" % (row.get("action", ""), row["id"])
+	else:
+		return row["id"]
@@ -0,0 +1,156 @@
+import datetime
+import logging
+
+
+_moduleLogger = logging.getLogger(__name__)
+
+
+class TimeCategories(object):
+	"""
+	Buckets rows sorted newest first into sections by age and publishes the
+	visible ones to a SectionedItemModel.  Only sections whose rows changed
+	are re-filtered and re-published
+	"""
+
+	_NOW_SECTION = 0
+	_TODAY_SECTION = 1
+	_WEEK_SECTION = 2
+	_MONTH_SECTION = 3
+	_REST_SECTION = 4
+	_MAX_SECTIONS = 5
+
+	_SECTION_NAMES = ["Now", "Today", "Week", "Month", "Past"]
+	assert len(_SECTION_NAMES) == _MAX_SECTIONS
+
+	_NO_ELAPSED = datetime.timedelta(hours=1)
+	_WEEK_ELAPSED = datetime.timedelta(weeks=1)
+	_MONTH_ELAPSED = datetime.timedelta(days=30)
+
+	def __init__(self, model):
+		self._model = model
+		self._today = None
+		self._boundaries = []
+		self._sectionNames = list(self._SECTION_NAMES)
+		self._rows = [[] for i in xrange(self._MAX_SECTIONS)]
+		self._filteredRows = [{} for i in xrange(self._MAX_SECTIONS)]
+		self._filterKey = None
+		self._is_visible = None
+		self._published = None
+
+		self.update(datetime.datetime(1900, 1, 1), ())
+
+	def set_filter(self, filterKey, is_visible):
+		"""
+		Each filter's rows are picked out the first time it is used and then
+		reused until its section changes
+		@param filterKey Identifies what is_visible selects
+		"""
+		self._filterKey = filterKey
+		self._is_visible = is_visible
+		self._publish()
+
+	def update(self, newToday, items, changedIds = ()):
+		"""
+		@param items Sorted newest first, each with a "time"
+		@param changedIds Ids of items updated in place since the last update,
+			their sections are filtered again
+		"""
+		if newToday != self._today:
+			self._today = newToday
+			self._boundaries = self._calculate_boundaries(newToday)
+			self._sectionNames = self._calculate_names(newToday)
+
+		start = 0
+		for section in xrange(self._MAX_SECTIONS):
+			if section < len(self._boundaries):
+				boundary, isInclusive = self._boundaries[section]
+				end = self._find_end(items, start, boundary, isInclusive)
+			else:
+				end = len(items)
+			sectionRows = items[start:end]
+			if (
+				not self._is_same_rows(self._rows[section], sectionRows) or
+				self._has_changed_row(sectionRows, changedIds)
+			):
+				self._rows[section] = sectionRows
+				self._filteredRows[section] = {}
+			start = end
+		self._publish()
+
+	def _calculate_boundaries(self, today):
+		"""
+		@returns Per section (oldest time still in it, whether that time is included)
+		"""
+		midnight = datetime.datetime(today.year, today.month, today.day)
+		return [
+			(today - self._NO_ELAPSED, False),
+			(midnight, True),
+			(today - self._WEEK_ELAPSED, False),
+			(today - self._MONTH_ELAPSED, False),
+		]
+
+	def _calculate_names(self, today):
+		names = list(self._SECTION_NAMES)
+		try:
+			names[self._NOW_SECTION] = today.strftime("%X")
+			names[self._TODAY_SECTION] = today.strftime("%x")
+		except ValueError:
+			_moduleLogger.exception("Can't format times")
+		return names
+
+	@staticmethod
+	def _find_end(items, start, boundary, isInclusive):
+		"""
+		Binary search of the newest first items for the first one older than boundary
+		"""
+		lo, hi = start, len(items)
+		while lo < hi:
+			mid = (lo + hi) // 2
+			rowDate = items[mid]["time"]
+			if boundary < rowDate or (isInclusive and rowDate == boundary):
+				lo = mid + 1
+			else:
+				hi = mid
+		return lo
+
+	@staticmethod
+	def _is_same_rows(oldRows, newRows):
+		if len(oldRows) != len(newRows):
+			return False
+		for oldRow, newRow in zip(oldRows, newRows):
+			if oldRow is not newRow:
+				return False
+		return True
+
+	@staticmethod
+	def _has_changed_row(rows, changedIds):
+		if not changedIds:
+			return False
+		for row in rows:
+			if row.get("id") in changedIds:
+				return True
+		return False
+
+	def _publish(self):
+		if self._is_visible is None:
+			rows = list(self._rows)
+		else:
+			rows = []
+			for sectionRows, filteredRows in zip(self._rows, self._filteredRows):
+				try:
+					visibleRows = filteredRows[self._filterKey]
+				except KeyError:
+					visibleRows = [item for item in sectionRows if self._is_visible(item)]
+					filteredRows[self._filterKey] = visibleRows
+				rows.append(visibleRows)
+
+		published = zip(self._sectionNames, rows)
+		if self._published is None:
+			self._model.set_sections(published)
+		else:
+			for section, ((oldName, oldRows), (name, sectionRows)) in enumerate(zip(self._published, published)):
+				if sectionRows is not oldRows:
+					self._model.set_section_items(section, sectionRows)
+				if name != oldName:
+					self._model.set_section_name(section, name)
+		self._published = published
@@ -3,10 +3,13 @@
 from __future__ import with_statement
 
 import os
+import sys
 import errno
 import time
 import functools
 import contextlib
+import threading
+import Queue
 import logging
 
 import misc
@@ -15,15 +18,30 @@ import misc
 _moduleLogger = logging.getLogger(__name__)
 
 
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+
+class CancelledError(BaseException):
+	"""
+	Thrown into the generator of a cancelled AsyncGeneratorTask.  This is not
+	an Exception so the usual error reporting doesn't treat it as a failure
+	"""
+
+
 class AsyncTaskQueue(object):
 
 	def __init__(self, taskPool):
 		self._asyncs = []
 		self._taskPool = taskPool
 
-	def add_async(self, func):
+	def add_async(self, func, priority = PRIORITY_NORMAL):
+		"""
+		@returns The task, which doubles as the handle for cancelling it
+		"""
 		self.flush()
-		a = AsyncGeneratorTask(self._taskPool, func)
+		a = AsyncGeneratorTask(self._taskPool, func, priority)
 		self._asyncs.append(a)
 		return a
 
@@ -33,59 +51,103 @@ class AsyncTaskQueue(object):
 
 class AsyncGeneratorTask(object):
 
-	def __init__(self, pool, func):
+	def __init__(self, pool, func, priority = PRIORITY_NORMAL):
 		self._pool = pool
 		self._func = func
+		self._priority = priority
 		self._run = None
 		self._isDone = False
+		self._isCancelled = False
 
 	@property
 	def isDone(self):
 		return self._isDone
 
+	@property
+	def isCancelled(self):
+		return self._isCancelled
+
+	@property
+	def priority(self):
+		return self._priority
+
 	def start(self, *args, **kwds):
 		assert self._run is None, "Task already started"
+		if self._isCancelled:
+			_moduleLogger.debug("Not starting cancelled task: %r", self._func)
+			self._isDone = True
+			return
 		self._run = self._func(*args, **kwds)
-		trampoline, args, kwds = self._run.send(None) # priming the function
-		self._pool.add_task(
-			trampoline,
-			args,
-			kwds,
-			self.on_success,
-			self.on_error,
-		)
+		try:
+			trampoline, args, kwds = self._run.send(None) # priming the function
+		except:
+			self._isDone = True
+			raise
+		self._add_step(trampoline, args, kwds)
+
+	def cancel(self):
+		"""
+		Drop any queued step and throw CancelledError into the generator.  The
+		result of a step that is already running is ignored.
+		"""
+		if self._isDone or self._isCancelled:
+			return
+		self._isCancelled = True
+		self._pool.discard_tasks(self)
+		if self._run is not None:
+			try:
+				self._run.throw(CancelledError("Cancelled %r" % (self, )))
+			except (CancelledError, StopIteration):
+				pass
+			else:
+				_moduleLogger.warning("%r ignored cancellation", self)
+				self._run.close()
+		self._isDone = True
 
 	@misc.log_exception(_moduleLogger)
 	def on_success(self, result):
+		if self._isCancelled:
+			_moduleLogger.debug("Ignoring success for cancelled: %r", self._func)
+			return
 		_moduleLogger.debug("Processing success for: %r", self._func)
 		try:
 			trampoline, args, kwds = self._run.send(result)
 		except StopIteration, e:
 			self._isDone = True
+		except:
+			# The generator is dead, don't leave it looking pending
+			self._isDone = True
+			raise
 		else:
-			self._pool.add_task(
-				trampoline,
-				args,
-				kwds,
-				self.on_success,
-				self.on_error,
-			)
+			self._add_step(trampoline, args, kwds)
 
 	@misc.log_exception(_moduleLogger)
 	def on_error(self, error):
+		if self._isCancelled:
+			_moduleLogger.debug("Ignoring error for cancelled: %r", self._func)
+			return
 		_moduleLogger.debug("Processing error for: %r", self._func)
 		try:
 			trampoline, args, kwds = self._run.throw(error)
 		except StopIteration, e:
 			self._isDone = True
+		except:
+			# The generator is dead, don't leave it looking pending
+			self._isDone = True
+			raise
 		else:
-			self._pool.add_task(
-				trampoline,
-				args,
-				kwds,
-				self.on_success,
-				self.on_error,
-			)
+			self._add_step(trampoline, args, kwds)
+
+	def _add_step(self, trampoline, args, kwds):
+		self._pool.add_task(
+			trampoline,
+			args,
+			kwds,
+			self.on_success,
+			self.on_error,
+			self._priority,
+			self,
+		)
 
 	def __repr__(self):
 		return "<async %s at 0x%x>" % (self._func.__name__, id(self))
@@ -100,6 +162,55 @@ class AsyncGeneratorTask(object):
 		return self._func != other._func
 
 
+def run_parallel(calls, maxWorkers = 3):
+	"""
+	Run blocking calls on at most maxWorkers threads, waiting for all to finish
+	@param calls Iterable of (func, args, kwds)
+	@returns Results in the same order as calls
+	@raises The first error (in call order) raised by any of the calls
+
+	>>> run_parallel([(pow, (2, 3), {}), (max, (1, 5), {})])
+	[8, 5]
+	>>> run_parallel([])
+	[]
+	"""
+	calls = list(calls)
+	if len(calls) <= 1 or maxWorkers <= 1:
+		return [func(*args, **kwds) for (func, args, kwds) in calls]
+
+	pending = Queue.Queue()
+	for index, call in enumerate(calls):
+		pending.put((index, call))
+	results = [None] * len(calls)
+	errors = [None] * len(calls)
+
+	def consume():
+		while True:
+			try:
+				index, (func, args, kwds) = pending.get_nowait()
+			except Queue.Empty:
+				return
+			try:
+				results[index] = func(*args, **kwds)
+			except Exception:
+				errors[index] = sys.exc_info()
+
+	workers = [
+		threading.Thread(name="run_parallel", target=consume)
+		for i in xrange(min(maxWorkers, len(calls)))
+	]
+	for worker in workers:
+		worker.setDaemon(True)
+		worker.start()
+	for worker in workers:
+		worker.join()
+
+	for error in errors:
+		if error is not None:
+			raise error[0], error[1], error[2]
+	return results
+
+
 def synchronized(lock):
 	"""
 	Synchronization decorator.
@@ -161,10 +161,19 @@ class FutureThread(object):
 		for _ in algorithms.itr_available(self.__workQueue):
 			pass # eat up queue to cut down dumb work
 
-	def add_task(self, func, args, kwds, on_success, on_error):
+	def add_task(self, func, args, kwds, on_success, on_error, priority = None, owner = None):
+		"""
+		Tasks run in FIFO order, priority is accepted for compatibility
+		"""
 		task = func, args, kwds, on_success, on_error
 		self.__workQueue.put(task)
 
+	def discard_tasks(self, owner):
+		"""
+		Queued tasks can't be picked out, the cancelled task ignores their results
+		"""
+		return 0
+
 	@misc.log_exception(_moduleLogger)
 	def __trampoline_callback(self, on_success, on_error, isError, result):
 		if not self.__isRunning:
@@ -9,6 +9,7 @@ import cPickle
 import functools
 import contextlib
 import inspect
+import threading
 
 import optparse
 import traceback
@@ -596,6 +597,102 @@ class MemoizeMutable(object):
 		return self.memo[text]
 
 
+class _LruCache(object):
+	"""
+	Results age through two generations, approximating LRU while keeping
+	lookups to a couple of dict operations.  Memoized functions get called
+	from worker threads, so the generations and counters are locked
+	"""
+
+	def __init__(self, maxSize):
+		self._generationSize = max(maxSize // 2, 1)
+		self._lock = threading.Lock()
+		self._recent = {}
+		self._old = {}
+		self._hits = 0
+		self._misses = 0
+
+	def lookup(self, key):
+		with self._lock:
+			try:
+				value = self._recent[key]
+			except KeyError:
+				try:
+					value = self._old[key]
+				except KeyError:
+					self._misses += 1
+					raise
+				self._store(key, value)
+			self._hits += 1
+			return value
+
+	def store(self, key, value):
+		with self._lock:
+			self._store(key, value)
+
+	def stats(self):
+		"""
+		@returns (hits, misses)
+		"""
+		with self._lock:
+			return self._hits, self._misses
+
+	def clear(self):
+		with self._lock:
+			self._recent = {}
+			self._old = {}
+			self._hits = 0
+			self._misses = 0
+
+	def _store(self, key, value):
+		if self._generationSize <= len(self._recent):
+			self._old = self._recent
+			self._recent = {}
+		self._recent[key] = value
+
+
+def lru_memoize(maxSize):
+	"""
+	Memoize a function of hashable arguments, keeping about the maxSize most
+	recently used results.  The memoized function gains cache_stats() ->
+	(hits, misses) and cache_clear()
+
+	Equal arguments of different types, like str and unicode, are cached
+	separately since the results can differ in type too
+
+	>>> validate_decorator(lru_memoize(2))
+	>>> @lru_memoize(2)
+	... def double(x):
+	...     return 2 * x
+	>>> [double(x) for x in (1, 1, 2, 3, 4, 1)]
+	[2, 2, 4, 6, 8, 2]
+	>>> double.cache_stats()
+	(1, 5)
+	>>> double("a"), double(u"a")
+	('aa', u'aa')
+	"""
+
+	def decorator(fn):
+		cache = _LruCache(maxSize)
+
+		@functools.wraps(fn)
+		def memoized(*args):
+			key = args + tuple(type(arg) for arg in args)
+			try:
+				return cache.lookup(key)
+			except KeyError:
+				pass
+			value = fn(*args)
+			cache.store(key, value)
+			return value
+
+		memoized.cache_stats = cache.stats
+		memoized.cache_clear = cache.clear
+		return memoized
+
+	return decorator
+
+
 callTraceIndentationLevel = 0
 
 
@@ -716,6 +813,11 @@ def lexical_scope(*args):
 		del frame
 
 
+_NUMBER_CACHE_SIZE = 4096
+_NON_NUMBER_RE = re.compile("[^0-9+]")
+
+
+@lru_memoize(_NUMBER_CACHE_SIZE)
 def normalize_number(prettynumber):
 	"""
 	function to take a phone number and strip out all non-numeric
@@ -728,7 +830,7 @@ def normalize_number(prettynumber):
 	>>> normalize_number("+1-(345)-678-9000")
 	'+13456789000'
 	"""
-	uglynumber = re.sub('[^0-9+]', '', prettynumber)
+	uglynumber = _NON_NUMBER_RE.sub("", prettynumber)
 	if uglynumber.startswith("+"):
 		pass
 	elif uglynumber.startswith("1"):
@@ -787,6 +889,7 @@ def _make_pretty_international(phonenumber):
 	return prettynumber
 
 
+@lru_memoize(_NUMBER_CACHE_SIZE)
 def make_pretty(phonenumber):
 	"""
 	Function to take a phone number and return the pretty version
@@ -840,6 +943,34 @@ def make_pretty(phonenumber):
 	return prettynumber.strip()
 
 
+def make_ugly_numbers(prettynumbers):
+	"""
+	>>> make_ugly_numbers(["1-(345)-678-9000", "+012-(345)-678-90"])
+	['+13456789000', '+01234567890']
+	"""
+	normalize = normalize_number
+	return [normalize(prettynumber) for prettynumber in prettynumbers]
+
+
+def make_pretty_numbers(phonenumbers):
+	"""
+	>>> make_pretty_numbers(["2345678901", "(234) 567-8901", ""])
+	['+1 (234) 567-8901', '+1 (234) 567-8901', '']
+	"""
+	pretty = make_pretty
+	return [pretty(phonenumber) for phonenumber in phonenumbers]
+
+
+def get_number_cache_stats():
+	"""
+	@returns Dictionary of function name to (hits, misses)
+	"""
+	return {
+		"normalize_number": normalize_number.cache_stats(),
+		"make_pretty": make_pretty.cache_stats(),
+	}
+
+
 def similar_ugly_numbers(lhs, rhs):
 	return (
 		lhs == rhs or
@@ -850,6 +981,32 @@ def similar_ugly_numbers(lhs, rhs):
 	)
 
 
+def similar_number_keys(uglynumber):
+	"""
+	Every number similar_ugly_numbers treats as the same as this one.  The
+	rules aren't transitive so there is no single canonical form, instead
+	index exact numbers and probe with these
+
+	>>> similar_number_keys("+13456789000")
+	('+13456789000', '3456789000', '1+13456789000', '+1+13456789000')
+	>>> numbers = ["+13456789000", "13456789000", "3456789000", "+3456789000", "1", "+11"]
+	>>> all(
+	...     similar_ugly_numbers(lhs, rhs) == (rhs in similar_number_keys(lhs))
+	...     for lhs in numbers
+	...     for rhs in numbers
+	... )
+	True
+	"""
+	keys = [uglynumber]
+	if uglynumber.startswith("1"):
+		keys.append(uglynumber[1:])
+	if uglynumber.startswith("+1"):
+		keys.append(uglynumber[2:])
+	keys.append("1" + uglynumber)
+	keys.append("+1" + uglynumber)
+	return tuple(keys)
+
+
 def abbrev_relative_date(date):
 	"""
 	>>> abbrev_relative_date("42 hours ago")
@@ -3,12 +3,15 @@
 from __future__ import with_statement
 
 import contextlib
+import collections
+import threading
 import logging
 
 import qt_compat
 QtCore = qt_compat.QtCore
 
 import misc
+import concurrent
 
 
 _moduleLogger = logging.getLogger(__name__)
@@ -31,19 +34,28 @@ class QThread44(QtCore.QThread):
 class _WorkerThread(QtCore.QObject):
 
 	_taskComplete  = qt_compat.Signal(object)
+	_wake = qt_compat.Signal()
 
 	def __init__(self, futureThread):
 		QtCore.QObject.__init__(self)
 		self._futureThread = futureThread
-		self._futureThread._addTask.connect(self._on_task_added)
+		self._wake.connect(self._on_wake)
 		self._taskComplete.connect(self._futureThread._on_task_complete)
 
-	@qt_compat.Slot(object)
-	def _on_task_added(self, task):
-		self.__on_task_added(task)
+	@qt_compat.Slot()
+	def _on_wake(self):
+		self.__on_wake()
+
+	@misc.log_exception(_moduleLogger)
+	def __on_wake(self):
+		while True:
+			task = self._futureThread._next_task(self)
+			if task is None:
+				break
+			self.__run_task(task)
 
 	@misc.log_exception(_moduleLogger)
-	def __on_task_added(self, task):
+	def __run_task(self, task):
 		if not self._futureThread._isRunning:
 			_moduleLogger.error("Dropping task")
 
@@ -62,28 +74,87 @@ class _WorkerThread(QtCore.QObject):
 
 
 class FutureThread(QtCore.QObject):
+	"""
+	Runs tasks on a pool of worker threads, delivering the results back on
+	the thread that owns the pool.  Higher priority tasks are started first,
+	otherwise tasks are started in the order they are added; with more than
+	one worker they may finish in any order.
+	"""
 
-	_addTask = qt_compat.Signal(object)
-
-	def __init__(self):
+	def __init__(self, workerCount = 1):
 		QtCore.QObject.__init__(self)
-		self._thread = QThread44()
+		assert 0 < workerCount, "Need at least one worker (%r)" % workerCount
 		self._isRunning = False
-		self._worker = _WorkerThread(self)
-		self._worker.moveToThread(self._thread)
+		self._lock = threading.Lock()
+		self._lanes = {}
+		self._threads = []
+		self._workers = []
+		for i in xrange(workerCount):
+			thread = QThread44()
+			worker = _WorkerThread(self)
+			worker.moveToThread(thread)
+			self._threads.append(thread)
+			self._workers.append(worker)
+		self._idleWorkers = list(self._workers)
+
+	@property
+	def workerCount(self):
+		return len(self._workers)
 
 	def start(self):
-		self._thread.start()
+		for thread in self._threads:
+			thread.start()
 		self._isRunning = True
 
 	def stop(self):
 		self._isRunning = False
-		self._thread.quit()
-
-	def add_task(self, func, args, kwds, on_success, on_error):
+		with self._lock:
+			self._lanes.clear()
+		for thread in self._threads:
+			thread.quit()
+
+	def add_task(self, func, args, kwds, on_success, on_error, priority = concurrent.PRIORITY_NORMAL, owner = None):
+		"""
+		@param owner Identifies the task for discard_tasks
+		"""
 		assert self._isRunning, "Task queue not started"
 		task = func, args, kwds, on_success, on_error
-		self._addTask.emit(task)
+		with self._lock:
+			self._lanes.setdefault(priority, collections.deque()).append((owner, task))
+			worker = self._idleWorkers.pop() if self._idleWorkers else None
+		if worker is not None:
+			worker._wake.emit()
+
+	def discard_tasks(self, owner):
+		"""
+		Drop all queued (not yet running) tasks added with this owner
+		@returns The number of tasks dropped
+		"""
+		discarded = 0
+		with self._lock:
+			for priority, lane in self._lanes.iteritems():
+				kept = collections.deque(
+					(taskOwner, task)
+					for (taskOwner, task) in lane
+					if taskOwner is not owner
+				)
+				discarded += len(lane) - len(kept)
+				self._lanes[priority] = kept
+		return discarded
+
+	def _next_task(self, worker):
+		"""
+		Called from the worker threads
+		@returns The next task or None if the worker should go idle
+		"""
+		with self._lock:
+			for priority in sorted(self._lanes.iterkeys()):
+				lane = self._lanes[priority]
+				if lane:
+					owner, task = lane.popleft()
+					return task
+			self._idleWorkers.append(worker)
+			return None
 
 	@qt_compat.Slot(object)
 	def _on_task_complete(self, taskResult):
@@ -208,6 +279,114 @@ def create_tupled_list_model(*columnNames, **kwargs):
 	return TupledListModel
 
 
+class _Section(object):
+
+	def __init__(self, row, name, items):
+		self.row = row
+		self.name = name
+		self.items = items
+
+
+class SectionedItemModel(QtCore.QAbstractItemModel):
+	"""
+	Two level tree of named sections holding rows of raw items.  Nothing is
+	formatted up front, on_data(item, column, role) is only called for the
+	cells a view actually asks for
+	"""
+
+	def __init__(self, columnCount, on_data, parent = None):
+		QtCore.QAbstractItemModel.__init__(self, parent)
+		self._columnCount = columnCount
+		self._on_data = on_data
+		self._sections = []
+
+	def set_sections(self, sections):
+		"""
+		@param sections Sequence of (name, list of items)
+		"""
+		with scoped_model_reset(self):
+			self._sections = [
+				_Section(row, name, items)
+				for (row, (name, items)) in enumerate(sections)
+			]
+
+	def set_section_items(self, sectionRow, items):
+		"""
+		Replace one section's rows, leaving the other sections alone
+		"""
+		section = self._sections[sectionRow]
+		sectionIndex = self.index(sectionRow, 0)
+		if section.items:
+			self.beginRemoveRows(sectionIndex, 0, len(section.items) - 1)
+			section.items = []
+			self.endRemoveRows()
+		if items:
+			self.beginInsertRows(sectionIndex, 0, len(items) - 1)
+			section.items = items
+			self.endInsertRows()
+
+	def set_section_name(self, sectionRow, name):
+		self._sections[sectionRow].name = name
+		sectionIndex = self.index(sectionRow, 0)
+		self.dataChanged.emit(sectionIndex, sectionIndex)
+
+	def get_item(self, index):
+		"""
+		@returns The raw item for a row or None for a section header
+		"""
+		if not index.isValid():
+			return None
+		section = index.internalPointer()
+		if section is None:
+			return None
+		return section.items[index.row()]
+
+	def iter_items(self):
+		for section in self._sections:
+			for item in section.items:
+				yield item
+
+	def index(self, row, column, parent = QtCore.QModelIndex()):
+		if not self.hasIndex(row, column, parent):
+			return QtCore.QModelIndex()
+		if not parent.isValid():
+			return self.createIndex(row, column)
+		return self.createIndex(row, column, self._sections[parent.row()])
+
+	def parent(self, index):
+		if not index.isValid():
+			return QtCore.QModelIndex()
+		section = index.internalPointer()
+		if section is None:
+			return QtCore.QModelIndex()
+		return self.createIndex(section.row, 0)
+
+	def rowCount(self, parent = QtCore.QModelIndex()):
+		if not parent.isValid():
+			return len(self._sections)
+		if parent.internalPointer() is not None or parent.column() != 0:
+			return 0
+		return len(self._sections[parent.row()].items)
+
+	def columnCount(self, parent = QtCore.QModelIndex()):
+		return self._columnCount
+
+	def flags(self, index):
+		if not index.isValid():
+			return QtCore.Qt.NoItemFlags
+		return QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemIsSelectable
+
+	def data(self, index, role = QtCore.Qt.DisplayRole):
+		if not index.isValid():
+			return None
+		section = index.internalPointer()
+		if section is None:
+			if index.column() == 0 and role == QtCore.Qt.DisplayRole:
+				return self._sections[index.row()].name
+			return None
+		return self._on_data(section.items[index.row()], index.column(), role)
+
+
 @contextlib.contextmanager
 def scoped_model_reset(model):
 	model.beginResetModel()
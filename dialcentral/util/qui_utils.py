@@ -189,12 +189,20 @@ class ErrorDisplay(object):
 
 
 class QHtmlDelegate(QtGui.QStyledItemDelegate):
+	"""
+	Models can return a key for CACHE_KEY_ROLE that changes whenever the
+	html does, letting the laid out size be reused
+	"""
 
 	UNDEFINED_SIZE = -1
+	CACHE_KEY_ROLE = QtCore.Qt.UserRole + 1
+
+	_MAX_CACHED_SIZES = 2048
 
 	def __init__(self, *args, **kwd):
 		QtGui.QStyledItemDelegate.__init__(*((self, ) + args), **kwd)
 		self._width = self.UNDEFINED_SIZE
+		self._sizeCache = {}
 
 	def paint(self, painter, option, index):
 		newOption = QtGui.QStyleOptionViewItemV4(option)
@@ -240,26 +248,38 @@ class QHtmlDelegate(QtGui.QStyledItemDelegate):
 		if self._width == width:
 			return
 		self._width = width
+		self._sizeCache.clear()
 		for c in xrange(model.rowCount()):
-			cItem = model.item(c, 0)
-			for r in xrange(model.rowCount()):
-				rItem = cItem.child(r, 0)
-				rIndex = model.indexFromItem(rItem)
+			cIndex = model.index(c, 0)
+			for r in xrange(model.rowCount(cIndex)):
+				rIndex = model.index(r, 0, cIndex)
 				self.sizeHintChanged.emit(rIndex)
 				return
 
 	def sizeHint(self, option, index):
+		if self._width != self.UNDEFINED_SIZE:
+			width = self._width
+		else:
+			width = option.rect.width()
+		cacheKey = index.data(self.CACHE_KEY_ROLE)
+		if cacheKey is not None:
+			try:
+				return QtCore.QSize(self._sizeCache[(cacheKey, width)])
+			except KeyError:
+				pass
+
 		newOption = QtGui.QStyleOptionViewItemV4(option)
 		self.initStyleOption(newOption, index)
 
 		doc = QtGui.QTextDocument()
 		doc.setHtml(newOption.text)
-		if self._width != self.UNDEFINED_SIZE:
-			width = self._width
-		else:
-			width = newOption.rect.width()
 		doc.setTextWidth(width)
 		size = QtCore.QSize(doc.idealWidth(), doc.size().height())
+
+		if cacheKey is not None:
+			if self._MAX_CACHED_SIZES <= len(self._sizeCache):
+				self._sizeCache.clear()
+			self._sizeCache[(cacheKey, width)] = QtCore.QSize(size)
 		return size
 
 
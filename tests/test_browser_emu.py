@@ -0,0 +1,98 @@
+from __future__ import with_statement
+
+import socket
+import threading
+import time
+import urllib2
+
+import test_utils
+
+import sys
+sys.path.append("../src")
+
+from backends.gvoice import browser_emu
+
+
+class StubConnection(object):
+
+	def __init__(self):
+		self.isClosed = False
+
+	def close(self):
+		self.isClosed = True
+
+
+class FlakyResponse(object):
+
+	will_close = False
+
+	def __init__(self, chunks):
+		self._chunks = list(chunks)
+		self.isClosed = False
+
+	def read(self, amt = None):
+		chunk = self._chunks.pop(0)
+		if isinstance(chunk, Exception):
+			raise chunk
+		return chunk
+
+	def isclosed(self):
+		return not self._chunks
+
+	def close(self):
+		self.isClosed = True
+
+
+def test_failed_read_frees_connection():
+	pool = browser_emu.ConnectionPool(maxPerHost = 1, acquireTimeout = 0)
+	connection, isReused = pool.acquire("host", StubConnection)
+	response = FlakyResponse(["abc", socket.timeout("timed out")])
+	fp = browser_emu._PooledResponseFile(
+		response,
+		lambda isReusable: pool.release("host", connection, isReusable),
+	)
+
+	assert fp.read(3) == "abc"
+	with test_utils.expected(socket.timeout):
+		fp.read(3)
+	assert response.isClosed
+	assert connection.isClosed
+
+	nextConnection, isReused = pool.acquire("host", StubConnection)
+	assert not isReused
+	assert nextConnection is not connection
+
+
+def test_acquire_times_out():
+	pool = browser_emu.ConnectionPool(maxPerHost = 1, acquireTimeout = 0.01)
+	pool.acquire("host", StubConnection)
+	with test_utils.expected(urllib2.URLError):
+		pool.acquire("host", StubConnection)
+
+
+def test_release_wakes_waiter_for_any_host():
+	pool = browser_emu.ConnectionPool(maxPerHost = 1, acquireTimeout = 5)
+	first, isReused = pool.acquire("first", StubConnection)
+	second, isReused = pool.acquire("second", StubConnection)
+
+	acquired = []
+
+	def wait_for(key):
+		connection, isReused = pool.acquire(key, StubConnection)
+		acquired.append(key)
+
+	# The waiter for the other host is first in line for a notification
+	waiters = []
+	for key in ("first", "second"):
+		waiter = threading.Thread(target = wait_for, args = (key, ))
+		waiter.setDaemon(True)
+		waiter.start()
+		waiters.append(waiter)
+		time.sleep(0.1)
+	pool.release("second", second, True)
+	waiters[1].join(1)
+	assert acquired == ["second"]
+
+	pool.release("first", first, True)
+	waiters[0].join(1)
+	assert acquired == ["second", "first"]
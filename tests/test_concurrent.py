@@ -0,0 +1,95 @@
+from __future__ import with_statement
+
+import test_utils
+
+import sys
+sys.path.append("../src")
+
+from util import concurrent
+
+
+class StubPool(object):
+
+	def __init__(self):
+		self.tasks = []
+
+	def add_task(self, func, args, kwds, on_success, on_error, priority = concurrent.PRIORITY_NORMAL, owner = None):
+		self.tasks.append((func, args, kwds, on_success, on_error, owner))
+
+	def discard_tasks(self, owner):
+		self.tasks = [task for task in self.tasks if task[5] is not owner]
+
+	def run_next(self):
+		func, args, kwds, on_success, on_error, owner = self.tasks.pop(0)
+		try:
+			result = func(*args, **kwds)
+		except Exception, e:
+			on_error(e)
+		else:
+			on_success(result)
+
+
+def _fetch():
+	return None
+
+
+def _refresh_then_fail():
+	data = yield _fetch, (), {}
+	data["contacts"]
+
+
+def _refresh():
+	yield _fetch, (), {}
+
+
+def test_task_done_on_success():
+	pool = StubPool()
+	queue = concurrent.AsyncTaskQueue(pool)
+	task = queue.add_async(_refresh)
+	task.start()
+	assert not task.isDone
+	pool.run_next()
+	assert task.isDone
+
+
+def test_task_done_on_failure():
+	pool = StubPool()
+	queue = concurrent.AsyncTaskQueue(pool)
+	task = queue.add_async(_refresh_then_fail)
+	task.start()
+	try:
+		pool.run_next()
+	except TypeError:
+		pass
+	else:
+		assert False, "The generator's error should propagate"
+	assert task.isDone
+	assert not pool.tasks
+
+	queue.flush()
+	assert task not in queue._asyncs
+
+
+def test_task_done_on_failed_start():
+
+	def fail_immediately():
+		raise ValueError("Bad start")
+		yield
+
+	pool = StubPool()
+	task = concurrent.AsyncTaskQueue(pool).add_async(fail_immediately)
+	try:
+		task.start()
+	except ValueError:
+		pass
+	assert task.isDone
+
+
+def test_cancel():
+	pool = StubPool()
+	task = concurrent.AsyncTaskQueue(pool).add_async(_refresh)
+	task.start()
+	task.cancel()
+	assert task.isDone
+	assert task.isCancelled
+	assert not pool.tasks
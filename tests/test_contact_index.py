@@ -0,0 +1,84 @@
+from __future__ import with_statement
+
+import random
+
+import test_utils
+
+import sys
+sys.path.append("../src")
+
+import contact_index
+
+
+def _random_book(rand, prefix):
+	return dict(
+		(
+			"%s%d" % (prefix, i),
+			{
+				"name": "%s %d" % (prefix, i),
+				"numbers": [
+					{"phoneNumber": "555-%04d" % rand.randint(0, 40)}
+					for j in xrange(rand.randint(0, 2))
+				],
+			},
+		)
+		for i in xrange(rand.randint(0, 12))
+	)
+
+
+def _summary(mergedContacts):
+	return sorted(
+		(contact["contactId"], contact["name"], tuple(contact["sources"]))
+		for contact in mergedContacts.itervalues()
+	)
+
+
+def test_incremental_merge_matches_rebuild():
+	rand = random.Random(1)
+	books = dict((sourceName, {}) for sourceName in ("a", "b", "c", "d"))
+	index = contact_index.NumberIndex()
+	for sourceName in sorted(books):
+		index.set_source(sourceName, lambda sourceName = sourceName: books[sourceName])
+
+	for step in xrange(200):
+		sourceName = rand.choice(sorted(books))
+		books[sourceName] = _random_book(rand, sourceName)
+		index.invalidate(sourceName)
+		incremental = index.get_merged_contacts()
+
+		rebuilt = contact_index.NumberIndex()
+		for otherName in sorted(books):
+			rebuilt.set_source(otherName, lambda otherName = otherName: books[otherName])
+		assert _summary(incremental) == _summary(rebuilt.get_merged_contacts()), step
+
+
+def test_unchanged_source_keeps_merged_contacts():
+	books = {
+		"a": {"1": {"name": "Ann", "numbers": [{"phoneNumber": "555-0001"}]}},
+		"b": {"x": {"name": "Bob", "numbers": [{"phoneNumber": "555-0002"}]}},
+	}
+	index = contact_index.NumberIndex()
+	index.set_source("a", lambda: books["a"])
+	index.set_source("b", lambda: books["b"])
+	merged = index.get_merged_contacts()
+	assert index.get_merged_contacts() is merged
+
+	books["b"] = {"y": {"name": "Bobby", "numbers": [{"phoneNumber": "555-0002"}]}}
+	index.invalidate("b")
+	updated = index.get_merged_contacts()
+	assert updated is not merged
+	assert updated["a-1"] is merged["a-1"]
+	assert "b-x" not in updated
+	assert updated["b-y"]["name"] == "Bobby"
+
+
+def test_sources_with_the_same_name():
+	index = contact_index.NumberIndex()
+	index.set_source("/home/user/contacts.csv", lambda: {
+		"1": {"name": "Ann", "numbers": [{"phoneNumber": "555-0001"}]},
+	})
+	index.set_source("/home/user/work/contacts.csv", lambda: {
+		"1": {"name": "Bob", "numbers": [{"phoneNumber": "555-0002"}]},
+	})
+	names = sorted(contact["name"] for contact in index.get_merged_contacts().itervalues())
+	assert names == ["Ann", "Bob"]
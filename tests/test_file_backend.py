@@ -1,7 +1,10 @@
 from __future__ import with_statement
 
 import os
-import warnings
+import shutil
+import logging
+import tempfile
+import cPickle
 
 import test_utils
 
@@ -11,145 +14,275 @@ sys.path.append("../src")
 from backends import file_backend
 
 
+_DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "basic_data")
+
+
+def _numbers(contact):
+	return sorted(
+		(number["phoneType"], number["phoneNumber"])
+		for number in contact["numbers"]
+	)
+
+
+def _open_book(name, cacheDir = None):
+	return file_backend.CsvAddressBook(name, os.path.join(_DATA_PATH, "%s.csv" % name), cacheDir)
+
+
 def test_factory():
-	warnings.simplefilter("always")
-	try:
-		csvPath = os.path.join(os.path.dirname(__file__), "basic_data")
-		factory = file_backend.FilesystemAddressBookFactory(csvPath)
-		assert factory.factory_name() == "File"
-		abooks = list(factory.get_addressbooks())
-		abooks.sort()
-		assert len(abooks) == 4
-		abookNames = [abook[2] for abook in abooks]
-		assert abookNames == ["basic", "empty", "google", "grandcentral"], "%s" % abookNames
-
-		for abook_factory, abookId, abookName in abooks:
-			abook = abook_factory.open_addressbook(abookId)
-			assert isinstance(abook, file_backend.CsvAddressBook)
-	finally:
-		warnings.resetwarnings()
+	factory = file_backend.FilesystemAddressBookFactory(_DATA_PATH)
+	abooks = factory.get_addressbooks()
+	abookNames = [abook.name for abook in abooks]
+	assert abookNames == ["basic", "empty", "google", "grandcentral"], "%s" % abookNames
+	for abook in abooks:
+		assert isinstance(abook, file_backend.CsvAddressBook)
+		assert abook.id == abook.path
 
 
 def test_nonexistent_csv():
-	warnings.simplefilter("always")
-	try:
-		csvPath = os.path.join(os.path.dirname(__file__), "basic_data", "nonexistent.csv")
-		abook = file_backend.CsvAddressBook(csvPath)
+	abook = _open_book("nonexistent")
+	assert abook.get_contacts() == {}
+
+
+def test_empty_csv():
+	abook = _open_book("empty")
+	assert abook.get_contacts() == {}
+
+
+def test_basic_csv():
+	abook = _open_book("basic")
+	contacts = abook.get_contacts()
+	assert len(contacts) == 1
+
+	contact = contacts["0"]
+	assert contact["name"] == "Last, First"
+	assert contact["contactId"] == "basic-0"
+	assert _numbers(contact) == [("phone", "555-123-4567")], "%s" % _numbers(contact)
+
+
+def test_google_csv():
+	abook = _open_book("google")
+	contacts = abook.get_contacts()
+	assert len(contacts) == 2
+
+	assert contacts["0"]["name"] == "First Last"
+	assert _numbers(contacts["0"]) == [
+		("Section 2 - Mobile", "5551234567"),
+		("Section 2 - Phone", "17471234567"),
+	], "%s" % _numbers(contacts["0"])
+
+	assert contacts["1"]["name"] == "First1 Last"
+	assert _numbers(contacts["1"]) == [("Section 1 - Mobile", "5557654321")], "%s" % _numbers(contacts["1"])
+
+
+def test_grandcentral_csv():
+	abook = _open_book("grandcentral")
+	contacts = abook.get_contacts()
+	assert len(contacts) == 2
+
+	assert contacts["0"]["name"] == "First Last"
+	assert _numbers(contacts["0"]) == [
+		("Business Phone", "5559988899"),
+		("Home Phone", "5559983254"),
+		("Mobile Phone", "5554023626"),
+	], "%s" % _numbers(contacts["0"])
+
+	assert contacts["1"]["name"] == "First1 Last"
+	assert _numbers(contacts["1"]) == [("Home Phone", "5556835460")], "%s" % _numbers(contacts["1"])
+
 
-		assert abook.factory_name() == "csv"
+def test_records_look_like_dicts():
+	number = file_backend.CsvNumber(u"Mobile", "555-1234")
+	contact = file_backend.CsvContact("book-0", u"Bob", (number, ))
 
-		contacts = list(abook.get_contacts())
-		assert len(contacts) == 0
+	assert contact["name"] == u"Bob"
+	assert contact.get("name") == u"Bob"
+	assert contact.get("location", "") == ""
+	assert "numbers" in contact
+	assert "location" not in contact
+	with test_utils.expected(KeyError):
+		contact["location"]
+	assert sorted(contact.keys()) == ["contactId", "name", "numbers"]
+	assert dict(number.iteritems()) == {"phoneType": u"Mobile", "phoneNumber": "555-1234"}
+
+	copied = cPickle.loads(cPickle.dumps(contact, cPickle.HIGHEST_PROTOCOL))
+	assert copied["contactId"] == "book-0"
+	assert copied["numbers"][0]["phoneNumber"] == "555-1234"
+
+
+class TempContacts(object):
+
+	def __init__(self):
+		self.root = tempfile.mkdtemp()
+		self.contactsDir = os.path.join(self.root, "contacts")
+		self.cacheDir = os.path.join(self.root, "cache")
+		os.makedirs(self.contactsDir)
+		self.csvPath = os.path.join(self.contactsDir, "friends.csv")
+
+	def write(self, *rows):
+		with open(self.csvPath, "w") as f:
+			f.write("Name,Phone\n")
+			for row in rows:
+				f.write("%s\n" % row)
+
+	def open_book(self):
+		return file_backend.CsvAddressBook("friends", self.csvPath, self.cacheDir)
+
+	def close(self):
+		shutil.rmtree(self.root, True)
+
+
+def _forbid_parsing(book):
+
+	def read_csv(csvPath):
+		assert False, "%s should have come from the cache" % csvPath
+
+	book._read_csv = read_csv
+
+
+def test_cache_hit():
+	temp = TempContacts()
+	try:
+		temp.write("Bob,555-1234")
+		assert temp.open_book().get_contacts()["0"]["name"] == "Bob"
+		assert os.listdir(temp.contactsDir) == ["friends.csv"]
+		assert len(os.listdir(temp.cacheDir)) == 1
+
+		book = temp.open_book()
+		_forbid_parsing(book)
+		assert book.get_contacts()["0"]["name"] == "Bob"
 	finally:
-		warnings.resetwarnings()
+		temp.close()
 
 
-def test_empty_csv():
-	warnings.simplefilter("always")
+def test_cache_invalidated_by_size():
+	temp = TempContacts()
 	try:
-		csvPath = os.path.join(os.path.dirname(__file__), "basic_data", "empty.csv")
-		abook = file_backend.CsvAddressBook(csvPath)
+		temp.write("Bob,555-1234")
+		temp.open_book().get_contacts()
+
+		temp.write("Bob,555-1234", "Ann,555-9999")
+		assert len(temp.open_book().get_contacts()) == 2
+	finally:
+		temp.close()
 
-		assert abook.factory_name() == "csv"
 
-		contacts = list(abook.get_contacts())
-		assert len(contacts) == 0
+def test_cache_invalidated_by_mtime():
+	temp = TempContacts()
+	try:
+		temp.write("Bob,555-1234")
+		stat = os.stat(temp.csvPath)
+		temp.open_book().get_contacts()
+
+		temp.write("Ann,555-1234")
+		os.utime(temp.csvPath, (stat.st_atime, stat.st_mtime + 10))
+		assert temp.open_book().get_contacts()["0"]["name"] == "Ann"
 	finally:
-		warnings.resetwarnings()
+		temp.close()
 
 
-def test_basic_csv():
-	warnings.simplefilter("always")
+def test_cache_invalidated_by_inode():
+	temp = TempContacts()
 	try:
-		csvPath = os.path.join(os.path.dirname(__file__), "basic_data", "basic.csv")
-		abook = file_backend.CsvAddressBook(csvPath)
+		temp.write("Bob,555-1234")
+		stat = os.stat(temp.csvPath)
+		temp.open_book().get_contacts()
+
+		# Saving by rename keeps the size and can keep the mtime
+		replacement = os.path.join(temp.root, "replacement.csv")
+		with open(replacement, "w") as f:
+			f.write("Name,Phone\nAnn,555-1234\n")
+		os.utime(replacement, (stat.st_atime, stat.st_mtime))
+		os.rename(replacement, temp.csvPath)
+		assert os.stat(temp.csvPath).st_size == stat.st_size
+		assert temp.open_book().get_contacts()["0"]["name"] == "Ann"
+	finally:
+		temp.close()
 
-		assert abook.factory_name() == "csv"
 
-		contacts = list(abook.get_contacts())
-		contacts.sort()
-		assert len(contacts) == 1
+def test_unwritable_cache():
+	temp = TempContacts()
+	logger = logging.getLogger(file_backend.__name__)
+	oldLevel = logger.level
+	logger.setLevel(logging.CRITICAL)
+	try:
+		temp.write("Bob,555-1234")
+		# Something that isn't a directory is in the way
+		with open(temp.cacheDir, "w") as f:
+			f.write("")
+		assert temp.open_book().get_contacts()["0"]["name"] == "Bob"
+		assert os.listdir(temp.contactsDir) == ["friends.csv"]
+	finally:
+		logger.setLevel(oldLevel)
+		temp.close()
 
-		contactId, contactName = contacts[0]
-		assert contactName == "Last, First"
-		assert abook.contact_source_short_name(contactId) == "csv"
 
-		details = list(abook.get_contact_details(contactId))
-		assert len(details) == 1
-		details.sort()
-		assert details == [("phone", "555-123-4567")], "%s" % details
+def test_factory_rescan():
+	temp = TempContacts()
+	try:
+		temp.write("Bob,555-1234")
+		factory = file_backend.FilesystemAddressBookFactory(temp.contactsDir, temp.cacheDir)
+		factory.set_watched(True)
+		added, removed = factory.rescan()
+		assert added == [temp.csvPath] and removed == []
+		(book, ) = factory.get_addressbooks()
+		assert factory.get_directories() == [temp.contactsDir]
+
+		otherPath = os.path.join(temp.contactsDir, "work.csv")
+		with open(otherPath, "w") as f:
+			f.write("Name,Phone\nAnn,555-9999\n")
+		with open(os.path.join(temp.contactsDir, "notes.txt"), "w") as f:
+			f.write("Not contacts\n")
+		# Watched factories leave rescanning to the watcher
+		assert factory.get_addressbooks() == [book]
+
+		added, removed = factory.rescan()
+		assert added == [otherPath] and removed == []
+		books = factory.get_addressbooks()
+		assert [other.name for other in books] == ["friends", "work"]
+		assert books[0] is book
+
+		os.remove(temp.csvPath)
+		added, removed = factory.rescan()
+		assert added == [] and removed == [temp.csvPath]
+		assert [other.name for other in factory.get_addressbooks()] == ["work"]
 	finally:
-		warnings.resetwarnings()
+		temp.close()
 
 
-def test_google_csv():
-	warnings.simplefilter("always")
+def test_unwatched_factory_rescans():
+	temp = TempContacts()
 	try:
-		csvPath = os.path.join(os.path.dirname(__file__), "basic_data", "google.csv")
-		abook = file_backend.CsvAddressBook(csvPath)
-
-		assert abook.factory_name() == "csv"
-
-		contacts = list(abook.get_contacts())
-		contacts.sort()
-		assert len(contacts) == 2
-
-		contactId, contactName = contacts[0]
-		assert contactName == "First Last"
-		assert abook.contact_source_short_name(contactId) == "csv"
-
-		details = list(abook.get_contact_details(contactId))
-		assert len(details) == 2
-		details.sort()
-		assert details == [
-			("Section 2 - Mobile", "5551234567"),
-			("Section 2 - Phone", "17471234567"),
-		], "%s" % details
-
-		contactId, contactName = contacts[1]
-		assert contactName == "First1 Last"
-		assert abook.contact_source_short_name(contactId) == "csv"
-
-		details = list(abook.get_contact_details(contactId))
-		assert len(details) == 1
-		details.sort()
-		assert details == [("Section 1 - Mobile", "5557654321")], "%s" % details
+		factory = file_backend.FilesystemAddressBookFactory(temp.contactsDir, temp.cacheDir)
+		assert factory.get_addressbooks() == []
+		temp.write("Bob,555-1234")
+		assert [book.name for book in factory.get_addressbooks()] == ["friends"]
 	finally:
-		warnings.resetwarnings()
+		temp.close()
 
 
-def test_grandcentral_csv():
-	warnings.simplefilter("always")
+def test_factory_reload():
+	temp = TempContacts()
 	try:
-		csvPath = os.path.join(os.path.dirname(__file__), "basic_data", "grandcentral.csv")
-		abook = file_backend.CsvAddressBook(csvPath)
-
-		assert abook.factory_name() == "csv"
-
-		contacts = list(abook.get_contacts())
-		contacts.sort()
-		assert len(contacts) == 2
-
-		contactId, contactName = contacts[0]
-		assert contactName == "First Last"
-		assert abook.contact_source_short_name(contactId) == "csv"
-
-		details = list(abook.get_contact_details(contactId))
-		assert len(details) == 3
-		details.sort()
-		assert details == [
-			("Business Phone", "5559988899"),
-			("Home Phone", "5559983254"),
-			("Mobile Phone", "5554023626"),
-		], "%s" % details
-
-		contactId, contactName = contacts[1]
-		assert contactName == "First1 Last"
-		assert abook.contact_source_short_name(contactId) == "csv"
-
-		details = list(abook.get_contact_details(contactId))
-		assert len(details) == 1
-		details.sort()
-		assert details == [("Home Phone", "5556835460")], "%s" % details
+		temp.write("Bob,555-1234")
+		factory = file_backend.FilesystemAddressBookFactory(temp.contactsDir, temp.cacheDir)
+		factory.set_watched(True)
+		factory.rescan()
+		(book, ) = factory.get_addressbooks()
+
+		# Nothing to pick up for books that were never read
+		assert factory.reload(temp.csvPath) is None
+		contacts = book.get_contacts()
+		assert factory.reload(temp.csvPath) is None
+		assert book.reload() is False
+		assert book.get_contacts() is contacts
+
+		stat = os.stat(temp.csvPath)
+		temp.write("Bob,555-1234", "Ann,555-9999")
+		os.utime(temp.csvPath, (stat.st_atime, stat.st_mtime + 10))
+		assert factory.reload(temp.csvPath) is book
+		assert len(book.get_contacts()) == 2
+		assert book.reload() is False
+
+		assert factory.reload(os.path.join(temp.contactsDir, "missing.csv")) is None
 	finally:
-		warnings.resetwarnings()
+		temp.close()
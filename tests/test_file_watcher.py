@@ -0,0 +1,165 @@
+from __future__ import with_statement
+
+import os
+import shutil
+import tempfile
+
+import test_utils
+
+import sys
+sys.path.append("../src")
+
+import util.qt_compat as qt_compat
+QtCore = qt_compat.QtCore
+
+from backends import file_watcher
+
+
+_APP = None
+
+
+def setup():
+	global _APP
+	_APP = QtCore.QCoreApplication.instance()
+	if _APP is None:
+		_APP = QtCore.QCoreApplication([])
+
+
+class StubBook(object):
+
+	def __init__(self, path):
+		self.path = path
+		self.id = path
+		self.name = os.path.basename(path)
+
+
+class StubFactory(object):
+
+	def __init__(self, directories, paths):
+		self.directories = directories
+		self.books = [StubBook(path) for path in paths]
+		self.rescans = 0
+		self.reloads = []
+		self.isWatched = False
+
+	def set_watched(self, isWatched):
+		self.isWatched = isWatched
+
+	def get_directories(self):
+		return self.directories
+
+	def get_addressbooks(self):
+		return self.books
+
+	def rescan(self):
+		self.rescans += 1
+		return [], []
+
+	def reload(self, path):
+		self.reloads.append(path)
+		for book in self.books:
+			if book.path == path:
+				return book
+		return None
+
+
+class TempBooks(object):
+
+	def __init__(self, *names):
+		self.root = tempfile.mkdtemp()
+		self.paths = []
+		for name in names:
+			path = os.path.join(self.root, name)
+			with open(path, "w") as f:
+				f.write("Name,Phone\n")
+			self.paths.append(path)
+
+	def close(self):
+		shutil.rmtree(self.root, True)
+
+
+def _collect(signal):
+	emitted = []
+	signal.connect(lambda *args: emitted.append(args))
+	return emitted
+
+
+def test_changes_wait_to_settle():
+	setup()
+	temp = TempBooks("friends.csv")
+	try:
+		factory = StubFactory([temp.root], temp.paths)
+		watcher = file_watcher.FilesystemAddressBookWatcher(factory)
+		changed = _collect(watcher.contactsChanged)
+		assert factory.isWatched
+		assert not watcher.isPolling
+
+		watcher._on_file_changed(temp.paths[0])
+		watcher._on_file_changed(temp.paths[0])
+		assert watcher._settleTimer.isActive()
+		assert watcher._settleTimer.isSingleShot()
+		assert watcher._settleTimer.interval() == 500
+		assert factory.reloads == []
+
+		watcher._on_settled()
+		assert factory.reloads == temp.paths
+		assert [args[0] for args in changed] == temp.paths
+		watcher.stop()
+		assert not factory.isWatched
+	finally:
+		temp.close()
+
+
+def test_only_changed_file_is_reloaded():
+	setup()
+	temp = TempBooks("family.csv", "friends.csv", "work.csv")
+	try:
+		factory = StubFactory([temp.root], temp.paths)
+		watcher = file_watcher.FilesystemAddressBookWatcher(factory)
+		rescans = factory.rescans
+
+		watcher._on_file_changed(temp.paths[1])
+		watcher._on_settled()
+		assert factory.reloads == [temp.paths[1]]
+		assert factory.rescans == rescans
+		watcher.stop()
+	finally:
+		temp.close()
+
+
+def test_directory_change_rescans():
+	setup()
+	temp = TempBooks("friends.csv")
+	try:
+		factory = StubFactory([temp.root], temp.paths)
+		watcher = file_watcher.FilesystemAddressBookWatcher(factory)
+		rescans = factory.rescans
+
+		watcher._on_directory_changed(temp.root)
+		watcher._on_settled()
+		assert factory.rescans == rescans + 1
+		assert factory.reloads == []
+		watcher.stop()
+	finally:
+		temp.close()
+
+
+def test_unwatchable_paths_are_polled():
+	setup()
+	temp = TempBooks()
+	try:
+		# Paths that don't exist can't be watched
+		missing = os.path.join(temp.root, "missing")
+		paths = [os.path.join(missing, "friends.csv")]
+		factory = StubFactory([missing], paths)
+		watcher = file_watcher.FilesystemAddressBookWatcher(factory)
+		assert watcher.isPolling
+
+		rescans = factory.rescans
+		watcher._on_poll()
+		assert factory.rescans == rescans + 1
+		assert factory.reloads == paths
+		watcher.stop()
+		assert not watcher.isPolling
+	finally:
+		temp.close()
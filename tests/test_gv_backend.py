@@ -52,3 +52,80 @@ def test_not_logged_in():
 			messages = list(backend.get_messages())
 	finally:
 		gv_backend.browser_emu = RealBrowser
+
+
+_SMS_FEED = """<response><json><![CDATA[%s]]></json><html><![CDATA[%s]]></html></response>""" % (
+	'{"messages": {"m1": {"isRead": false, "isSpam": false, "isTrash": false, "labels": ["inbox"]}}}',
+	"\n".join([
+		'<div id="m1" class="gc-message gc-message-unread">',
+		'<span class="gc-message-time">10/15/11 3:04 PM</span>',
+		'<a class="gc-under gc-message-name-link" href="javascript:void(0)">Bob</a>',
+		'<span class="gc-message-type">(555) 123-4567 - mobile</span>',
+		'<input type="hidden" class="gc-text gc-quickcall-ac" value="+15551234567"/>',
+		'<span class="gc-message-sms-from">Bob:</span> <span class="gc-message-sms-text">hi</span> <span class="gc-message-sms-time">3:04 PM</span>',
+		'</div>',
+	]),
+)
+
+_EMPTY_FEED = """<response><json><![CDATA[{"messages": {}}]]></json><html><![CDATA[<div/>]]></html></response>"""
+
+
+class StubBrowser(object):
+
+	def __init__(self, backend):
+		gvoiceBackend = backend._gvoice
+		self.unreadSms = 0
+		self.pages = {
+			gvoiceBackend._XML_SMS_URL: lambda: _SMS_FEED,
+			gvoiceBackend._XML_VOICEMAIL_URL: lambda: _EMPTY_FEED,
+			gvoiceBackend._JSON_SMS_COUNT_URL: lambda: '{"unreadCounts": {"sms": %d, "voicemail": 0}}' % self.unreadSms,
+		}
+		self.urls = []
+		self._unreadUrl = gvoiceBackend._JSON_SMS_COUNT_URL
+
+	@property
+	def probes(self):
+		return self.urls.count(self._unreadUrl)
+
+	def fetches(self, url):
+		return self.urls.count(url)
+
+	def download(self, url, postdata = None, extraheaders = None, *args, **kwds):
+		self.urls.append(url)
+		return self.pages[url]()
+
+
+def _stub_backend():
+	backend = gv_backend.GVDialer()
+	browser = StubBrowser(backend)
+	backend._gvoice._browser = browser
+	return backend, browser
+
+
+def test_unforced_refresh_skips_unchanged_feed():
+	backend, browser = _stub_backend()
+	smsUrl = backend._gvoice._XML_SMS_URL
+	(message, ) = backend.get_messages(backend.MESSAGE_TEXTS, force = False)
+	assert message["id"] == "m1"
+	assert message["messageParts"][0][0] == "Bob:"
+	assert browser.probes == 1
+	assert browser.fetches(smsUrl) == 1
+
+	messages = backend.get_messages(backend.MESSAGE_TEXTS, force = False)
+	assert [message["id"] for message in messages] == ["m1"]
+	assert browser.probes == 2
+	assert browser.fetches(smsUrl) == 1
+	assert backend.get_fetch_stats()[1] == 1
+
+	browser.unreadSms = 1
+	backend.get_messages(backend.MESSAGE_TEXTS, force = False)
+	assert browser.fetches(smsUrl) == 2
+
+
+def test_forced_refresh_skips_probe():
+	backend, browser = _stub_backend()
+	smsUrl = backend._gvoice._XML_SMS_URL
+	backend.get_messages(backend.MESSAGE_TEXTS, force = True)
+	backend.get_messages(backend.MESSAGE_TEXTS, force = True)
+	assert browser.probes == 0
+	assert browser.fetches(smsUrl) == 2
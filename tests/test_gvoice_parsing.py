@@ -0,0 +1,205 @@
+from __future__ import with_statement
+
+import re
+import random
+import logging
+import itertools
+
+import test_utils
+
+import sys
+sys.path.append("../src")
+
+from backends.gvoice import gvoice
+
+
+# The per-field searches the single pass scan replaced, kept as a reference
+_SEPERATE_REGEX = re.compile(r"""^\s*<div id="(\w+)"\s* class=".*?gc-message.*?">""", re.MULTILINE | re.DOTALL)
+_EXACT_TIME_REGEX = re.compile(r"""<span class="gc-message-time">(.*?)</span>""", re.MULTILINE)
+_RELATIVE_TIME_REGEX = re.compile(r"""<span class="gc-message-relative">(.*?)</span>""", re.MULTILINE)
+_NAME_REGEX = re.compile(r"""<a class=.*?gc-message-name-link.*?>(.*?)</a>""", re.MULTILINE | re.DOTALL)
+_NUMBER_REGEX = re.compile(r"""<input type="hidden" class="gc-text gc-quickcall-ac" value="(.*?)"/>""", re.MULTILINE)
+_PRETTY_NUMBER_REGEX = re.compile(r"""<span class="gc-message-type">(.*?)</span>""", re.MULTILINE)
+_LOCATION_REGEX = re.compile(r"""<span class="gc-message-location">.*?<a.*?>(.*?)</a></span>""", re.MULTILINE)
+_CONTACT_ID_REGEX = re.compile(r"""<a class=".*?gc-message-name-link.*?">.*?</a>\s*?<span .*?>(.*?)</span>""", re.MULTILINE)
+_WORD_REGEX = re.compile(r"""(<span id="\d+-\d+" class="gc-word-(.*?)">(.*?)</span>|<a .*? class="gc-message-mni">(.*?)</a>)""", re.MULTILINE)
+_SMS_FROM_REGEX = re.compile(r"""<span class="gc-message-sms-from">(.*?)</span>""", re.MULTILINE | re.DOTALL)
+_SMS_TIME_REGEX = re.compile(r"""<span class="gc-message-sms-time">(.*?)</span>""", re.MULTILINE | re.DOTALL)
+_SMS_TEXT_REGEX = re.compile(r"""<span class="gc-message-sms-text">(.*?)</span>""", re.MULTILINE | re.DOTALL)
+
+
+def _search(regex, html):
+	group = regex.search(html)
+	return group.group(1).strip() if group else ""
+
+
+def _baseline_fields(html):
+	return {
+		"contactId": _search(_CONTACT_ID_REGEX, html),
+		"name": gvoice.unescape(_search(_NAME_REGEX, html)),
+		"time": gvoice.google_strptime(_search(_EXACT_TIME_REGEX, html)),
+		"relTime": _search(_RELATIVE_TIME_REGEX, html),
+		"prettyNumber": _search(_PRETTY_NUMBER_REGEX, html),
+		"number": _search(_NUMBER_REGEX, html),
+		"location": gvoice.unescape(_search(_LOCATION_REGEX, html)),
+	}
+
+
+def _baseline_history(html):
+	splitHtml = _SEPERATE_REGEX.split(html)
+	for messageId, messageHtml in gvoice.itergroup(splitHtml[1:], 2):
+		fields = _baseline_fields(messageHtml)
+		fields["id"] = messageId.strip()
+		yield fields
+
+
+def _baseline_voicemail(html):
+	splitHtml = _SEPERATE_REGEX.split(html)
+	for messageId, messageHtml in gvoice.itergroup(splitHtml[1:], 2):
+		fields = _baseline_fields(messageHtml)
+		words = [
+			(group.group(2), group.group(3), group.group(4))
+			for group in _WORD_REGEX.finditer(messageHtml)
+		]
+		yield messageId.strip(), fields, [
+			_text_summary(gvoice.GVoiceBackend._interpret_voicemail_word(*word))
+			for word in words
+		]
+
+
+def _baseline_sms(html):
+	splitHtml = _SEPERATE_REGEX.split(html)
+	for messageId, messageHtml in gvoice.itergroup(splitHtml[1:], 2):
+		fields = _baseline_fields(messageHtml)
+		fields["location"] = ""
+		froms = [group.group(1).strip() for group in _SMS_FROM_REGEX.finditer(messageHtml)]
+		texts = [group.group(1).strip() for group in _SMS_TEXT_REGEX.finditer(messageHtml)]
+		times = [group.group(1).strip() for group in _SMS_TIME_REGEX.finditer(messageHtml)]
+		yield messageId.strip(), fields, [
+			(fromPart, gvoice.unescape(textPart), timePart)
+			for (fromPart, textPart, timePart) in itertools.izip(froms, texts, times)
+		]
+
+
+def _text_summary(text):
+	return text.accuracy, text.text
+
+
+def _conversation_fields(conv):
+	return {
+		"contactId": conv.contactId,
+		"name": conv.name,
+		"time": conv.time,
+		"relTime": conv.relTime,
+		"prettyNumber": conv.prettyNumber,
+		"number": conv.number,
+		"location": conv.location,
+	}
+
+
+_FIELD_LINES = [
+	'<span class="gc-message-time">10/15/11 3:04 PM</span>',
+	'<span class="gc-message-relative">2 hours ago</span>',
+	'<a class="gc-under gc-message-name-link" title="" href="javascript:void(0)">Bob &amp; Co</a>\n<span class="gc-nobold">c1234</span>',
+	'<span class="gc-message-type">(555) 123-4567 - mobile</span>',
+	'<span class="gc-message-location"><a class="gc-under" href="javascript:void(0)">Springfield, IL</a></span>',
+	'<input type="hidden" class="gc-text gc-quickcall-ac" value="+15551234567"/>',
+]
+
+_VOICEMAIL_LINES = [
+	'<span id="1-1" class="gc-word-high">Hello</span> <span id="1-2" class="gc-word-med1">there</span>',
+	'<span id="1-3" class="gc-word-med2">call</span> <a href="javascript:void(0)" class="gc-message-mni">555-1212</a>',
+]
+
+_SMS_LINES = [
+	'<span class="gc-message-sms-from">Bob:</span> <span class="gc-message-sms-text">hi &lt;3</span> <span class="gc-message-sms-time">3:04 PM</span>',
+	'<span class="gc-message-sms-from">Me:</span> <span class="gc-message-sms-text">yo</span> <span class="gc-message-sms-time">3:05 PM</span>',
+]
+
+_EXTRA_ANCHOR = '<a class="gc-under" href="javascript:void(0)">Reply</a>'
+
+
+def _generate_blocks(extraLines, count, seed):
+	rand = random.Random(seed)
+	blocks = []
+	for i in xrange(count):
+		lines = list(_FIELD_LINES)
+		rand.shuffle(lines)
+		lines.extend(extraLines)
+		for anchor in xrange(rand.randint(0, 2)):
+			lines.insert(rand.randint(0, len(lines)), _EXTRA_ANCHOR)
+		blocks.append('<div id="m%d" class="goog-flat-button gc-message gc-message-unread">\n%s\n</div>' % (
+			i, "\n".join(lines),
+		))
+	return "\n".join(blocks)
+
+
+def setup():
+	logging.getLogger(gvoice.__name__).setLevel(logging.CRITICAL)
+
+
+def test_history_matches_baseline():
+	setup()
+	html = _generate_blocks([], 300, 1)
+	backend = gvoice.GVoiceBackend()
+	actual = list(backend._parse_history(html))
+	expected = list(_baseline_history(html))
+	assert len(expected) == 300
+	assert actual == expected
+
+
+def test_voicemail_matches_baseline():
+	setup()
+	html = _generate_blocks(_VOICEMAIL_LINES, 300, 2)
+	backend = gvoice.GVoiceBackend()
+	actual = [
+		(
+			conv.id,
+			_conversation_fields(conv),
+			[_text_summary(text) for text in conv.messages[0].body],
+		)
+		for conv in backend._parse_voicemail(html)
+	]
+	expected = list(_baseline_voicemail(html))
+	assert len(expected) == 300
+	assert actual == expected
+
+
+def test_sms_matches_baseline():
+	setup()
+	html = _generate_blocks(_SMS_LINES, 300, 3)
+	backend = gvoice.GVoiceBackend()
+	actual = [
+		(
+			conv.id,
+			_conversation_fields(conv),
+			[
+				(message.whoFrom, message.body[0].text, message.when)
+				for message in conv.messages
+			],
+		)
+		for conv in backend._parse_sms(html)
+	]
+	expected = list(_baseline_sms(html))
+	assert len(expected) == 300
+	assert actual == expected
+
+
+def test_name_link_does_not_hide_fields():
+	setup()
+	html = "\n".join([
+		'<div id="m1" class="gc-message">',
+		'<a class="gc-under" href="javascript:void(0)">Reply</a>',
+		'<span class="gc-message-time">10/15/11 3:04 PM</span>',
+		'<span class="gc-message-location"><a class="gc-under" href="javascript:void(0)">Springfield, IL</a></span>',
+		'<a class="gc-under gc-message-name-link" href="javascript:void(0)">Bob</a>',
+		'<span class="gc-message-type">(555) 123-4567 - mobile</span>',
+		'</div>',
+	])
+	(event, ) = gvoice.GVoiceBackend()._parse_history(html)
+	assert event["name"] == "Bob"
+	assert event["location"] == "Springfield, IL"
+	assert event["time"].year == 2011
+	# As with the old search, whichever span follows the name is the contact id
+	assert event["contactId"] == "(555) 123-4567 - mobile"
+	assert event["prettyNumber"] == "(555) 123-4567 - mobile"
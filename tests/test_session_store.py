@@ -0,0 +1,96 @@
+from __future__ import with_statement
+
+import os
+import shutil
+import datetime
+import tempfile
+
+import test_utils
+
+import sys
+sys.path.append("../src")
+
+import session_store
+
+
+class CountingPickle(object):
+
+	def __init__(self, pickle):
+		self._pickle = pickle
+		self.dumped = []
+		self.HIGHEST_PROTOCOL = pickle.HIGHEST_PROTOCOL
+
+	def dumps(self, obj, protocol):
+		if isinstance(obj, dict) and "id" in obj:
+			self.dumped.append(obj["id"])
+		return self._pickle.dumps(obj, protocol)
+
+	def loads(self, data):
+		return self._pickle.loads(data)
+
+
+class TempStore(object):
+
+	def __init__(self):
+		self.root = tempfile.mkdtemp()
+		self.path = os.path.join(self.root, "user.cache.db")
+		self._realPickle = session_store.pickle
+		self.pickle = CountingPickle(self._realPickle)
+		session_store.pickle = self.pickle
+
+	def open_store(self):
+		store = session_store.SessionStore(self.path)
+		store.open()
+		return store
+
+	def close(self):
+		session_store.pickle = self._realPickle
+		shutil.rmtree(self.root, True)
+
+
+def _row(rowId, text):
+	return {"id": rowId, "time": datetime.datetime(2011, 10, 15, 12, 0), "text": text}
+
+
+def test_only_dirty_rows_are_pickled():
+	temp = TempStore()
+	try:
+		store = temp.open_store()
+		messages = [_row("a", "hi"), _row("b", "yo")]
+		assert store.save({}, messages, []) == (2, 0)
+
+		del temp.pickle.dumped[:]
+		assert store.save({}, messages, []) == (0, 0)
+		assert temp.pickle.dumped == []
+
+		# Updated in place, so only the caller knows
+		messages[0]["text"] = "hey"
+		assert store.save({}, messages, []) == (0, 0)
+		assert store.save({}, messages, [], frozenset(["a"])) == (1, 0)
+		assert temp.pickle.dumped == ["a"]
+
+		del temp.pickle.dumped[:]
+		# Refetched rows are new but equal
+		assert store.save({}, [_row("a", "hey"), _row("c", "sup")], []) == (1, 1)
+		assert temp.pickle.dumped == ["c"]
+		store.close()
+	finally:
+		temp.close()
+
+
+def test_loaded_rows_are_not_pickled_again():
+	temp = TempStore()
+	try:
+		store = temp.open_store()
+		store.save({}, [_row("a", "hi")], [])
+		store.close()
+
+		store = temp.open_store()
+		messages = store.load(store.MESSAGES)
+		assert [row["text"] for row in messages] == ["hi"]
+		del temp.pickle.dumped[:]
+		assert store.save({}, messages, []) == (0, 0)
+		assert temp.pickle.dumped == []
+		store.close()
+	finally:
+		temp.close()
@@ -0,0 +1,116 @@
+from __future__ import with_statement
+
+import datetime
+
+import test_utils
+
+import sys
+sys.path.append("../src")
+
+import time_categories
+
+
+class StubModel(object):
+
+	def __init__(self):
+		self.sections = []
+		self.updatedSections = []
+
+	def set_sections(self, sections):
+		self.sections = [[name, items] for (name, items) in sections]
+		self.updatedSections.append(None)
+
+	def set_section_items(self, sectionRow, items):
+		self.sections[sectionRow][1] = items
+		self.updatedSections.append(sectionRow)
+
+	def set_section_name(self, sectionRow, name):
+		self.sections[sectionRow][0] = name
+
+
+_TODAY = datetime.datetime(2011, 10, 15, 12, 0)
+
+
+def _item(itemId, age, isRead = False):
+	return {"id": itemId, "time": _TODAY - age, "isRead": isRead}
+
+
+def _setup():
+	model = StubModel()
+	categories = time_categories.TimeCategories(model)
+	filterCalls = []
+
+	def is_unread(item):
+		filterCalls.append(item["id"])
+		return not item["isRead"]
+
+	categories.set_filter("unread", is_unread)
+	return model, categories, filterCalls
+
+
+def test_new_item_leaves_older_sections_alone():
+	model, categories, filterCalls = _setup()
+	old = [
+		_item("today", datetime.timedelta(hours=3)),
+		_item("week", datetime.timedelta(days=2)),
+		_item("past", datetime.timedelta(days=60)),
+	]
+	categories.update(_TODAY, old)
+	pastRows = model.sections[4][1]
+	assert [item["id"] for item in pastRows] == ["past"]
+
+	del filterCalls[:]
+	del model.updatedSections[:]
+	categories.update(_TODAY, [_item("now", datetime.timedelta(minutes=5))] + old)
+	assert filterCalls == ["now"]
+	assert model.updatedSections == [0]
+	assert model.sections[4][1] is pastRows
+
+
+def test_changed_item_is_filtered_again():
+	model, categories, filterCalls = _setup()
+	items = [
+		_item("today", datetime.timedelta(hours=3)),
+		_item("past", datetime.timedelta(days=60)),
+	]
+	categories.update(_TODAY, items)
+	assert [item["id"] for item in model.sections[1][1]] == ["today"]
+
+	items[0]["isRead"] = True
+	del filterCalls[:]
+	del model.updatedSections[:]
+	categories.update(_TODAY, list(items), frozenset(["today"]))
+	assert filterCalls == ["today"]
+	assert model.updatedSections == [1]
+	assert model.sections[1][1] == []
+
+
+def test_new_day_renames_sections():
+	model, categories, filterCalls = _setup()
+	items = [_item("past", datetime.timedelta(days=60))]
+	categories.update(_TODAY, items)
+	todayName = model.sections[1][0]
+
+	del model.updatedSections[:]
+	categories.update(_TODAY + datetime.timedelta(days=1), items)
+	assert model.sections[1][0] != todayName
+	assert model.updatedSections == []
+
+
+def test_unchanged_items_move_sections_as_time_passes():
+	model, categories, filterCalls = _setup()
+	items = [
+		_item("now", datetime.timedelta(minutes=5)),
+		_item("past", datetime.timedelta(days=60)),
+	]
+	categories.update(_TODAY, items)
+	pastRows = model.sections[4][1]
+
+	del filterCalls[:]
+	del model.updatedSections[:]
+	categories.update(_TODAY + datetime.timedelta(hours=2), items)
+	assert model.sections[0][1] == []
+	assert [item["id"] for item in model.sections[1][1]] == ["now"]
+	assert model.updatedSections == [0, 1]
+	assert filterCalls == ["now"]
+	assert model.sections[4][1] is pastRows